@@ -6,13 +6,18 @@ from concurrent.futures.thread import ThreadPoolExecutor
 from cli.internal.apis.mason import MasonApi
 from cli.internal.utils.analytics import MasonAnalytics
 from cli.internal.utils.constants import AUTH
+from cli.internal.utils.constants import CUSTOMER_CACHE
 from cli.internal.utils.constants import ENDPOINTS
+from cli.internal.utils.constants import SETTINGS
 from cli.internal.utils.interactive import Interactivity
 from cli.internal.utils.remote import RequestHandler
 from cli.internal.utils.store import Store
 
 _manual_atexit_callbacks = []
 
+# ThreadPoolExecutor's own default since Python 3.8
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
 
 class Config(object):
     """
@@ -25,13 +30,31 @@ class Config(object):
         logger: logging.Logger = None,
         auth_store: Store = AUTH,
         endpoints_store: Store = ENDPOINTS,
+        settings_store: Store = SETTINGS,
+        customer_store: Store = CUSTOMER_CACHE,
         api: MasonApi = None,
         analytics: MasonAnalytics = None,
         interactivity: Interactivity = None,
-        executor: Executor = None
+        executor: Executor = None,
+        max_workers: int = None
     ):
+        """
+        :param executor: runs work in parallel, a thread pool of `max_workers` threads by default
+        :param max_workers: the number of threads of the executor, which connection pools are
+                            sized to. Unknown if an executor is passed without it.
+        """
+
+        # The executor is created first so the request handler can size its connection pools to it
+        if executor is None:
+            max_workers = max_workers or DEFAULT_MAX_WORKERS
+            executor = ThreadPoolExecutor(max_workers)
+        self.executor = executor
+        self.max_workers = max_workers
+
         logger = logger or logging.getLogger(__name__)
-        api = api or MasonApi(RequestHandler(self), auth_store, endpoints_store)
+        api = api or MasonApi(
+            RequestHandler(self, max_workers=max_workers), auth_store, endpoints_store,
+            settings_store, customer_store)
         analytics = analytics or MasonAnalytics(self)
         interactivity = interactivity or Interactivity()
 
@@ -42,10 +65,11 @@ class Config(object):
         self.logger = logger
         self.auth_store = auth_store
         self.endpoints_store = endpoints_store
+        self.settings_store = settings_store
+        self.customer_store = customer_store
         self.api = api
         self.analytics = analytics
         self.interactivity = interactivity
-        self.executor = executor or ThreadPoolExecutor()
 
 
 def register_manual_atexit_callback(func, *args, **kwargs):
@@ -1,61 +1,171 @@
 import base64
+import copy
+import functools
+import hashlib
+import time
+import uuid
+from concurrent.futures import Future
 from threading import Lock
 
 from rfc3339 import parse_datetime
 
+from cli.internal.utils.constants import CUSTOMER_CACHE
+from cli.internal.utils.constants import SETTINGS
 from cli.internal.utils.hashing import hash_file
 from cli.internal.utils.remote import ApiError
 from cli.internal.utils.remote import build_url
+from cli.internal.utils.scheduling import timed_transfer
+
+# How long the customer an access token belongs to is remembered across invocations
+CUSTOMER_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def _forgets_customer_if_unauthorized(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        except ApiError as e:
+            if e.status_code == 401:
+                self._forget_customer()
+            raise e
+
+    return wrapper
+
+
+def _coalesced(func):
+    """
+    Shares reads between identical calls for the rest of the invocation: concurrent callers wait on
+    the same request, later ones reuse its result. Failures aren't remembered and every caller gets
+    its own copy of the result so they can't see each other's changes.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+
+        with self._reads_lock:
+            future = self._reads.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._reads[key] = future
+
+        if is_owner:
+            try:
+                future.set_result(func(self, *args, **kwargs))
+            except BaseException as e:
+                with self._reads_lock:
+                    if self._reads.get(key) is future:
+                        del self._reads[key]
+                future.set_exception(e)
+
+        return copy.deepcopy(future.result())
+
+    return wrapper
+
+
+def _invalidates_reads(func):
+    """
+    Forgets shared reads once a call changing what they would return is done, so it's seen by
+    later reads.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            with self._reads_lock:
+                self._reads.clear()
+
+    return wrapper
 
 
 class MasonApi:
-    def __init__(self, handler, auth_store, endpoints_store):
+    def __init__(
+        self,
+        handler,
+        auth_store,
+        endpoints_store,
+        settings_store=SETTINGS,
+        customer_store=CUSTOMER_CACHE
+    ):
         self.handler = handler
         self.auth_store = auth_store
         self.endpoints_store = endpoints_store
+        self.settings_store = settings_store
+        self.customer_store = customer_store
 
         self.lock = Lock()
         self._customer = None
+        self._reads_lock = Lock()
+        self._reads = {}
 
+    @_forgets_customer_if_unauthorized
+    @_coalesced
     def get_projects(self):
         customer = self._get_validated_customer()
         return self._get_projects(customer)
 
+    @_forgets_customer_if_unauthorized
+    @_invalidates_reads
     def upload_artifact(self, binary, artifact):
         customer = self._get_validated_customer()
         signed_url = self._get_signed_url(customer, binary, artifact)
         upload_url = signed_url['signed_request']
         download_url = signed_url['url']
 
-        self._upload_to_signed_url(upload_url, binary)
+        self._upload_to_signed_url(upload_url, binary, self._get_upload_mode(signed_url))
         return self._register_signed_url(customer, download_url, binary, artifact)
 
+    @_forgets_customer_if_unauthorized
+    @_invalidates_reads
     def deploy_artifact(self, type, name, version, group, push, no_https):
         customer = self._get_validated_customer()
         return self._deploy_artifact(customer, type, name, version, group, push, no_https)
 
+    @_forgets_customer_if_unauthorized
+    @_coalesced
     def get_artifact(self, type, name, version):
         customer = self._get_validated_customer()
         return self._get_artifact(customer, type, name, version)
 
-    def get_latest_artifact(self, name, type):
-        def sort(artifact):
+    @_forgets_customer_if_unauthorized
+    @_coalesced
+    def get_latest_artifact(self, name, type, fields=None):
+        """
+        :param fields: the fields of the artifact the caller needs. The artifact is fetched unless
+                       they're all part of the artifact's version list entry.
+        """
+
+        def key(artifact):
             return parse_datetime(artifact.get('createdAt')).timestamp()
 
         customer = self._get_validated_customer()
-        return self._find_artifact(customer, type, name, sort)
+        return self._find_artifact(customer, type, name, 'createdAt', key, fields)
 
-    def get_highest_artifact(self, type, name):
-        def sort(artifact):
+    @_forgets_customer_if_unauthorized
+    @_coalesced
+    def get_highest_artifact(self, type, name, fields=None):
+        """
+        :param fields: the fields of the artifact the caller needs. The artifact is fetched unless
+                       they're all part of the artifact's version list entry.
+        """
+
+        def key(artifact):
             return int(artifact.get('version'))
 
         customer = self._get_validated_customer()
-        return self._find_artifact(customer, type, name, sort)
+        return self._find_artifact(customer, type, name, 'version', key, fields)
 
+    @_forgets_customer_if_unauthorized
+    @_invalidates_reads
     def start_build(self, project, version, mason_version):
         customer = self._get_validated_customer()
         return self._start_build(customer, project, version, mason_version)
 
+    @_forgets_customer_if_unauthorized
     def get_build(self, id):
         customer = self._get_validated_customer()
         return self._get_build(customer, id)
@@ -84,16 +194,33 @@ class MasonApi:
 
         url_path = '/{0}/{1}/{2}?type={3}&noContentType=true'.format(
             customer, artifact.get_name(), artifact.get_version(), artifact.get_type())
+        upload_mode = self.settings_store['upload_mode']
+        if upload_mode and upload_mode != 'single':
+            url_path += '&uploadMode={}'.format(upload_mode)
         url = self._get_base_url('registry_signed_url') + url_path
         return self.handler.get(url, headers=headers)
 
-    def _upload_to_signed_url(self, signed_url, binary):
+    def _get_upload_mode(self, signed_url):
+        """
+        A URL is only signed for one HTTP verb and query, a single PUT by default. Resumable and
+        multipart uploads send other requests, so they're only used when the registry confirms it
+        signed the URL for them. Otherwise the file is uploaded with a single PUT.
+        """
+
+        upload_mode = self.settings_store['upload_mode']
+        if upload_mode in ('resumable', 'multipart') and \
+                signed_url.get('upload_mode') == upload_mode:
+            return upload_mode
+        return 'single'
+
+    def _upload_to_signed_url(self, signed_url, binary, upload_mode='single'):
         md5 = hash_file(binary, 'md5', False)
         headers = {
             'Content-MD5': base64.b64encode(md5).decode('utf-8')
         }
 
-        self.handler.put(signed_url, binary, headers=headers)
+        with timed_transfer():
+            self.handler.put(signed_url, binary, upload_mode=upload_mode, headers=headers)
 
     def _register_signed_url(self, customer, signed_url, binary, artifact):
         sha1 = hash_file(binary, 'sha1')
@@ -121,7 +248,9 @@ class MasonApi:
     def _deploy_artifact(self, customer, type, name, version, group, push, no_https):
         headers = {
             'Content-Type': 'application/json',
-            'Authorization': 'Bearer {}'.format(self.auth_store['id_token'])
+            'Authorization': 'Bearer {}'.format(self.auth_store['id_token']),
+            # Lets the request be retried without risking a duplicate deployment
+            'Idempotency-Key': str(uuid.uuid4())
         }
         payload = {
             'customer': customer,
@@ -146,7 +275,7 @@ class MasonApi:
             customer, type_, name, version)
         return self.handler.get(url, headers=headers)
 
-    def _find_artifact(self, customer, type_, name, sort):
+    def _find_artifact(self, customer, type_, name, sort_field, key, fields):
         headers = {
             'Content-Type': 'application/json',
             'Authorization': 'Bearer {}'.format(self.auth_store['id_token'])
@@ -154,15 +283,23 @@ class MasonApi:
 
         url = self._get_base_url('registry_artifact_url') + '/{}/{}/{}'.format(
             customer, type_, name)
+        if self.settings_store['registry_server_side_sorting']:
+            # Only the winner is downloaded. It's still picked below in case the server ignored
+            # the parameters.
+            url += '?sort=-{}&limit=1'.format(sort_field)
         result = self.handler.get(url, headers=headers)
 
         if not type(result) == list:
             return None
 
-        sorted_artifacts = sorted(result, key=sort, reverse=True)
-        for artifact in sorted_artifacts:
-            if artifact.get('name') == name and artifact.get('type') == type_:
-                return self._get_artifact(customer, type_, name, artifact.get('version'))
+        candidates = (a for a in result if a.get('name') == name and a.get('type') == type_)
+        artifact = max(candidates, key=key, default=None)
+        if not artifact:
+            return None
+
+        if fields and all(field in artifact for field in fields):
+            return artifact
+        return self._get_artifact(customer, type_, name, artifact.get('version'))
 
     def _start_build(self, customer, project, version, mason_version):
         headers = {
@@ -215,6 +352,11 @@ class MasonApi:
         if self._customer:
             return self._customer
 
+        customer = self._get_persisted_customer()
+        if customer:
+            self._customer = customer
+            return customer
+
         # Get the user info
         headers = {'Authorization': 'Bearer {}'.format(self.auth_store['access_token'])}
         user_info_data = self.handler.get(
@@ -227,8 +369,46 @@ class MasonApi:
         if not customer:
             raise ApiError('Could not retrieve customer information.')
         self._customer = customer
+        self._persist_customer(customer)
 
         return customer
 
+    def _get_persisted_customer(self):
+        persisted = self.customer_store['customer']
+        if not isinstance(persisted, dict):
+            return None
+
+        if persisted.get('token_hash') != self._get_access_token_hash():
+            return None
+        if persisted.get('expires_at', 0) <= time.time():
+            return None
+        return persisted.get('id')
+
+    def _persist_customer(self, customer):
+        token_hash = self._get_access_token_hash()
+        if not token_hash:
+            return
+
+        self.customer_store['customer'] = {
+            'id': customer,
+            'token_hash': token_hash,
+            'expires_at': int(time.time()) + CUSTOMER_CACHE_TTL_SECONDS
+        }
+        self.customer_store.try_save()
+
+    def _forget_customer(self):
+        with self.lock:
+            self._customer = None
+            if self.customer_store['customer']:
+                self.customer_store['customer'] = None
+                self.customer_store.try_save()
+
+    def _get_access_token_hash(self):
+        access_token = self.auth_store['access_token']
+        if not access_token:
+            return None
+
+        return hashlib.sha256(str(access_token).encode('utf-8')).hexdigest()
+
     def _get_base_url(self, name: str):
         return build_url(self.endpoints_store, name)
@@ -25,7 +25,9 @@ class CliInitCommand(Command):
         id_token: str,
         access_token: str,
         update_checker_cache: Store = UPDATE_CHECKER_CACHE,
-        time=time
+        time=time,
+        network_stats: bool = False,
+        network_stats_file: str = None
     ):
         super(CliInitCommand, self).__init__(config)
 
@@ -37,6 +39,8 @@ class CliInitCommand(Command):
         self.access_token = access_token
         self.update_checker_cache = update_checker_cache
         self.time = time
+        self.network_stats = network_stats
+        self.network_stats_file = network_stats_file
 
     @Command.helper('cli')
     def run(self):
@@ -45,6 +49,17 @@ class CliInitCommand(Command):
         update_check_future = self.config.executor.submit(self._check_for_updates)
         register_manual_atexit_callback(
             wait_for_futures, self.config.executor, [update_check_future])
+        register_manual_atexit_callback(self.config.api.handler.log_pool_stats)
+        if self.network_stats or self.network_stats_file:
+            register_manual_atexit_callback(self._report_network_stats)
+
+    def _report_network_stats(self):
+        metrics = self.config.api.handler.metrics
+
+        if self.network_stats:
+            self.config.logger.info(metrics.format_table())
+        if self.network_stats_file:
+            metrics.write_json(self.network_stats_file)
 
     def _update_logging(self):
         if self.no_color:
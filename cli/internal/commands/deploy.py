@@ -81,7 +81,8 @@ class DeployConfigCommand(DeployCommand):
         if self.version != 'latest':
             return
 
-        latest_config = self.config.api.get_latest_artifact(self.name, 'config')
+        latest_config = self.config.api.get_latest_artifact(
+            self.name, 'config', fields=('version',))
         if latest_config:
             self.version = latest_config.get('version')
         else:
@@ -102,7 +103,7 @@ class DeployApkCommand(DeployCommand):
         if self.version != 'latest':
             return
 
-        latest_apk = self.config.api.get_latest_artifact(self.name, 'apk')
+        latest_apk = self.config.api.get_latest_artifact(self.name, 'apk', fields=('version',))
         if latest_apk:
             self.version = latest_apk.get('version')
         else:
@@ -1,5 +1,6 @@
 import abc
 import copy
+import functools
 import os
 import tempfile
 from abc import abstractmethod
@@ -8,7 +9,6 @@ from threading import Lock
 import click
 import six
 import yaml
-from tqdm import tqdm
 
 from cli.config import Config
 from cli.internal.commands.command import Command
@@ -18,14 +18,26 @@ from cli.internal.models.media import Media
 from cli.internal.models.os_config import OSConfig
 from cli.internal.utils.hashing import hash_file
 from cli.internal.utils.io import wait_for_futures
+from cli.internal.utils.progress import TransferProgress
+from cli.internal.utils.progress import UPLOAD_PROGRESS
 from cli.internal.utils.remote import ApiError
+from cli.internal.utils.scheduling import UPLOAD_SCHEDULER
+from cli.internal.utils.scheduling import UploadScheduler
+from cli.internal.utils.scheduling import get_current_upload
 from cli.internal.utils.validation import validate_credentials
 
 
 @six.add_metaclass(abc.ABCMeta)
 class RegisterCommand(Command):
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        upload_scheduler: UploadScheduler = UPLOAD_SCHEDULER,
+        upload_progress: TransferProgress = UPLOAD_PROGRESS
+    ):
         super(RegisterCommand, self).__init__(config)
+        self.upload_scheduler = upload_scheduler
+        self.upload_progress = upload_progress
 
         validate_credentials(config)
 
@@ -61,7 +73,7 @@ class RegisterCommand(Command):
 
     def register_artifact(self, binary, artifact: IArtifact):
         if getattr(artifact, 'already_registered', None):
-            with tqdm.external_write_mode(nolock=True):
+            with self.upload_progress.external_write_mode():
                 self.config.logger.info("{} '{}' already registered, ignoring.".format(
                     artifact.get_pretty_type(), artifact.get_name()))
             return
@@ -77,9 +89,13 @@ class RegisterCommand(Command):
             else:
                 raise e
 
-        with tqdm.external_write_mode(nolock=True):
+        upload = get_current_upload()
+        with self.upload_progress.external_write_mode():
             self.config.logger.info("{} '{}' registered.".format(
                 artifact.get_pretty_type(), artifact.get_name()))
+            if upload:
+                self.config.logger.debug('{} queued for {:.2f}s, uploaded in {:.2f}s.'.format(
+                    binary, upload.get_queue_time(), upload.get_transfer_time()))
 
 
 class RegisterConfigCommand(RegisterCommand):
@@ -107,8 +123,9 @@ class RegisterConfigCommand(RegisterCommand):
     def register(self, configs):
         register_ops = []
 
-        for config in configs:
-            register_ops.append(self.config.executor.submit(
+        for config in self.upload_scheduler.order(configs):
+            register_ops.append(self.upload_scheduler.submit(
+                self.config.executor, config.binary,
                 self.register_artifact, config.binary, config))
 
         wait_for_futures(self.config.executor, register_ops)
@@ -143,7 +160,8 @@ class RegisterConfigCommand(RegisterCommand):
         if config.get_version() != 'latest':
             return
 
-        latest_config = self.config.api.get_highest_artifact('config', config.get_name())
+        latest_config = self.config.api.get_highest_artifact(
+            'config', config.get_name(), fields=('version',))
         with lock:
             if latest_config:
                 raw_config['os']['version'] = int(latest_config.get('version')) + 1
@@ -152,7 +170,8 @@ class RegisterConfigCommand(RegisterCommand):
 
     def _maybe_inject_app_version(self, lock: Lock, app: dict):
         if app and app.get('version_code') == 'latest':
-            latest_apk = self.config.api.get_latest_artifact(app.get('package_name'), 'apk')
+            latest_apk = self.config.api.get_latest_artifact(
+                app.get('package_name'), 'apk', fields=('version',))
             if latest_apk:
                 with lock:
                     app['version_code'] = int(latest_apk.get('version'))
@@ -168,7 +187,8 @@ class RegisterConfigCommand(RegisterCommand):
         if media_dict.get('version') != 'latest':
             return
 
-        latest_media = self.config.api.get_latest_artifact(media_dict.get('name'), 'media')
+        latest_media = self.config.api.get_latest_artifact(
+            media_dict.get('name'), 'media', fields=('version',))
         if latest_media:
             with lock:
                 media_dict['version'] = int(latest_media.get('version'))
@@ -224,9 +244,9 @@ class RegisterApkCommand(RegisterCommand):
     def start_register_ops(self, apks):
         register_ops = []
 
-        for apk in apks:
-            register_ops.append(self.config.executor.submit(
-                self.register_artifact, apk.binary, apk))
+        for apk in self.upload_scheduler.order(apks):
+            register_ops.append(self.upload_scheduler.submit(
+                self.config.executor, apk.binary, self.register_artifact, apk.binary, apk))
 
         return register_ops
 
@@ -293,7 +313,8 @@ class RegisterMediaCommand(RegisterCommand):
         if self.version != 'latest':
             return
 
-        latest_media = self.config.api.get_highest_artifact('media', self.name)
+        latest_media = self.config.api.get_highest_artifact(
+            'media', self.name, fields=('version', 'checksum'))
         if latest_media:
             is_in_project_mode = getattr(self.config, 'project_mode', None)
             checksum = latest_media.get('checksum') or {}
@@ -375,9 +396,18 @@ class RegisterProjectCommand(RegisterCommand):
         configs: list,
         register: RegisterConfigCommand
     ):
-        register_ops = apk_registration.start_register_ops(apks)
+        uploads = []
+        for apk in apks:
+            uploads.append((apk, functools.partial(
+                apk_registration.register_artifact, apk.binary, apk)))
         for num, media in enumerate(media_registrations):
-            register_ops.append(self.config.executor.submit(media.register, media_artifacts[num]))
+            uploads.append((media_artifacts[num], functools.partial(
+                media.register, media_artifacts[num])))
+
+        register_ops = []
+        for (artifact, upload) in self.upload_scheduler.order(uploads, lambda item: item[0].binary):
+            register_ops.append(self.upload_scheduler.submit(
+                self.config.executor, artifact.binary, upload))
 
         wait_for_futures(self.config.executor, register_ops)
 
@@ -23,7 +23,7 @@ class Apk(IArtifact):
 
     @staticmethod
     def parse(config, apk):
-        parsed = Apk(config, apk, APK(apk))
+        parsed = Apk(config, apk, APK(apk, light_analysis=True))
         parsed.validate()
         return parsed
 
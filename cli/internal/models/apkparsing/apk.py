@@ -3,6 +3,7 @@ import hashlib
 import io
 import logging
 import re
+import struct
 import warnings
 import zipfile
 from struct import unpack
@@ -11,7 +12,11 @@ from asn1crypto import cms
 from asn1crypto import keys
 from asn1crypto import x509
 
+from cli.internal.models.apkparsing.axml import ARSCParser
+from cli.internal.models.apkparsing.axml import ARSCResourceIndex
+from cli.internal.models.apkparsing.axml import AXMLAttributeScanner
 from cli.internal.models.apkparsing.axml import AXMLPrinter
+from cli.internal.models.apkparsing.axml import ResParserError
 from cli.internal.models.apkparsing.util import get_certificate_name_string
 from cli.internal.models.apkparsing.util import read
 
@@ -20,6 +25,9 @@ NS_ANDROID = '{{{}}}'.format(NS_ANDROID_URI)  # Namespace as used by etree
 
 log = logging.getLogger("androguard.apk")
 
+# What a corrupted resources.arsc can raise while it is indexed or a value is decoded
+_RESOURCE_PARSE_ERRORS = (ResParserError, struct.error, IndexError, AttributeError, ValueError)
+
 
 class Error(Exception):
     """Base class for exceptions in this module."""
@@ -34,6 +42,151 @@ class BrokenAPKError(Error):
     pass
 
 
+class ZipLayout:
+    """
+    Locations of the central directory and end of central directory records of a zip file.
+
+    See https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT sections 4.3.14 to 4.3.16
+    """
+
+    _END_OF_CENTRAL_DIR = b"\x50\x4b\x05\x06"
+    _END_OF_CENTRAL_DIR_SIZE = 22
+    _ZIP64_END_OF_CENTRAL_DIR = b"\x50\x4b\x06\x06"
+    _ZIP64_END_OF_CENTRAL_DIR_SIZE = 56
+    _ZIP64_LOCATOR = b"\x50\x4b\x06\x07"
+    _ZIP64_LOCATOR_SIZE = 20
+    # The end of central directory is followed by a comment of at most this many bytes
+    _MAX_COMMENT_SIZE = 0xFFFF
+
+    def __init__(
+        self,
+        end_of_central_dir_offset,
+        central_dir_offset,
+        central_dir_size,
+        entry_count,
+        comment=b"",
+        zip64_end_of_central_dir_offset=None
+    ):
+        self.end_of_central_dir_offset = end_of_central_dir_offset
+        self.central_dir_offset = central_dir_offset
+        self.central_dir_size = central_dir_size
+        self.entry_count = entry_count
+        self.comment = comment
+        self.zip64_end_of_central_dir_offset = zip64_end_of_central_dir_offset
+
+    def is_zip64(self):
+        return self.zip64_end_of_central_dir_offset is not None
+
+    @classmethod
+    def read(cls, f):
+        """
+        Locate the end of central directory with a single read of the end of the file and follow
+        the ZIP64 end of central directory locator, if any.
+
+        :param f: a seekable binary file object
+        :returns: a :class:`ZipLayout` or None if no end of central directory was found
+        """
+        file_size = f.seek(0, io.SEEK_END)
+        window = min(
+            file_size,
+            cls._ZIP64_LOCATOR_SIZE + cls._END_OF_CENTRAL_DIR_SIZE + cls._MAX_COMMENT_SIZE)
+        f.seek(file_size - window)
+        tail = f.read(window)
+
+        index = cls._find_end_of_central_dir(tail)
+        if index is None:
+            return None
+
+        _, this_disk, disk_central, _, entry_count, size_central, offset_central, comment_size = \
+            unpack('<4sHHHHIIH', tail[index:index + cls._END_OF_CENTRAL_DIR_SIZE])
+        comment_start = index + cls._END_OF_CENTRAL_DIR_SIZE
+        comment = tail[comment_start:comment_start + comment_size]
+
+        # These things should not happen for APKs
+        if this_disk != 0 or disk_central != 0:
+            raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
+
+        locator = index - cls._ZIP64_LOCATOR_SIZE
+        if locator < 0 or tail[locator:locator + 4] != cls._ZIP64_LOCATOR:
+            return cls(file_size - window + index, offset_central, size_central, entry_count,
+                       comment)
+
+        _, zip64_disk, zip64_offset, _ = unpack('<4sIQI', tail[locator:index])
+        if zip64_disk != 0:
+            raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
+
+        f.seek(zip64_offset)
+        record = f.read(cls._ZIP64_END_OF_CENTRAL_DIR_SIZE)
+        if len(record) != cls._ZIP64_END_OF_CENTRAL_DIR_SIZE or \
+                record[:4] != cls._ZIP64_END_OF_CENTRAL_DIR:
+            raise BrokenAPKError("No ZIP64 End of Central Dir at specified offset")
+
+        _, _, _, _, this_disk, disk_central, _, entry_count, size_central, offset_central = \
+            unpack('<4sQHHIIQQQQ', record)
+        if this_disk != 0 or disk_central != 0:
+            raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
+
+        return cls(file_size - window + index, offset_central, size_central, entry_count, comment,
+                   zip64_offset)
+
+    @classmethod
+    def _find_end_of_central_dir(cls, tail):
+        """
+        :returns: the index in tail of the last signature whose comment ends the file, or of the
+                  last signature with room for a whole record after it if there's data appended
+                  to the zip file
+        """
+        candidate = None
+        end = len(tail) - cls._END_OF_CENTRAL_DIR_SIZE + 4
+        while True:
+            index = tail.rfind(cls._END_OF_CENTRAL_DIR, 0, end)
+            if index < 0:
+                return candidate
+
+            comment_size, = unpack('<H', tail[index + 20:index + 22])
+            if index + cls._END_OF_CENTRAL_DIR_SIZE + comment_size == len(tail):
+                return index
+            if candidate is None:
+                candidate = index
+            end = index + 3
+
+
+class ZipEntryIndex:
+    """
+    Names of the entries of a zip file, indexed so that looking them up doesn't scan them all.
+    The set of names and the names under each prefix are only indexed once they're first needed.
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self._name_set = None
+        self._names_by_prefix = {}
+
+    def __contains__(self, name):
+        if self._name_set is None:
+            self._name_set = frozenset(self.names)
+        return name in self._name_set
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_names(self, prefix=""):
+        """
+        Return the names starting with the prefix, in the order of the central directory
+
+        :rtype: a list of :class:`str`
+        """
+        if not prefix:
+            return list(self.names)
+
+        names = self._names_by_prefix.get(prefix)
+        if names is None:
+            size = len(prefix)
+            names = self._names_by_prefix[prefix] = [
+                name for name in self.names if name[:size] == prefix]
+        return list(names)
+
+
 def _dump_additional_attributes(additional_attributes):
     """ try to parse additional attributes, but ends up to hexdump if the scheme is unknown """
 
@@ -182,7 +335,6 @@ class APKV3Signer(APKV2Signer):
 # noinspection PyPep8Naming
 class APK:
     # Constants in ZipFile
-    _PK_END_OF_CENTRAL_DIR = b"\x50\x4b\x05\x06"
     _PK_CENTRAL_DIR = b"\x50\x4b\x01\x02"
 
     # Constants in the APK Signature Block
@@ -203,9 +355,20 @@ class APK:
         0x0301: "DSA with SHA2-256 digest",
     }
 
+    # Tags of the AndroidManifest.xml read by the light analysis
+    _LIGHT_ANALYSIS_TAGS = ("manifest", "uses-sdk")
+
     __no_magic = False
 
-    def __init__(self, filename, raw=False, magic_file=None, skip_analysis=False, testzip=False):
+    def __init__(
+        self,
+        filename,
+        raw=False,
+        magic_file=None,
+        skip_analysis=False,
+        testzip=False,
+        light_analysis=False
+    ):
         """
         This class can access to all elements in an APK file
 
@@ -219,12 +382,14 @@ class APK:
         :param magic_file: specify the magic file (not used anymore - legacy only)
         :param skip_analysis: Skip the analysis, e.g. no manifest files are read. (default: False)
         :param testzip: Test the APK for integrity, e.g. if the ZIP file is broken. Throw an exception on failure (default False)
+        :param light_analysis: Only read the package name, versions and SDK versions from the manifest. (default: False)
 
         :type filename: string
         :type raw: boolean
         :type magic_file: string
         :type skip_analysis: boolean
         :type testzip: boolean
+        :type light_analysis: boolean
 
         """
         if magic_file:
@@ -236,6 +401,7 @@ class APK:
         self.xml = {}
         self.axml = {}
         self.arsc = {}
+        self._manifest_attributes = {}
 
         self.package = ""
         self.androidversion = {}
@@ -249,6 +415,8 @@ class APK:
         self._v2_blocks = {}
         self._v2_signing_data = None
         self._v3_signing_data = None
+        self._zip_layout = None
+        self._entry_index = None
 
         self._files = {}
         self.files_crc32 = {}
@@ -284,7 +452,9 @@ class APK:
                 # Thus we do not do it, the user might find out by using other tools.
                 raise BrokenAPKError("The APK is probably broken: testzip returned an error.")
 
-        if not skip_analysis:
+        if light_analysis and not skip_analysis:
+            self._apk_light_analysis()
+        elif not skip_analysis:
             self._apk_analysis()
 
     @staticmethod
@@ -343,6 +513,49 @@ class APK:
                 self.valid_apk = True
                 log.info("APK file was successfully validated!")
 
+    def _apk_light_analysis(self):
+        """
+        Run a lightweight analysis on the APK file.
+
+        This method is called by __init__ instead of :meth:`_apk_analysis` if light_analysis is
+        True. It only reads the attributes of the <manifest> and <uses-sdk> tags of the
+        AndroidManifest.xml in a single pass, which stops as soon as both were found, without
+        building an XML tree. Any other information from the Manifest, such as permissions or
+        activities, is unavailable.
+        """
+        i = "AndroidManifest.xml"
+        log.info("Starting light analysis on {}".format(i))
+        try:
+            manifest_data = self.zip.read(i)
+        except KeyError:
+            log.warning("Missing AndroidManifest.xml. Is this an APK file?")
+            return
+
+        scanner = AXMLAttributeScanner(manifest_data, self._LIGHT_ANALYSIS_TAGS)
+
+        if not scanner.is_valid():
+            log.error("Error while parsing AndroidManifest.xml - is the file valid?")
+            return
+
+        if scanner.is_packed():
+            log.warning(
+                "XML Seems to be packed, operations on the AndroidManifest.xml might fail.")
+
+        if scanner.get_root_tag() is None:
+            return
+        if scanner.get_root_tag() != "manifest":
+            log.error(
+                "AndroidManifest.xml does not start with a <manifest> tag! Is this a valid APK?")
+            return
+
+        self._manifest_attributes = scanner.get_attributes()
+        self.package = self.get_attribute_value("manifest", "package")
+        self.androidversion["Code"] = self.get_attribute_value("manifest", "versionCode")
+        self.androidversion["Name"] = self.get_attribute_value("manifest", "versionName")
+
+        self.valid_apk = True
+        log.info("APK file was successfully validated!")
+
     def __getstate__(self):
         """
         Function for pickling APK Objects.
@@ -356,6 +569,8 @@ class APK:
         x = self.__dict__
         x['axml'] = str(x['axml'])
         x['xml'] = str(x['xml'])
+        # The resource index is rebuilt from the zip when needed
+        x['arsc'] = {}
         del x['zip']
 
         return x
@@ -426,11 +641,56 @@ class APK:
         """
         Return the android version name
 
-        This information is read from the AndroidManifest.xml
+        This information is read from the AndroidManifest.xml. If the version name is a
+        reference to a resource, it is resolved from the resources.arsc.
 
         :rtype: :class:`str`
         """
-        return self.androidversion["Name"]
+        name = self.androidversion["Name"]
+        if name and name.startswith("@"):
+            resolved = self.get_resolved_reference(name)
+            if resolved is not None:
+                name = self.androidversion["Name"] = resolved
+        return name
+
+    def get_resource_index(self):
+        """
+        Return the lazy index of the resources.arsc, which is only built once
+
+        :rtype: :class:`ARSCResourceIndex`, or None if the APK has no valid resources.arsc
+        """
+        i = "resources.arsc"
+        if i not in self.arsc:
+            self.arsc[i] = None
+            if i in self.get_entry_index():
+                try:
+                    self.arsc[i] = ARSCResourceIndex(self.zip.read(i))
+                except _RESOURCE_PARSE_ERRORS as e:
+                    log.warning("Failed to parse {}: {}".format(i, e))
+
+        return self.arsc[i]
+
+    def get_resolved_reference(self, value):
+        """
+        Resolve a reference to a resource, as found in the AndroidManifest.xml, e.g.
+        `@7F0E0001`. Only the referenced entries of the resources.arsc are decoded.
+
+        :param str value: the reference
+        :returns: the resource's value, or None if it could not be resolved
+        """
+        try:
+            res_id, _ = ARSCParser.parse_id(value)
+        except ValueError:
+            return None
+
+        resources = self.get_resource_index()
+        if resources is None:
+            return None
+        try:
+            return resources.get_resolved_value(res_id)
+        except _RESOURCE_PARSE_ERRORS as e:
+            log.warning("Failed to resolve {} from resources.arsc: {}".format(value, e))
+            return None
 
     def get_files(self):
         """
@@ -438,7 +698,18 @@ class APK:
 
         :rtype: a list of :class:`str`
         """
-        return self.zip.namelist()
+        return self.get_entry_index().get_names()
+
+    def get_entry_index(self):
+        """
+        Return the index of the file names inside the APK, which is only built once
+
+        :rtype: :class:`ZipEntryIndex`
+        """
+        if self._entry_index is None:
+            self._entry_index = ZipEntryIndex(self.zip.namelist())
+
+        return self._entry_index
 
     def get_raw(self):
         """
@@ -453,6 +724,28 @@ class APK:
             self.__raw = bytearray(read(self.filename))
             return self.__raw
 
+    def get_zip_layout(self):
+        """
+        Return where the central directory of the APK is, which is only located once
+
+        :rtype: :class:`ZipLayout` or None if the APK isn't a zip file
+        """
+        if self._zip_layout is None:
+            with self._open_raw() as f:
+                self._zip_layout = ZipLayout.read(f)
+
+        return self._zip_layout
+
+    def _open_raw(self):
+        """
+        Return a file object over the raw bytes of the APK, which reads the APK from disk unless it
+        was already loaded into memory
+        """
+
+        if self.__raw is not None:
+            return io.BytesIO(self.__raw)
+        return open(self.filename, 'rb')
+
     def get_file(self, filename):
         """
         Return the raw data of the specified filename
@@ -460,11 +753,11 @@ class APK:
 
         :rtype: bytes
         """
-        try:
-            return self.zip.read(filename)
-        except KeyError:
+        if filename not in self.get_entry_index():
             raise FileNotPresent(filename)
 
+        return self.zip.read(filename)
+
     def get_dex(self):
         """
         Return the raw data of the classes dex file
@@ -489,7 +782,7 @@ class APK:
         :rtype: a list of str
         """
         dexre = re.compile(r"classes(\d*).dex")
-        return filter(lambda x: dexre.match(x), self.get_files())
+        return filter(lambda x: dexre.match(x), self.get_entry_index().get_names("classes"))
 
     def get_all_dex(self):
         """
@@ -507,7 +800,8 @@ class APK:
         :returns: True if multiple dex found, otherwise False
         """
         dexre = re.compile(r"^classes(\d+)?.dex$")
-        return len([instance for instance in self.get_files() if dexre.search(instance)]) > 1
+        dex_names = self.get_entry_index().get_names("classes")
+        return len([instance for instance in dex_names if dexre.search(instance)]) > 1
 
     def get_elements(self, tag_name, attribute, with_namespace=True):
         """
@@ -618,6 +912,14 @@ class APK:
         :param bool format_value: specify if the value needs to be formatted with packagename
         """
 
+        # Only these attributes were read by the light analysis
+        attributes = self._manifest_attributes.get(tag_name)
+        if attributes is not None and not attribute_filter:
+            value = attributes.get(attribute) or attributes.get(self._ns(attribute))
+            if value is not None and format_value:
+                return self._format_value(value)
+            return value
+
         for value in self.get_all_attribute_value(
             tag_name, attribute, format_value, **attribute_filter):
             if value is not None:
@@ -1014,38 +1316,17 @@ class APK:
         # * There should be again the size_of_block
         # * Now we can read the Key-Values
         # * IDs with an unknown value should be ignored.
-        f = io.BytesIO(self.get_raw())
-
-        size_central = None
-        offset_central = None
-
-        # Go to the end
-        f.seek(-1, io.SEEK_END)
-        # we know the minimal length for the central dir is 16+4+2
-        f.seek(-20, io.SEEK_CUR)
-
-        while f.tell() > 0:
-            f.seek(-1, io.SEEK_CUR)
-            r, = unpack('<4s', f.read(4))
-            if r == self._PK_END_OF_CENTRAL_DIR:
-                # Read central dir
-                this_disk, disk_central, this_entries, total_entries, \
-                size_central, offset_central = unpack('<HHHHII', f.read(16))
-                # TODO according to the standard we need to check if the
-                # end of central directory is the last item in the zip file
-                # TODO We also need to check if the central dir is exactly
-                # before the end of central dir...
-
-                # These things should not happen for APKs
-                if this_disk != 0:
-                    raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
-                if disk_central != 0:
-                    raise BrokenAPKError("Not sure what to do with multi disk ZIP!")
-                break
-            f.seek(-4, io.SEEK_CUR)
-
-        if not offset_central:
+        #
+        # Only those few bytes at the end of the APK are read, the rest of it never has to be
+        # loaded into memory.
+        with self._open_raw() as f:
+            self._parse_v2_v3_signature(f)
+
+    def _parse_v2_v3_signature(self, f):
+        layout = self.get_zip_layout()
+        if not layout or not layout.central_dir_offset:
             return
+        offset_central = layout.central_dir_offset
 
         f.seek(offset_central)
         r, = unpack('<4s', f.read(4))
@@ -1401,10 +1682,11 @@ class APK:
         """
         signature_expr = re.compile(r"^(META-INF/)(.*)(\.RSA|\.EC|\.DSA)$")
         signatures = []
+        index = self.get_entry_index()
 
-        for i in self.get_files():
+        for i in index.get_names("META-INF/"):
             if signature_expr.search(i):
-                if "{}.SF".format(i.rsplit(".", 1)[0]) in self.get_files():
+                if "{}.SF".format(i.rsplit(".", 1)[0]) in index:
                     signatures.append(i)
                 else:
                     log.warning(
@@ -1434,7 +1716,7 @@ class APK:
         signature_expr = re.compile(r"^(META-INF/)(.*)(\.RSA|\.EC|\.DSA)$")
         signature_datas = []
 
-        for i in self.get_files():
+        for i in self.get_entry_index().get_names("META-INF/"):
             if signature_expr.search(i):
                 signature_datas.append(self.get_file(i))
 
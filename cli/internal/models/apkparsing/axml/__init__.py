@@ -11,6 +11,7 @@ from builtins import object
 from builtins import range
 from collections import defaultdict
 from struct import pack
+from struct import iter_unpack
 from struct import unpack
 from xml.sax.saxutils import escape
 
@@ -115,12 +116,22 @@ class BuffHandle(object):
     """
     BuffHandle is a wrapper around bytes.
     It gives the ability to jump in the byte stream, just like with BytesIO.
+
+    The bytes are not copied: reads return memoryviews into them, which callers
+    convert with `bytes()` if they need to keep or decode them.
     """
 
     def __init__(self, buff):
-        self.__buff = bytearray(buff)
+        self.__buff = self._view(buff)
         self.__idx = 0
 
+    @staticmethod
+    def _view(buff):
+        view = memoryview(buff)
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        return view
+
     def __getitem__(self, item):
         """
         Get the byte at the position `item`
@@ -185,17 +196,17 @@ class BuffHandle(object):
         Read a String with length `size` at the current offset
 
         :param int size: length of the string
-        :rtype: bytearray
+        :rtype: bytes
         """
         data = self.read(size)
-        return data
+        return bytes(data)
 
     def read_b(self, size):
         """
         Read bytes with length `size` without incrementing the current offset
 
         :param int size: length to read in bytes
-        :rtype: bytearray
+        :rtype: memoryview
         """
         return self.__buff[self.__idx:self.__idx + size]
 
@@ -212,7 +223,7 @@ class BuffHandle(object):
 
         :param int offset: offset to start reading
         :param int size: length of bytes to read
-        :rtype: bytearray
+        :rtype: memoryview
         """
         return self.__buff[offset:offset + size]
 
@@ -221,7 +232,7 @@ class BuffHandle(object):
         Read all bytes from the start of `off` until the end of the buffer
 
         :param int off: starting offset
-        :rtype: bytearray
+        :rtype: memoryview
         """
         if isinstance(off, SV):
             off = off.value
@@ -234,7 +245,7 @@ class BuffHandle(object):
         and increment the offset by `size`
 
         :param int size: length of bytes to read
-        :rtype: bytearray
+        :rtype: memoryview
         """
         if isinstance(size, SV):
             size = size.value
@@ -256,7 +267,7 @@ class BuffHandle(object):
         """
         Return the whole buffer
 
-        :rtype: bytearray
+        :rtype: memoryview
         """
         return self.__buff
 
@@ -264,9 +275,9 @@ class BuffHandle(object):
         """
         Overwrite the current buffer with the content of `buff`
 
-        :param bytearray buff: the new buffer
+        :param bytes buff: the new buffer
         """
-        self.__buff = buff
+        self.__buff = self._view(buff)
 
     def save(self, filename):
         """
@@ -336,13 +347,11 @@ class StringBlock(object):
 
         # Next, there is a list of string following.
         # This is only a list of offsets (4 byte each)
-        for i in range(self.stringCount):
-            self.m_stringOffsets.append(unpack('<I', buff.read(4))[0])
+        self.m_stringOffsets = self._read_uint32s(buff, self.stringCount)
 
         # And a list of styles
         # again, a list of offsets
-        for i in range(self.styleCount):
-            self.m_styleOffsets.append(unpack('<I', buff.read(4))[0])
+        self.m_styleOffsets = self._read_uint32s(buff, self.styleCount)
 
         # FIXME it is probably better to parse n strings and not calculate the size
         size = self.header.size - self.stringsOffset
@@ -363,8 +372,18 @@ class StringBlock(object):
             if (size % 4) != 0:
                 log.warning("Size of styles is not aligned by four bytes.")
 
-            for i in range(0, size // 4):
-                self.m_styles.append(unpack('<I', buff.read(4))[0])
+            self.m_styles = self._read_uint32s(buff, size // 4)
+
+    @staticmethod
+    def _read_uint32s(buff, count):
+        """
+        Read a table of `count` little endian unsigned 4 byte integers at once
+
+        :param buff: buffer positioned at the start of the table
+        :param count: number of integers in the table
+        :return: list of int
+        """
+        return list(unpack('<{}I'.format(count), buff.read(4 * count)))
 
     def __repr__(self):
         return "<StringPool #strings={}, #styles={}, UTF8={}>".format(self.stringCount,
@@ -478,7 +497,7 @@ class StringBlock(object):
         :param str_len: length of the decoded string
         :return: str
         """
-        string = data.decode(encoding, 'replace')
+        string = str(data, encoding, 'replace')
         if len(string) != str_len:
             log.warning("invalid decoded string length")
         return string
@@ -1128,6 +1147,105 @@ def format_value(_type, _data, lookup_string=lambda ix: "<string>"):
     return "<0x%X, type 0x%02X>" % (_data, _type)
 
 
+if sys.maxunicode == 0xFFFF:
+    # Fix for python 2.x, surrogate pairs does not match in regex
+    _XML_CHARRANGE = re.compile(
+        u'^([\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD]|[\uD800-\uDBFF][\uDC00-\uDFFF])*$')
+    # TODO: this regex is slightly wrong... surrogates are not matched as pairs.
+    _XML_REPLACEMENT = re.compile(
+        u'[^\u0020-\uDBFF\u0009\u000A\u000D\uE000-\uFFFD\uDC00-\uDFFF]')
+else:
+    _XML_CHARRANGE = re.compile(
+        u'^[\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\U00010000-\U0010FFFF]*$')
+    _XML_REPLACEMENT = re.compile(
+        u'[^\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\U00010000-\U0010FFFF]')
+
+
+def _get_attribute_value(axml, index):
+    """
+    Wrapper function for format_value
+    to resolve the actual value of an attribute in a tag
+    :param axml: the :class:`~AXMLParser` positioned on the tag
+    :param index: index of the current attribute
+    :return: formatted value
+    """
+    _type = axml.getAttributeValueType(index)
+    _data = axml.getAttributeValueData(index)
+
+    return format_value(_type, _data, lambda _: axml.getAttributeValue(index))
+
+
+def _fix_name(name):
+    """
+    Apply some fixes to element named and attribute names.
+    Try to get conform to:
+    > Like element names, attribute names are case-sensitive and must start with a letter or underscore.
+    > The rest of the name can contain letters, digits, hyphens, underscores, and periods.
+    See: https://msdn.microsoft.com/en-us/library/ms256152(v=vs.110).aspx
+
+    :param name: Name of the attribute
+    :return: a fixed version of the name and True if the name looks packed
+    """
+    packed = False
+    if not name[0].isalpha() and name[0] != "_":
+        log.warning("Invalid start for name '{}'".format(name))
+        packed = True
+        name = "_{}".format(name)
+    if name.startswith("android:"):
+        # Seems be a common thing...
+        # Actually this means that the Manifest is likely to be broken, as
+        # usually no namespace URI is set in this case.
+        log.warning(
+            "Name '{}' starts with 'android:' prefix! The Manifest seems to be broken? Removing prefix.".format(
+                name))
+        packed = True
+        name = name[len("android:"):]
+    if ":" in name:
+        # Print out an extra warning
+        log.warning("Name seems to contain a namespace prefix: '{}'".format(name))
+    if not re.match(r"^[a-zA-Z0-9._-]*$", name):
+        log.warning("Name '{}' contains invalid characters!".format(name))
+        packed = True
+        name = re.sub(r"[^a-zA-Z0-9._-]", "_", name)
+
+    return name, packed
+
+
+def _fix_value(value):
+    """
+    Return a cleaned version of a value
+    according to the specification:
+    > Char	   ::=   	#x9 | #xA | #xD | [#x20-#xD7FF] | [#xE000-#xFFFD] | [#x10000-#x10FFFF]
+
+    See https://www.w3.org/TR/xml/#charsets
+
+    :param value: a value to clean
+    :return: the cleaned value and True if the value looks packed
+    """
+    packed = False
+
+    # Reading string until \x00. This is the same as aapt does.
+    if "\x00" in value:
+        packed = True
+        log.warning("Null byte found in attribute value at position {}: "
+                    "Value(hex): '{}'".format(
+            value.find("\x00"),
+            binascii.hexlify(value.encode("utf-8"))))
+        value = value[:value.find("\x00")]
+
+    if not _XML_CHARRANGE.match(value):
+        log.warning("Invalid character in value found. Replacing with '_'.")
+        packed = True
+        value = _XML_REPLACEMENT.sub('_', value)
+    return value, packed
+
+
+def _print_namespace(uri):
+    if uri != "":
+        uri = "{{{}}}".format(uri)
+    return uri
+
+
 class AXMLPrinter:
     """
     Converter for AXML Files into a lxml ElementTree, which can easily be
@@ -1135,8 +1253,6 @@ class AXMLPrinter:
 
     A Reference Implementation can be found at http://androidxref.com/9.0.0_r3/xref/frameworks/base/tools/aapt/XMLNode.cpp
     """
-    __charrange = None
-    __replacement = None
 
     def __init__(self, raw_buff):
         self.axml = AXMLParser(raw_buff)
@@ -1252,95 +1368,106 @@ class AXMLPrinter:
         return self.packerwarning
 
     def _get_attribute_value(self, index):
+        return _get_attribute_value(self.axml, index)
+
+    def _fix_name(self, name):
+        name, packed = _fix_name(name)
+        self.packerwarning |= packed
+        return name
+
+    def _fix_value(self, value):
+        value, packed = _fix_value(value)
+        self.packerwarning |= packed
+        return value
+
+    def _print_namespace(self, uri):
+        return _print_namespace(uri)
+
+
+class AXMLAttributeScanner:
+    """
+    Reads the attributes of a few tags of an AXML file in a single pass over the
+    events of the :class:`~AXMLParser`, without building an ElementTree.
+    Parsing stops as soon as all tags were found, so the rest of the file is not
+    read and can't be checked for errors either.
+
+    Attribute names and values are fixed up the same way as in :class:`~AXMLPrinter`.
+    """
+
+    def __init__(self, raw_buff, tag_names):
         """
-        Wrapper function for format_value
-        to resolve the actual value of an attribute in a tag
-        :param index: index of the current attribute
-        :return: formatted value
+        :param raw_buff: the AXML file
+        :param tag_names: the names of the tags, without namespace, to read the
+                          attributes of. Only the first tag with each name is read.
         """
-        _type = self.axml.getAttributeValueType(index)
-        _data = self.axml.getAttributeValueData(index)
+        self.axml = AXMLParser(raw_buff)
+
+        self.root_tag = None
+        self.attributes = {}
+        self.packerwarning = False
+        remaining = set(tag_names)
 
-        return format_value(_type, _data, lambda _: self.axml.getAttributeValue(index))
+        while remaining and self.axml.is_valid():
+            _type = next(self.axml)
 
-    def _fix_name(self, name):
+            if _type == START_TAG:
+                name = self._fix_name(self.axml.name)
+                tag = "{}{}".format(_print_namespace(self.axml.namespace), name)
+                if self.root_tag is None:
+                    self.root_tag = tag
+
+                if tag in remaining:
+                    remaining.remove(tag)
+                    self.attributes[tag] = self._get_attributes()
+            if _type == END_DOCUMENT:
+                break
+
+    def is_valid(self):
         """
-        Apply some fixes to element named and attribute names.
-        Try to get conform to:
-        > Like element names, attribute names are case-sensitive and must start with a letter or underscore.
-        > The rest of the name can contain letters, digits, hyphens, underscores, and periods.
-        See: https://msdn.microsoft.com/en-us/library/ms256152(v=vs.110).aspx
-
-        :param name: Name of the attribute
-        :return: a fixed version of the name
-        """
-        if not name[0].isalpha() and name[0] != "_":
-            log.warning("Invalid start for name '{}'".format(name))
-            self.packerwarning = True
-            name = "_{}".format(name)
-        if name.startswith("android:"):
-            # Seems be a common thing...
-            # Actually this means that the Manifest is likely to be broken, as
-            # usually no namespace URI is set in this case.
-            log.warning(
-                "Name '{}' starts with 'android:' prefix! The Manifest seems to be broken? Removing prefix.".format(
-                    name))
-            self.packerwarning = True
-            name = name[len("android:"):]
-        if ":" in name:
-            # Print out an extra warning
-            log.warning("Name seems to contain a namespace prefix: '{}'".format(name))
-        if not re.match(r"^[a-zA-Z0-9._-]*$", name):
-            log.warning("Name '{}' contains invalid characters!".format(name))
-            self.packerwarning = True
-            name = re.sub(r"[^a-zA-Z0-9._-]", "_", name)
+        Return the state of the AXMLParser, see :meth:`AXMLPrinter.is_valid`
+        """
+        return self.axml.is_valid()
 
-        return name
+    def is_packed(self):
+        """
+        Returns True if the AXML is likely to be packed, see :meth:`AXMLPrinter.is_packed`
+        """
+        return self.packerwarning
 
-    def _fix_value(self, value):
+    def get_root_tag(self):
+        """
+        Return the name of the first tag, with its namespace as in ElementTree,
+        or None if there are no tags
         """
-        Return a cleaned version of a value
-        according to the specification:
-        > Char	   ::=   	#x9 | #xA | #xD | [#x20-#xD7FF] | [#xE000-#xFFFD] | [#x10000-#x10FFFF]
+        return self.root_tag
 
-        See https://www.w3.org/TR/xml/#charsets
+    def get_attributes(self):
+        """
+        Return the attributes of the tags which were found
 
-        :param value: a value to clean
-        :return: the cleaned value
+        :returns: a dict of tag name to a dict of attribute names, with their
+                  namespace as in ElementTree, to values
         """
-        if not self.__charrange or not self.__replacement:
-            if sys.maxunicode == 0xFFFF:
-                # Fix for python 2.x, surrogate pairs does not match in regex
-                self.__charrange = re.compile(
-                    u'^([\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD]|[\uD800-\uDBFF][\uDC00-\uDFFF])*$')
-                # TODO: this regex is slightly wrong... surrogates are not matched as pairs.
-                self.__replacement = re.compile(
-                    u'[^\u0020-\uDBFF\u0009\u000A\u000D\uE000-\uFFFD\uDC00-\uDFFF]')
-            else:
-                self.__charrange = re.compile(
-                    u'^[\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\U00010000-\U0010FFFF]*$')
-                self.__replacement = re.compile(
-                    u'[^\u0020-\uD7FF\u0009\u000A\u000D\uE000-\uFFFD\U00010000-\U0010FFFF]')
-
-        # Reading string until \x00. This is the same as aapt does.
-        if "\x00" in value:
-            self.packerwarning = True
-            log.warning("Null byte found in attribute value at position {}: "
-                        "Value(hex): '{}'".format(
-                value.find("\x00"),
-                binascii.hexlify(value.encode("utf-8"))))
-            value = value[:value.find("\x00")]
-
-        if not self.__charrange.match(value):
-            log.warning("Invalid character in value found. Replacing with '_'.")
-            self.packerwarning = True
-            value = self.__replacement.sub('_', value)
-        return value
+        return self.attributes
 
-    def _print_namespace(self, uri):
-        if uri != "":
-            uri = "{{{}}}".format(uri)
-        return uri
+    def _get_attributes(self):
+        attributes = {}
+        for i in range(self.axml.getAttributeCount()):
+            uri = _print_namespace(self.axml.getAttributeNamespace(i))
+            name = self._fix_name(self.axml.getAttributeName(i))
+            value = self._fix_value(_get_attribute_value(self.axml, i))
+            attributes["{}{}".format(uri, name)] = value
+        return attributes
+
+    def _fix_name(self, name):
+        name, packed = _fix_name(name)
+        self.packerwarning |= packed
+        return name
+
+    def _fix_value(self, value):
+        value, packed = _fix_value(value)
+        self.packerwarning |= packed
+        return value
 
 
 ACONFIGURATION_MCC = 0x0001
@@ -2269,6 +2396,179 @@ class ARSCParser(object):
                 return "@{}:{}/{}".format(package, resource, name)
 
 
+class ARSCResourceIndex(object):
+    """
+    Lazy reader for resource.arsc files
+
+    Unlike :class:`~ARSCParser`, which decodes every entry of every package up front,
+    only the chunk headers are read when the index is built. They're used to find the
+    packages and the offsets of their type chunks. An entry is only decoded when its
+    resource ID is resolved, so resolving the few references of a manifest is cheap
+    even for very large resource tables.
+    """
+
+    # If set, the entries of a `ResTable_type` are a sorted list of `ResTable_sparseTypeEntry`
+    # instead of an offset for every entry.
+    FLAG_SPARSE = 0x01
+
+    NO_ENTRY = 0xFFFFFFFF
+
+    def __init__(self, raw_buff):
+        """
+        :param bytes raw_buff: the raw bytes of the file
+        """
+        self.buff = BuffHandle(raw_buff)
+
+        if self.buff.size() < 8 or self.buff.size() > 0xFFFFFFFF:
+            raise ResParserError(
+                "Invalid file size {} for a resources.arsc file!".format(self.buff.size()))
+
+        self.stringpool_main = None
+        # Package ID to PackageContext
+        self.packages = {}
+        # (package ID, type ID) to the headers of the type chunks holding its entries
+        self.type_chunks = defaultdict(list)
+
+        self.header = ARSCHeader(self.buff, expected_type=RES_TABLE_TYPE)
+        if self.header.size > self.buff.size():
+            raise ResParserError(
+                "The file seems to be truncated. Refuse to parse the file! Filesize: {}, declared size: {}".format(
+                    self.buff.size(), self.header.size))
+
+        self.buff.set_idx(self.header.start + self.header.header_size)
+        while self.buff.get_idx() <= self.header.end - ARSCHeader.SIZE:
+            res_header = ARSCHeader(self.buff)
+            if res_header.end > self.header.end:
+                log.warning("Invalid chunk found! It is larger than the outer chunk: %s",
+                            res_header)
+                break
+
+            if res_header.type == RES_STRING_POOL_TYPE:
+                if self.stringpool_main:
+                    log.warning(
+                        "Already found a ResStringPool_header, but there should be only one! Will not parse the Pool again.")
+                else:
+                    self.stringpool_main = StringBlock(self.buff, res_header)
+            elif res_header.type == RES_TABLE_PACKAGE_TYPE:
+                self._index_package(res_header)
+
+            self.buff.set_idx(res_header.end)
+
+    def _index_package(self, res_header):
+        package = ARSCResTablePackage(self.buff, res_header)
+
+        self.buff.set_idx(res_header.start + package.typeStrings)
+        mTableStrings = StringBlock(
+            self.buff, ARSCHeader(self.buff, expected_type=RES_STRING_POOL_TYPE))
+        self.buff.set_idx(res_header.start + package.keyStrings)
+        mKeyStrings = StringBlock(
+            self.buff, ARSCHeader(self.buff, expected_type=RES_STRING_POOL_TYPE))
+
+        self.packages[package.id] = PackageContext(
+            package, self.stringpool_main, mTableStrings, mKeyStrings)
+
+        # Only the headers of the chunks are read, the string pools are skipped over
+        self.buff.set_idx(res_header.start + res_header.header_size)
+        while self.buff.get_idx() <= res_header.end - ARSCHeader.SIZE:
+            chunk_header = ARSCHeader(self.buff)
+            if chunk_header.end > res_header.end:
+                # we are way off the package chunk; bail out
+                break
+
+            if chunk_header.type == RES_TABLE_TYPE_TYPE:
+                type_id = self.buff[chunk_header.start + ARSCHeader.SIZE]
+                self.type_chunks[(package.id, type_id)].append(chunk_header)
+
+            self.buff.set_idx(chunk_header.end)
+
+    def get_packages_names(self):
+        """
+        Retrieve a list of all package names, which are available
+        in the given resources.arsc.
+        """
+        return [pc.get_package_name() for pc in self.packages.values()]
+
+    def get_res_configs(self, rid):
+        """
+        Return all the entries with the ID `rid`, decoding only those
+
+        :param int rid: the numerical ID of the resource
+        :return: a list of tuples of (ARSCResTableConfig, ARSCResTableEntry)
+        """
+        package_id = rid >> 24
+        type_id = (rid >> 16) & 0xff
+        entry_id = rid & 0xffff
+
+        pc = self.packages.get(package_id)
+        if pc is None:
+            return []
+
+        result = []
+        for chunk_header in self.type_chunks.get((package_id, type_id), ()):
+            self.buff.set_idx(chunk_header.start + ARSCHeader.SIZE)
+            a_res_type = ARSCResType(self.buff, pc)
+
+            offset = self._get_entry_offset(chunk_header, a_res_type, entry_id)
+            if offset is None:
+                continue
+
+            self.buff.set_idx(chunk_header.start + a_res_type.entriesStart + offset)
+            result.append((a_res_type.config, ARSCResTableEntry(self.buff, rid, pc)))
+        return result
+
+    def _get_entry_offset(self, chunk_header, a_res_type, entry_id):
+        """
+        :return: the offset of the entry relative to `entriesStart`, or None if the
+                 type chunk doesn't hold it
+        """
+        entries_offset = chunk_header.start + chunk_header.header_size
+
+        if a_res_type.flags & self.FLAG_SPARSE:
+            entries = self.buff.read_at(entries_offset, 4 * a_res_type.entryCount)
+            for (idx, offset) in iter_unpack('<HH', entries):
+                if idx == entry_id:
+                    return offset * 4
+            return None
+
+        if entry_id >= a_res_type.entryCount:
+            return None
+        offset, = unpack('<I', self.buff.read_at(entries_offset + 4 * entry_id, 4))
+        if offset == self.NO_ENTRY:
+            return None
+        return offset
+
+    def get_resolved_value(self, rid):
+        """
+        Return the formatted value of a resource, following references to other resources.
+
+        The value in the default configuration is preferred. If the resource has none,
+        the value of the first configuration is used, as in :meth:`ARSCParser.get_res_configs`.
+
+        :param int rid: the numerical ID of the resource
+        :return: the value, or None if the resource could not be found or is complex
+        """
+        seen = set()
+        while rid not in seen:
+            seen.add(rid)
+
+            configs = self.get_res_configs(rid)
+            if not configs:
+                log.warning(
+                    "The requested rid '0x{:08x}' could not be found in the list of resources.".format(
+                        rid))
+                return None
+
+            ate = next((ate for (config, ate) in configs if config.is_default()), configs[0][1])
+            if ate.is_complex():
+                return None
+            if not ate.key.is_reference():
+                return ate.key.format_value()
+            rid = ate.key.get_data()
+
+        log.warning("Infinite loop detected at resource 0x{:08x}!".format(rid))
+        return None
+
+
 class PackageContext(object):
     def __init__(self, current_package, stringpool_main, mTableStrings, mKeyStrings):
         """
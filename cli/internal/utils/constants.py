@@ -32,6 +32,45 @@ ENDPOINTS = Store('endpoints', {
     'latest_version_url': 'https://raw.githubusercontent.com/MasonAmerica/mason-cli/master/VERSION'
 })
 
+SETTINGS = Store('settings', {
+    # One of 'single' (one PUT to the signed URL), 'resumable' or 'multipart'. The last two are
+    # requested from the registry along with the signed URL and only used if it signs the URL for
+    # them, since a URL signed for a single PUT rejects their requests. Uploads fall back to
+    # 'single' otherwise.
+    'upload_mode': 'single',
+    'resumable_upload_attempts': 5,
+    'multipart_part_size': 16 * 1024 * 1024,
+    'multipart_concurrency': 4,
+    # One of 'smallest-first', 'largest-first' or 'fifo'
+    'upload_priority': 'smallest-first',
+    'upload_max_bytes_in_flight': 512 * 1024 * 1024,
+    # Idempotent requests failing with a transient error are retried with exponential backoff
+    'request_retry_attempts': 4,
+    'request_retry_backoff': 0.5,
+    'request_retry_max_delay': 30,
+    # The most retries a single invocation may spend across all requests
+    'request_retry_budget': 20,
+    # Registry lookups are cached on disk and revalidated with conditional requests
+    'response_cache_max_bytes': 16 * 1024 * 1024,
+    # Whether the registry can sort and limit artifact version lists itself
+    'registry_server_side_sorting': False
+})
+
+UPLOAD_JOURNAL = Store('upload-journal', {
+    'uploads': {}
+})
+
+# The customer the access token belongs to, see MasonApi._persist_customer. It's kept apart from
+# AUTH so saving it never writes credentials that were only passed for one invocation to disk.
+CUSTOMER_CACHE = Store('customer-cache', {
+    'customer': None
+})
+
+# Restored by DigestCache when a digest is first needed, most commands never hash a file.
+DIGEST_CACHE = Store('digest-cache', {
+    'files': {}
+}, restore=False)
+
 UPDATE_CHECKER_CACHE = Store('version-check-cache', {
     'last_update_check_timestamp': 0,
     'current_version': __version__,
@@ -1,4 +1,77 @@
+import atexit
 import hashlib
+import os
+from threading import Lock
+
+from cli.internal.utils.constants import DIGEST_CACHE
+from cli.internal.utils.store import Store
+
+# Every artifact upload needs both of these, so they're always computed together.
+ARTIFACT_HASH_TYPES = ('md5', 'sha1')
+# hashlib releases the GIL while digesting large buffers so big reads let hashing scale across
+# threads instead of bouncing the GIL around for every KB.
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+class DigestCache(object):
+    """
+    Remembers file digests across invocations. Entries are keyed by path and only trusted while the
+    file's inode, size and modification time are unchanged.
+
+    The store is only read when a digest is first needed and new digests are kept in memory until
+    `save` is called, once per invocation at exit.
+    """
+
+    def __init__(self, store: Store):
+        self.store = store
+        self.lock = Lock()
+        self._files = None
+        self._dirty = False
+
+    def get(self, filename):
+        identity = _file_identity(filename)
+        with self.lock:
+            entry = self._get_files().get(identity[0]) or {}
+            if entry.get('identity') != list(identity[1:]):
+                return identity, {}
+
+            return identity, {k: bytes.fromhex(v) for (k, v) in entry['digests'].items()}
+
+    def put(self, identity, digests: dict):
+        with self.lock:
+            files = self._get_files()
+            entry = files.get(identity[0]) or {}
+            if entry.get('identity') != list(identity[1:]):
+                entry = {'identity': list(identity[1:]), 'digests': {}}
+
+            entry['digests'].update({k: v.hex() for (k, v) in digests.items()})
+            files[identity[0]] = entry
+            self._dirty = True
+
+    def save(self):
+        with self.lock:
+            if self._dirty:
+                self.store.try_save()
+                self._dirty = False
+
+    def _get_files(self):
+        if self._files is None:
+            self.store.restore()
+
+            # Forget files that have since been deleted so the cache doesn't grow forever.
+            files = self.store['files'] or {}
+            self._files = {path: entry for (path, entry) in files.items() if os.path.exists(path)}
+            self.store['files'] = self._files
+
+        return self._files
+
+
+_cache = DigestCache(DIGEST_CACHE)
+
+
+@atexit.register
+def _save_cache():
+    _cache.save()
 
 
 def hash_file(filename, hash_type, as_hex=True):
@@ -10,19 +83,73 @@ def hash_file(filename, hash_type, as_hex=True):
     :return: The hash of the requested file
     """
 
-    h = getattr(hashlib, hash_type)()
-
-    with open(filename, 'rb') as file_to_hash:
-        # loop till the end of the file
-        chunk = 0
-        while chunk != b'':
-            # read only 1024 bytes at a time
-            chunk = file_to_hash.read(1024)
-            h.update(chunk)
+    digest = hash_file_digests(filename, (hash_type,))[hash_type]
 
     # return the hex representation of digest
     if as_hex:
-        return h.hexdigest()
+        return digest.hex()
     else:
         # return regular digest
-        return h.digest()
+        return digest
+
+
+def hash_file_digests(filename, hash_types=ARTIFACT_HASH_TYPES):
+    """
+    Hash a file with all requested algorithms in a single pass over its contents. Results are
+    cached on disk until the file changes so later callers don't have to read it again.
+    :param filename:
+    :param hash_types: names of hashlib algorithms, e.g. ('md5', 'sha1')
+    :return: A dict of hash type to raw digest
+    """
+
+    identity, known = _cache.get(filename)
+
+    missing = {hash_type for hash_type in hash_types if hash_type not in known}
+    if missing:
+        missing.update(t for t in ARTIFACT_HASH_TYPES if t not in known)
+        computed = _compute_digests(filename, missing)
+
+        _cache.put(identity, computed)
+        known.update(computed)
+
+    return {hash_type: known[hash_type] for hash_type in hash_types}
+
+
+def hash_file_range(filename, hash_type, offset, length):
+    """
+    Hash part of a file. Unlike whole files, ranges aren't cached.
+    :param filename:
+    :param hash_type: 'sha1' or 'md5'
+    :param offset: where the range starts
+    :param length: number of bytes in the range
+    :return: The raw digest of the requested range
+    """
+
+    return _compute_digests(filename, (hash_type,), offset, length)[hash_type]
+
+
+def _compute_digests(filename, hash_types, offset=0, length=None):
+    hashes = {hash_type: getattr(hashlib, hash_type)() for hash_type in hash_types}
+
+    buffer = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(filename, 'rb', buffering=0) as file_to_hash:
+        file_to_hash.seek(offset)
+        remaining = float('inf') if length is None else length
+
+        # loop till the end of the range, reusing the same buffer for every chunk
+        size = file_to_hash.readinto(view[:min(len(buffer), remaining)])
+        while size:
+            chunk = view[:size]
+            for h in hashes.values():
+                h.update(chunk)
+
+            remaining -= size
+            size = file_to_hash.readinto(view[:min(len(buffer), remaining)])
+
+    return {hash_type: h.digest() for (hash_type, h) in hashes.items()}
+
+
+def _file_identity(filename):
+    stat = os.stat(filename)
+    return os.path.realpath(filename), stat.st_ino, stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+import click
+
+from cli.internal.utils.constants import SETTINGS
+from cli.internal.utils.store import Store
+from cli.internal.utils.store import write_atomically
+
+
+class ResponseCache(object):
+    """
+    Keeps response bodies on disk along with their ETag and Last-Modified validators so they can
+    be revalidated with conditional requests instead of downloaded again. Each entry is its own
+    file whose modification time records when it was last used, and the least recently used
+    entries are evicted once the cache outgrows the `response_cache_max_bytes` setting.
+    """
+
+    def __init__(self, dir, settings_store: Store):
+        self.dir = dir
+        self.settings_store = settings_store
+
+    def get(self, url, headers: dict = None):
+        """
+        :return: the cached entry for a request as a dict with 'etag', 'last_modified' and 'body'
+                 keys, or None if the request wasn't cached
+        """
+
+        path = self._get_path(url, headers)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    def put(self, url, headers: dict, etag, last_modified, body: str):
+        entry = {'url': url, 'etag': etag, 'last_modified': last_modified, 'body': body}
+        path = self._get_path(url, headers)
+
+        try:
+            write_atomically(path, json.dumps(entry))
+            self._evict()
+        except OSError:
+            # The response is simply fetched again next time.
+            pass
+
+    def _evict(self):
+        max_bytes = self.settings_store['response_cache_max_bytes']
+
+        entries = []
+        with os.scandir(self.dir) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _get_path(self, url, headers):
+        # Responses depend on who's asking so credentials are part of the key.
+        authorization = (headers or {}).get('Authorization') or ''
+        key = hashlib.sha256('{}\n{}'.format(url, authorization).encode('utf-8')).hexdigest()
+        return os.path.join(self.dir, key + '.json')
+
+
+RESPONSE_CACHE = ResponseCache(
+    os.path.join(click.get_app_dir('Mason CLI'), 'response-cache'), SETTINGS)
@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from threading import Lock
+
+from urllib3.connection import HTTPConnection
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from cli.internal.utils.progress import format_bytes
+
+# Where a request's time went:
+# - connect: resolving the host and opening a TCP connection
+# - tls: the TLS handshake
+# - send: writing the request headers and body
+# - ttfb: waiting for the server to start responding
+# - receive: reading the response body
+PHASES = ('connect', 'tls', 'send', 'ttfb', 'receive')
+
+_local = threading.local()
+
+
+class RequestMetrics(object):
+    """
+    Aggregates phase timings and byte counts of requests per endpoint.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, total, phases: dict, bytes_sent=0, bytes_received=0, failed=False):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if not stats:
+                stats = dict.fromkeys(
+                    ('requests', 'failures', 'total', 'bytes_sent', 'bytes_received') + PHASES, 0)
+                self.endpoints[endpoint] = stats
+
+            stats['requests'] += 1
+            stats['failures'] += int(failed)
+            stats['total'] += total
+            stats['bytes_sent'] += bytes_sent
+            stats['bytes_received'] += bytes_received
+            for phase in PHASES:
+                stats[phase] += phases.get(phase, 0)
+
+    def get_summary(self):
+        """
+        :return: a list of per endpoint stats, slowest endpoints first
+        """
+
+        with self.lock:
+            summary = [dict(stats, endpoint=name) for (name, stats) in self.endpoints.items()]
+        return sorted(summary, key=lambda stats: stats['total'], reverse=True)
+
+    def format_table(self):
+        columns = ('endpoint', 'requests', 'failures', 'total') + PHASES + ('sent', 'received')
+        rows = [columns]
+        for stats in self.get_summary():
+            rows.append(
+                (stats['endpoint'], str(stats['requests']), str(stats['failures'])) +
+                tuple('{:.3f}s'.format(stats[key]) for key in ('total',) + PHASES) +
+                (format_bytes(stats['bytes_sent']), format_bytes(stats['bytes_received'])))
+
+        return format_columns(rows)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'endpoints': self.get_summary()}, f, indent=2)
+
+
+def format_columns(rows: list):
+    """
+    :param rows: rows of cells, the first one being the header
+    :return: the rows as lines of aligned columns, the first column left-aligned and the others
+             right-aligned
+    """
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                  for (i, (cell, width)) in enumerate(zip(row, widths))).rstrip()
+        for row in rows)
+
+
+def start_connection_timing():
+    """
+    Resets the connection phases recorded on this thread, call before sending a request.
+    """
+
+    _local.phases = {}
+
+
+def get_connection_timing():
+    """
+    :return: the connection phases recorded on this thread since the last reset
+    """
+
+    return dict(getattr(_local, 'phases', None) or {})
+
+
+def _add_phase(phase, duration):
+    phases = getattr(_local, 'phases', None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + duration
+
+
+class _TimedConnectionMixin(object):
+    """
+    Times the phases of a connection's life which happen on the thread sending a request.
+    urllib3 resolves the host and opens the socket in one call so DNS time is part of connect.
+    """
+
+    def _new_conn(self):
+        start = time.monotonic()
+        try:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            _add_phase('connect', time.monotonic() - start)
+
+    def connect(self):
+        start = time.monotonic()
+        connecting = get_connection_timing().get('connect', 0)
+        try:
+            return super(_TimedConnectionMixin, self).connect()
+        finally:
+            if isinstance(self, HTTPSConnection):
+                connected = get_connection_timing().get('connect', 0) - connecting
+                _add_phase('tls', time.monotonic() - start - connected)
+
+    def request(self, *args, **kwargs):
+        start = time.monotonic()
+        before = get_connection_timing()
+        try:
+            return super(_TimedConnectionMixin, self).request(*args, **kwargs)
+        finally:
+            # Plain connections are opened lazily while sending the request.
+            after = get_connection_timing()
+            opening = sum(after.get(p, 0) - before.get(p, 0) for p in ('connect', 'tls'))
+            _add_phase('send', time.monotonic() - start - opening)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+TIMED_POOL_CLASSES = {
+    'http': TimedHTTPConnectionPool,
+    'https': TimedHTTPSConnectionPool
+}
@@ -0,0 +1,236 @@
+import contextlib
+import shutil
+import sys
+import time
+from threading import Event
+from threading import RLock
+from threading import Thread
+
+# How often the progress line is redrawn on a terminal.
+TTY_REDRAW_INTERVAL = 0.2
+# How often a progress line is printed when output isn't a terminal, e.g. in CI logs.
+PLAIN_REDRAW_INTERVAL = 10
+
+
+class TransferProgress(object):
+    """
+    Renders a single progress line aggregating every transfer in flight. Updates only add to
+    counters; the line itself is redrawn every `interval` seconds so the cost of drawing doesn't
+    grow with the number of transfers or how often they report progress, and stalled transfers
+    still show their falling rate.
+
+    When stdout isn't a terminal, plain text lines are printed periodically instead.
+    """
+
+    def __init__(self, stream=None, interval=None):
+        self.stream = stream
+        self.interval = interval
+        self.lock = RLock()
+
+        self._transfers = set()
+        self._completed = 0
+        self._total_bytes = 0
+        self._done_bytes = 0
+        self._started_at = None
+        self._last_draw = 0
+        self._line_length = 0
+        self._stop_redraws = None
+
+    def track(self, total, initial=0):
+        """
+        Starts tracking a transfer.
+
+        :param total: the number of bytes the transfer will have moved once it's done
+        :param initial: the number of bytes already moved, e.g. by a resumed upload
+        :return: a :class:`Transfer` to report progress to, which must be closed once done
+        """
+
+        transfer = Transfer(self, total, initial)
+        with self.lock:
+            if not self._transfers:
+                self._completed = 0
+                self._total_bytes = 0
+                self._done_bytes = 0
+                self._started_at = time.monotonic()
+                self._last_draw = 0
+                self._start_redraws()
+
+            self._transfers.add(transfer)
+            self._total_bytes += total
+            self._done_bytes += initial
+
+        return transfer
+
+    @contextlib.contextmanager
+    def external_write_mode(self):
+        """
+        Clears the progress line while something else writes to the terminal, then redraws it.
+        """
+
+        with self.lock:
+            self._clear()
+            try:
+                yield
+            finally:
+                if self._transfers and self._last_draw:
+                    self._draw()
+
+    def _update(self, transfer, num_bytes):
+        with self.lock:
+            # Transfers may be shared by threads, e.g. by the parts of a multipart upload.
+            transfer.position += num_bytes
+            self._done_bytes += num_bytes
+            self._maybe_draw()
+
+    def _maybe_draw(self):
+        now = time.monotonic()
+        if now - self._last_draw >= self._get_interval():
+            self._last_draw = now
+            self._draw()
+
+    def _start_redraws(self):
+        interval = self._get_interval()
+        if not interval:
+            # Every update is drawn anyway.
+            return
+
+        self._stop_redraws = Event()
+        Thread(target=self._redraw, args=(self._stop_redraws, interval), daemon=True).start()
+
+    def _redraw(self, stop: Event, interval):
+        while not stop.wait(interval):
+            with self.lock:
+                if stop.is_set():
+                    return
+                self._maybe_draw()
+
+    def _finish(self, transfer):
+        with self.lock:
+            if transfer not in self._transfers:
+                return
+
+            self._transfers.remove(transfer)
+            if transfer.position < transfer.total:
+                # Abandoned transfers are forgotten, a retry will be tracked on its own.
+                self._total_bytes -= transfer.total
+                self._done_bytes -= transfer.position
+            else:
+                self._completed += 1
+
+            if self._transfers:
+                return
+
+            if self._stop_redraws:
+                self._stop_redraws.set()
+                self._stop_redraws = None
+            if not self._last_draw:
+                return
+            if not self._completed:
+                # Every transfer was abandoned so there's nothing to sum up.
+                self._clear()
+                return
+
+            self._draw()
+            if self._is_tty():
+                self._get_stream().write('\n')
+                self._line_length = 0
+            self._get_stream().flush()
+
+    def _draw(self):
+        line = self._format_line()
+        stream = self._get_stream()
+
+        if self._is_tty():
+            width = shutil.get_terminal_size().columns - 1
+            line = line[:width]
+            stream.write('\r' + line + ' ' * max(self._line_length - len(line), 0))
+            self._line_length = len(line)
+        else:
+            stream.write(line + '\n')
+        stream.flush()
+
+    def _clear(self):
+        if self._line_length and self._is_tty():
+            stream = self._get_stream()
+            stream.write('\r' + ' ' * self._line_length + '\r')
+            stream.flush()
+            self._line_length = 0
+
+    def _format_line(self):
+        elapsed = max(time.monotonic() - self._started_at, 1e-6)
+        if not self._transfers:
+            return 'Uploaded {} file{}: {} in {}'.format(
+                self._completed,
+                '' if self._completed == 1 else 's',
+                format_bytes(self._done_bytes),
+                format_duration(elapsed))
+
+        percent = 100 * self._done_bytes // self._total_bytes if self._total_bytes else 100
+        rate = self._done_bytes / elapsed
+        remaining = self._total_bytes - self._done_bytes
+
+        line = 'Uploading {} file{}: {}/{} ({}%) at {}/s'.format(
+            len(self._transfers),
+            '' if len(self._transfers) == 1 else 's',
+            format_bytes(self._done_bytes),
+            format_bytes(self._total_bytes),
+            percent,
+            format_bytes(rate))
+        if rate and remaining > 0:
+            line += ', {} left'.format(format_duration(remaining / rate))
+        return line
+
+    def _get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return TTY_REDRAW_INTERVAL if self._is_tty() else PLAIN_REDRAW_INTERVAL
+
+    def _get_stream(self):
+        # Resolved lazily so redirections of stdout (e.g. by tests) are respected.
+        return self.stream or sys.stdout
+
+    def _is_tty(self):
+        isatty = getattr(self._get_stream(), 'isatty', None)
+        return bool(isatty and isatty())
+
+
+class Transfer(object):
+    def __init__(self, progress: TransferProgress, total, initial):
+        self.progress = progress
+        self.total = total
+        self.position = initial
+
+    def update(self, num_bytes):
+        self.progress._update(self, num_bytes)
+
+    def close(self):
+        self.progress._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def format_bytes(num_bytes):
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if num_bytes < 1000:
+            break
+        num_bytes /= 1000
+    else:
+        unit = 'TB'
+
+    return '{:.1f} {}'.format(num_bytes, unit) if unit != 'B' else '{:.0f} B'.format(num_bytes)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return '{}s'.format(seconds)
+    if seconds < 60 * 60:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}h{:02d}m'.format(seconds // (60 * 60), seconds // 60 % 60)
+
+
+UPLOAD_PROGRESS = TransferProgress()
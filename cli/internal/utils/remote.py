@@ -1,14 +1,57 @@
+import base64
+import collections
+import hashlib
+import json
 import os
+import random
+import time
+import xml.etree.ElementTree as ElementTree
+from email.utils import parsedate_to_datetime
 from json.decoder import JSONDecodeError
+from threading import Lock
+from urllib.parse import urlparse
 
 import click
 import requests
+from requests.adapters import HTTPAdapter
 from requests_toolbelt.utils import dump
-from tqdm import tqdm
 
+from cli.internal.utils.constants import UPLOAD_JOURNAL
+from cli.internal.utils.hashing import hash_file_range
+from cli.internal.utils.http_cache import RESPONSE_CACHE
+from cli.internal.utils.http_cache import ResponseCache
+from cli.internal.utils.io import wait_for_futures
 from cli.internal.utils.logging import LazyLog
+from cli.internal.utils.metrics import RequestMetrics
+from cli.internal.utils.metrics import TIMED_POOL_CLASSES
+from cli.internal.utils.metrics import get_connection_timing
+from cli.internal.utils.metrics import start_connection_timing
+from cli.internal.utils.progress import Transfer
+from cli.internal.utils.progress import TransferProgress
+from cli.internal.utils.progress import UPLOAD_PROGRESS
 from cli.internal.utils.store import Store
 
+# Large enough that a 1 GB upload is a few hundred socket writes rather than a few hundred
+# thousand, small enough not to matter when many uploads run in parallel.
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+# Responses worth retrying an idempotent request for, the rest won't change by asking again.
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# Endpoints requests are grouped by in metrics. Requests to other URLs, such as signed upload
+# URLs, are grouped by host.
+METERED_ENDPOINTS = (
+    'auth_url',
+    'user_info_url',
+    'projects_url',
+    'registry_signed_url',
+    'registry_artifact_url',
+    'builder_url',
+    'deploy_url',
+    'latest_version_url',
+    'analytics_url'
+)
+# Endpoints whose GET responses are cached and revalidated with conditional requests
+CACHED_ENDPOINTS = ('projects_url', 'registry_artifact_url')
+
 
 def build_url(endpoints: Store, name: str, prefix='api_url_base'):
     full_url = endpoints[name]
@@ -21,47 +64,475 @@ def build_url(endpoints: Store, name: str, prefix='api_url_base'):
 
 
 class RequestHandler:
-    def __init__(self, config):
+    def __init__(
+        self,
+        config,
+        upload_journal: Store = UPLOAD_JOURNAL,
+        progress: TransferProgress = UPLOAD_PROGRESS,
+        response_cache: ResponseCache = RESPONSE_CACHE,
+        max_workers: int = None
+    ):
+        """
+        :param max_workers: the number of threads of the executor requests are sent from, if known
+        """
+
         self.config = config
+        self.upload_journal = upload_journal
+        self.progress = progress
+        self.response_cache = response_cache
+        self.metrics = RequestMetrics()
+        self.lock = Lock()
+        self._retries = 0
 
         if os.environ.get('_MASON_CLI_TEST_MODE'):
             self.http = requests
         else:
+            # Keep a connection per thread which might make requests so none have to be thrown
+            # away, and paid for with a new TLS handshake, while the executor is busy.
+            pool_size = _get_pool_size(max_workers)
+
             self.http = requests.Session()
             self.http.hooks['response'] = [self._logging_hook]
+            self.http.mount('https://', TransferAdapter(pool_maxsize=pool_size))
+            self.http.mount('http://', TransferAdapter(pool_maxsize=pool_size))
 
     def get(self, url, *args, **kwargs):
+        if self._get_endpoint_name(url) in CACHED_ENDPOINTS:
+            return self._get_cached(url, *args, **kwargs)
+
         return self._request_wrapper('get', url, *args, **kwargs)
 
+    def get_pool_stats(self):
+        """
+        :return: a dict with the number of requests sent, the number of connections opened for
+                 them (pool misses) and the number of requests which reused a kept-alive
+                 connection (pool hits)
+        """
+
+        stats = {'requests': 0, 'connections': 0, 'reused': 0}
+        if not isinstance(self.http, requests.Session):
+            return stats
+
+        for adapter in set(self.http.adapters.values()):
+            for pool in adapter.get_pools():
+                stats['requests'] += pool.num_requests
+                stats['connections'] += pool.num_connections
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+
+        return stats
+
+    def log_pool_stats(self):
+        stats = self.get_pool_stats()
+        if stats['requests']:
+            self.config.logger.debug(
+                'Sent {} requests over {} connections ({} reused a kept-alive connection).'.format(
+                    stats['requests'], stats['connections'], stats['reused']))
+
     def post(self, url, *args, **kwargs):
         return self._request_wrapper('post', url, *args, **kwargs)
 
-    def put(self, url, binary, *args, **kwargs):
-        binary_file = open(binary, 'rb')
-        iterable = UploadInChunks(binary_file.name)
-        return self._request_wrapper(
-            'put', url, data=IterableToFileAdapter(iterable), *args, **kwargs)
+    def put(self, url, binary, *args, upload_mode='single', **kwargs):
+        """
+        Uploads a file to `url` with one of the upload modes of the upload_mode setting. The URL
+        must have been issued for that mode, see MasonApi._get_upload_mode.
+        """
+
+        if upload_mode == 'resumable':
+            return self._put_resumable(url, binary, *args, **kwargs)
+        if upload_mode == 'multipart':
+            return self._put_multipart(url, binary, *args, **kwargs)
+
+        with self.progress.track(os.path.getsize(binary)) as progress, \
+                FileUploadBody(binary, progress=progress) as body:
+            return self._request_wrapper('put', url, data=body, *args, **kwargs)
+
+    def _put_resumable(self, url, binary, headers=None):
+        """
+        Uploads a file through a resumable upload session. If the connection drops, the server is
+        asked how many bytes it committed and the upload continues from there. Sessions are kept in
+        the upload journal so an interrupted invocation can be resumed by the next one.
+
+        The Content-MD5 header is sent when starting the session and covers the whole file.
+        """
+
+        headers = headers or {}
+        size = os.path.getsize(binary)
+        journal_key = '{}#{}'.format(url.split('?', 1)[0], headers.get('Content-MD5'))
+        attempts = self.config.settings_store['resumable_upload_attempts']
+
+        session_url = (self._get_journaled_upload(journal_key) or {}).get('session_url')
+        r = self._query_upload_session(session_url, size) if session_url else None
+        if r is not None and r.status_code >= 400 and r.status_code not in RETRYABLE_STATUS_CODES:
+            # The journaled session failed for good, resuming it would only fail again.
+            r = None
+
+        offset = -1
+        failures = 0
+        while True:
+            if r is None or r.status_code in (404, 410):
+                # There's no session yet or it expired, so start over.
+                session_url = self._start_upload_session(url, headers)
+                committed = 0
+            elif r.status_code == 308:
+                committed = self._get_committed_offset(r)
+            elif r.status_code in RETRYABLE_STATUS_CODES:
+                # The session outlives transient failures, so ask how far it got like when the
+                # connection drops.
+                self.config.logger.debug('Upload to {} failed at byte {} with status {}.'.format(
+                    session_url, offset, r.status_code))
+
+                attempts -= 1
+                if attempts <= 0:
+                    raise ApiError('Upload failed. Check you internet connection.')
+                failures += 1
+                time.sleep(self._get_retry_delay(failures, r))
+                r = self._query_upload_session(session_url, size)
+                continue
+            else:
+                break
+
+            if committed <= offset:
+                attempts -= 1
+                if attempts <= 0:
+                    raise ApiError('Upload failed. Check you internet connection.')
+            offset = committed
+            self._set_journaled_upload(
+                journal_key, {'session_url': session_url, 'offset': offset})
+
+            try:
+                r = self._upload_from(session_url, binary, offset, size)
+            except requests.RequestException as e:
+                self.config.logger.debug('Upload to {} interrupted at byte {}: {}'.format(
+                    session_url, offset, e))
+
+                attempts -= 1
+                if attempts <= 0:
+                    raise ApiError('Upload failed. Check you internet connection.')
+                r = self._query_upload_session(session_url, size)
+
+        if not r.ok:
+            # The journal entry is kept so the next invocation asks the session where it's at
+            # instead of starting over.
+            self._handle_failed_response(r)
+
+        self._set_journaled_upload(journal_key, None)
+        return self._parse_response(r)
+
+    def _start_upload_session(self, url, headers):
+        session_headers = dict(headers)
+        session_headers['x-goog-resumable'] = 'start'
+
+        r = self._safe_request('post', url, headers=session_headers)
+        if not r.ok:
+            self._handle_failed_response(r)
+        if not r.headers.get('Location'):
+            raise ApiError('Upload session could not be started.')
+
+        return r.headers['Location']
+
+    def _query_upload_session(self, session_url, size):
+        headers = {'Content-Range': 'bytes */{}'.format(size)}
+        return self._safe_request('put', session_url, headers=headers)
+
+    def _upload_from(self, session_url, binary, offset, size):
+        if offset >= size:
+            return self._query_upload_session(session_url, size)
+
+        headers = {'Content-Range': 'bytes {}-{}/{}'.format(offset, size - 1, size)}
+        with self.progress.track(size, offset) as progress, \
+                FileUploadBody(binary, offset, progress=progress) as body:
+            return self._send('put', session_url, data=body, headers=headers)
+
+    def _get_committed_offset(self, r):
+        # The Range header looks like 'bytes=0-42' and is absent if nothing has been committed.
+        committed_range = r.headers.get('Range')
+        if not committed_range:
+            return 0
+
+        return int(committed_range.split('-')[-1]) + 1
+
+    def _get_journaled_upload(self, key):
+        with self.lock:
+            return (self.upload_journal['uploads'] or {}).get(key)
+
+    def _set_journaled_upload(self, key, upload):
+        with self.lock:
+            uploads = dict(self.upload_journal['uploads'] or {})
+            if upload:
+                uploads[key] = upload
+            else:
+                uploads.pop(key, None)
+
+            self.upload_journal['uploads'] = uploads
+            if not self.upload_journal.try_save():
+                # The journal only lets later invocations resume, the upload itself can go on.
+                self.config.logger.warning(
+                    'Failed to save the upload journal, interrupted uploads will restart.')
+
+    def _put_multipart(self, url, binary, headers=None):
+        """
+        Uploads a file as several parts in parallel through a multipart upload, then checks the
+        composite checksum of the assembled object (the MD5 of all part MD5s) reported by the
+        server.
+
+        The Content-MD5 header is sent when starting the upload and covers the whole file.
+        """
+
+        size = os.path.getsize(binary)
+        part_size = self.config.settings_store['multipart_part_size']
+        concurrency = self.config.settings_store['multipart_concurrency']
+
+        parts = []
+        for (num, offset) in enumerate(range(0, size, part_size)):
+            parts.append((num + 1, offset, min(part_size, size - offset)))
+        parts = parts or [(1, 0, 0)]
+
+        upload_id = self._start_multipart_upload(url, headers or {})
+        progress = self.progress.track(size)
+        try:
+            part_md5s = self._run_concurrently(
+                lambda part: self._upload_part(url, upload_id, binary, part, progress),
+                parts,
+                concurrency)
+            r = self._complete_multipart_upload(url, upload_id, parts, part_md5s)
+        except BaseException as e:
+            self._abort_multipart_upload(url, upload_id)
+            raise e
+        finally:
+            progress.close()
+
+        expected_etag = '{}-{}'.format(hashlib.md5(b''.join(part_md5s)).hexdigest(), len(parts))
+        etag = _find_xml_text(r.content, 'ETag')
+        if etag and etag.strip('"') != expected_etag:
+            raise ApiError('Upload failed: the uploaded file was corrupted.')
+
+    def _start_multipart_upload(self, url, headers):
+        r = self._safe_request('post', _with_query(url, 'uploads'), headers=headers)
+        if not r.ok:
+            self._handle_failed_response(r)
+
+        upload_id = _find_xml_text(r.content, 'UploadId')
+        if not upload_id:
+            raise ApiError('Upload session could not be started.')
+        return upload_id
+
+    def _upload_part(self, url, upload_id, binary, part, progress):
+        num, offset, length = part
+        md5 = hash_file_range(binary, 'md5', offset, length)
+        headers = {'Content-MD5': base64.b64encode(md5).decode('utf-8')}
+
+        part_url = _with_query(url, 'partNumber={}&uploadId={}'.format(num, upload_id))
+        with FileUploadBody(binary, offset, length, progress=progress) as body:
+            r = self._safe_request('put', part_url, data=body, headers=headers)
+        if not r.ok:
+            self._handle_failed_response(r)
+
+        return md5
+
+    def _complete_multipart_upload(self, url, upload_id, parts, part_md5s):
+        root = ElementTree.Element('CompleteMultipartUpload')
+        for ((num, _, _), md5) in zip(parts, part_md5s):
+            part = ElementTree.SubElement(root, 'Part')
+            ElementTree.SubElement(part, 'PartNumber').text = str(num)
+            ElementTree.SubElement(part, 'ETag').text = '"{}"'.format(md5.hex())
+
+        r = self._safe_request(
+            'post',
+            _with_query(url, 'uploadId={}'.format(upload_id)),
+            data=ElementTree.tostring(root),
+            headers={'Content-Type': 'application/xml'})
+        if not r.ok:
+            self._handle_failed_response(r)
+
+        return r
+
+    def _abort_multipart_upload(self, url, upload_id):
+        try:
+            self._send('delete', _with_query(url, 'uploadId={}'.format(upload_id)))
+        except requests.RequestException as e:
+            # The server will garbage collect the parts eventually.
+            self.config.logger.debug(e)
+
+    def _run_concurrently(self, func, items, concurrency):
+        """
+        Runs `func` over all `items` with up to `concurrency` threads and returns the results in
+        order. The calling thread does its share of the work and helpers that never got a chance
+        to start are cancelled, so this can't deadlock even when the executor is saturated with
+        callers waiting on their own helpers.
+        """
+
+        queue = collections.deque(enumerate(items))
+        results = [None] * len(items)
+        failed = []
+
+        def work():
+            while not failed:
+                try:
+                    (index, item) = queue.popleft()
+                except IndexError:
+                    return
+
+                try:
+                    results[index] = func(item)
+                except BaseException as e:
+                    failed.append(e)
+                    raise e
+
+        num_helpers = min(concurrency, len(items)) - 1
+        helpers = [self.config.executor.submit(work) for _ in range(num_helpers)]
+        try:
+            work()
+        finally:
+            for helper in helpers:
+                helper.cancel()
+            wait_for_futures(self.config.executor, [h for h in helpers if not h.cancelled()])
+
+        return results
+
+    def _get_cached(self, url, headers=None, **kwargs):
+        """
+        GETs a response through the response cache, asking the server whether a cached response is
+        still fresh rather than downloading it again.
+        """
+
+        cached = self.response_cache.get(url, headers)
+
+        request_headers = dict(headers or {})
+        if cached and cached.get('etag'):
+            request_headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            request_headers['If-Modified-Since'] = cached['last_modified']
+
+        r = self._safe_request('get', url, headers=request_headers, **kwargs)
+        if cached and r.status_code == 304:
+            return self._parse_text(cached['body'])
+        if not r.ok:
+            self._handle_failed_response(r)
+
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.response_cache.put(url, headers, etag, last_modified, r.text)
+
+        return self._parse_response(r)
 
     def _request_wrapper(self, type, url, *args, **kwargs):
         r = self._safe_request(type, url, *args, **kwargs)
 
         if not r.ok:
             self._handle_failed_response(r)
-        if r.text:
+        return self._parse_response(r)
+
+    def _parse_response(self, r):
+        return self._parse_text(r.text)
+
+    def _parse_text(self, text):
+        if text:
             try:
-                return r.json()
+                return json.loads(text)
             except JSONDecodeError as e:
                 self.config.logger.debug(e)
-                return r.text
+                return text
 
     def _safe_request(self, type, *args, **kwargs) -> requests.Response:
-        func = getattr(self.http, type)
+        """
+        Sends a request, retrying idempotent ones which fail with a network error or a transient
+        status code. Retries back off exponentially with jitter unless the server asks for a
+        specific delay through Retry-After, and are capped per request and per invocation.
+        """
+
+        retryable = _is_idempotent(type, kwargs.get('headers'))
+
+        attempt = 1
+        while True:
+            try:
+                r = self._send(type, *args, **kwargs)
+            except requests.RequestException as e:
+                if not (retryable and self._take_retry(attempt)):
+                    self.config.logger.debug('{} request to {} with payload {} failed: {}'.format(
+                        type.upper(), args[0], kwargs.get('json'), e))
+                    raise ApiError('Network request failed. Check you internet connection.')
+
+                (reason, delay) = (e, self._get_retry_delay(attempt))
+            else:
+                if not (retryable and r.status_code in RETRYABLE_STATUS_CODES and
+                        self._take_retry(attempt)):
+                    return r
+
+                (reason, delay) = (r.status_code, self._get_retry_delay(attempt, r))
+                r.close()
+
+            self.config.logger.debug('Retrying {} request to {} in {:.1f}s after: {}'.format(
+                type.upper(), args[0], delay, reason))
+            time.sleep(delay)
+            attempt += 1
+
+            body = kwargs.get('data')
+            if hasattr(body, 'seek'):
+                body.seek(0)
+
+    def _send(self, type, url, *args, **kwargs) -> requests.Response:
+        start_connection_timing()
+        start = time.monotonic()
         try:
-            return func(*args, **kwargs)
+            r = getattr(self.http, type)(url, *args, **kwargs)
         except requests.RequestException as e:
-            self.config.logger.debug('{} request to {} with payload {} failed: {}'.format(
-                type.upper(), args[0], kwargs.get('json'), e))
-            raise ApiError('Network request failed. Check you internet connection.')
+            self.metrics.record(
+                self._get_endpoint_name(url),
+                time.monotonic() - start,
+                get_connection_timing(),
+                failed=True)
+            raise e
+
+        total = time.monotonic() - start
+        phases = get_connection_timing()
+        # The response is timed up to its headers, its body is read afterwards.
+        elapsed = r.elapsed.total_seconds()
+        phases['ttfb'] = max(elapsed - sum(phases.values()), 0)
+        phases['receive'] = max(total - elapsed, 0)
+
+        body = r.request.body
+        self.metrics.record(
+            self._get_endpoint_name(url),
+            total,
+            phases,
+            len(body) if hasattr(body, '__len__') else 0,
+            len(r.content or b''),
+            not r.ok)
+        return r
+
+    def _get_endpoint_name(self, url):
+        (name, prefix) = (None, '')
+        for endpoint in METERED_ENDPOINTS:
+            endpoint_url = build_url(self.config.endpoints_store, endpoint)
+            if isinstance(endpoint_url, str) and url.startswith(endpoint_url) and \
+                    len(endpoint_url) > len(prefix):
+                (name, prefix) = (endpoint, endpoint_url)
+
+        return name or urlparse(url).netloc
+
+    def _take_retry(self, attempt):
+        settings = self.config.settings_store
+        if attempt >= settings['request_retry_attempts']:
+            return False
+
+        with self.lock:
+            if self._retries >= settings['request_retry_budget']:
+                return False
+            self._retries += 1
+            return True
+
+    def _get_retry_delay(self, attempt, r=None):
+        settings = self.config.settings_store
+        max_delay = settings['request_retry_max_delay']
+
+        retry_after = _parse_retry_after(r.headers.get('Retry-After')) if r is not None else None
+        if retry_after is not None:
+            return min(retry_after, max_delay)
+
+        # Full jitter keeps parallel requests which failed together from retrying in lockstep.
+        backoff = min(settings['request_retry_backoff'] * 2 ** (attempt - 1), max_delay)
+        return random.uniform(0, backoff)
 
     # noinspection PyUnusedLocal
     def _logging_hook(self, r, *args, **kwargs):
@@ -82,7 +553,7 @@ class RequestHandler:
             self.config.logger.debug('Client made a bad request, failed.')
         elif status_code == 401:
             raise ApiError("Unauthorized: session expired or access denied. Run 'mason login' to "
-                           "start a new session.")
+                           "start a new session.", status_code)
         elif status_code == 403:
             self.config.logger.error('Access to domain is forbidden. Please contact support.')
         elif status_code == 404:
@@ -161,8 +632,9 @@ class RequestHandler:
 
 
 class ApiError(Exception):
-    def __init__(self, message=None):
+    def __init__(self, message=None, status_code=None):
         self.message = message
+        self.status_code = status_code
 
     def exit(self, config):
         if self.message:
@@ -170,43 +642,137 @@ class ApiError(Exception):
         raise click.Abort()
 
 
-class UploadInChunks(object):
-    def __init__(self, path):
+class TransferAdapter(HTTPAdapter):
+    """
+    Lets connections hand request bodies over in UPLOAD_BUFFER_SIZE blocks instead of the
+    default 16 KB, and times the phases of each request.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault('blocksize', UPLOAD_BUFFER_SIZE)
+        super(TransferAdapter, self).init_poolmanager(*args, **kwargs)
+        # Connections time how long they take to open and send requests for RequestMetrics.
+        self.poolmanager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+
+    def get_pools(self):
+        with self.poolmanager.pools.lock:
+            return [self.poolmanager.pools[key] for key in self.poolmanager.pools.keys()]
+
+
+class FileUploadBody(object):
+    """
+    A file-like request body which streams a file through one preallocated buffer. Reads honour
+    the size asked for by the HTTP layer and return views into the buffer rather than copies, so
+    each view is only valid until the next read.
+
+    Progress is reported to `progress` if given, which is left open for its owner to close.
+    """
+
+    def __init__(
+        self,
+        path,
+        offset=0,
+        length=None,
+        buffer_size=UPLOAD_BUFFER_SIZE,
+        progress: Transfer = None
+    ):
         self.path = path
-        self.num_bytes = os.path.getsize(path)
-        self.chunk_size = 5120  # 5KB == 2^10 * 5
-
-        self.progress = tqdm(
-            total=self.num_bytes,
-            ncols=100,
-            dynamic_ncols=True,
-            unit='B',
-            unit_scale=True
-        )
-
-    def __iter__(self):
-        with open(self.path, 'rb') as file_to_upload:
-            while True:
-                data = file_to_upload.read(self.chunk_size)
-                if not data:
-                    self.progress.close()
-                    break
-
-                self.progress.update(len(data))
-                yield data
+        self.num_bytes = os.path.getsize(path) - offset if length is None else length
+        self.position = 0
+
+        self._file = open(path, 'rb', buffering=0)
+        self._file.seek(offset)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self.progress = progress
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        size = min(size, self.num_bytes - self.position)
+
+        num_read = self._file.readinto(self._view[:size])
+        if not num_read:
+            return b''
+
+        self.position += num_read
+        if self.progress:
+            self.progress.update(num_read)
+        return self._view[:num_read]
+
+    def tell(self):
+        return self.position
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.num_bytes
+        position = max(0, min(position, self.num_bytes))
+
+        self._file.seek(position - self.position, os.SEEK_CUR)
+        if self.progress:
+            self.progress.update(position - self.position)
+        self.position = position
+        return position
+
+    def close(self):
+        self._file.close()
 
     def __len__(self):
         return self.num_bytes
 
+    def __enter__(self):
+        return self
 
-class IterableToFileAdapter(object):
-    def __init__(self, iterable):
-        self.iterator = iter(iterable)
-        self.length = len(iterable)
+    def __exit__(self, *args):
+        self.close()
 
-    # noinspection PyUnusedLocal
-    def read(self, size=-1):
-        return next(self.iterator, b'')
 
-    def __len__(self):
-        return self.length
+def _get_pool_size(max_workers):
+    if not max_workers:
+        return requests.adapters.DEFAULT_POOLSIZE
+
+    # One more for the main thread
+    return max_workers + 1
+
+
+def _is_idempotent(method, headers):
+    if method in ('get', 'put', 'delete', 'head'):
+        return True
+    return bool(headers and headers.get('Idempotency-Key'))
+
+
+def _parse_retry_after(value):
+    """
+    Parses a Retry-After header, either a number of seconds or an HTTP date, into seconds.
+    """
+
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _with_query(url, query):
+    return '{}{}{}'.format(url, '&' if '?' in url else '?', query)
+
+
+def _find_xml_text(content, tag):
+    """
+    Finds the text of the first element named `tag` regardless of its namespace.
+    """
+
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        return None
+
+    for element in root.iter():
+        if element.tag == tag or element.tag.endswith('}' + tag):
+            return element.text
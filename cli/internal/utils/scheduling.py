@@ -0,0 +1,182 @@
+import contextlib
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures._base import Executor
+from threading import Lock
+
+from cli.internal.utils.constants import SETTINGS
+from cli.internal.utils.store import Store
+
+# Maps an upload priority to the sort key of an upload given its size. Lower keys go first.
+PRIORITIES = {
+    'fifo': lambda size: 0,
+    'smallest-first': lambda size: size,
+    'largest-first': lambda size: -size
+}
+
+_local = threading.local()
+
+
+class ScheduledUpload(object):
+    def __init__(self, binary, size, queued_at):
+        self.binary = binary
+        self.size = size
+        self.queued_at = queued_at
+        self.admitted_at = None
+        self.started_at = None
+        self.finished_at = None
+
+    def get_queue_time(self):
+        return (self.admitted_at or time.monotonic()) - self.queued_at
+
+    def get_transfer_time(self):
+        if self.started_at is None:
+            return 0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class UploadScheduler(object):
+    """
+    Decides in which order uploads run and caps how many bytes are in flight at once. An upload
+    larger than the cap runs on its own.
+
+    Uploads wait in the scheduler rather than on the executor, they're only handed to it once they
+    may start. That way no worker is tied up waiting for bytes in flight to drop while other work
+    sharing the executor could run.
+    """
+
+    def __init__(self, settings_store: Store):
+        self.settings_store = settings_store
+        self.lock = Lock()
+        # The number of uploads that are done running, successful or not
+        self.finished = 0
+
+        self._bytes_in_flight = 0
+        self._waiting = []
+        self._queued_at = {}
+        self._sequence = itertools.count()
+
+    def order(self, items: list, binary=lambda item: item.binary):
+        """
+        Sorts items by upload priority and starts their queue time clocks.
+
+        :param items: anything that will be uploaded, artifacts by default
+        :param binary: function extracting the path of the file each item will upload
+        :return: the items in the order their uploads should be submitted
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            for item in items:
+                self._queued_at.setdefault(binary(item), now)
+
+        priority = self._get_priority()
+        return sorted(items, key=lambda item: priority(_get_size(binary(item))))
+
+    def submit(self, executor: Executor, binary, fn, *args, **kwargs):
+        """
+        Queues the upload of `binary` and submits `fn` to the executor once the upload is allowed
+        to start. While `fn` runs, :func:`get_current_upload` returns the :class:`ScheduledUpload`
+        being timed on its thread.
+
+        :return: a future of the result of `fn`
+        """
+
+        size = _get_size(binary)
+        future = Future()
+        with self.lock:
+            upload = ScheduledUpload(binary, size, self._queued_at.pop(binary, time.monotonic()))
+            entry = (self._get_priority()(size), next(self._sequence), upload,
+                     future, functools.partial(fn, *args, **kwargs))
+            heapq.heappush(self._waiting, entry)
+
+        self._admit(executor)
+        return future
+
+    def _admit(self, executor):
+        with self.lock:
+            admitted = []
+            while self._waiting and self._can_start(self._waiting[0][2]):
+                entry = heapq.heappop(self._waiting)
+                self._bytes_in_flight += entry[2].size
+                entry[2].admitted_at = time.monotonic()
+                admitted.append(entry)
+
+        for (_, _, upload, future, fn) in admitted:
+            try:
+                executor.submit(self._run, executor, upload, future, fn)
+            except RuntimeError as e:
+                # The executor was shut down, so nothing else will be admitted either.
+                self._release(upload)
+                future.set_exception(e)
+
+    def _run(self, executor, upload, future, fn):
+        if not future.set_running_or_notify_cancel():
+            self._release(upload)
+            self._admit(executor)
+            return
+
+        _local.upload = upload
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            _local.upload = None
+            self._release(upload)
+            # The next uploads in line might fit now.
+            self._admit(executor)
+
+    def _release(self, upload):
+        with self.lock:
+            self._bytes_in_flight -= upload.size
+            self.finished += 1
+
+    def _can_start(self, upload):
+        max_bytes = self.settings_store['upload_max_bytes_in_flight']
+        return self._bytes_in_flight == 0 or self._bytes_in_flight + upload.size <= max_bytes
+
+    def _get_priority(self):
+        return PRIORITIES.get(self.settings_store['upload_priority'], PRIORITIES['fifo'])
+
+
+def get_current_upload():
+    """
+    :return: the :class:`ScheduledUpload` running on this thread, or None
+    """
+
+    return getattr(_local, 'upload', None)
+
+
+@contextlib.contextmanager
+def timed_transfer():
+    """
+    Records the transfer time of the upload running on this thread, if any. Wrap only the request
+    sending the file so hashing and API calls around it aren't counted.
+    """
+
+    upload = get_current_upload()
+    if upload is None:
+        yield
+        return
+
+    upload.started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        upload.finished_at = time.monotonic()
+
+
+def _get_size(binary):
+    try:
+        return os.path.getsize(binary)
+    except OSError:
+        return 0
+
+
+UPLOAD_SCHEDULER = UploadScheduler(SETTINGS)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 import click
 import yaml
@@ -14,9 +15,20 @@ class Store(object):
             self.restore()
 
     def save(self):
-        os.makedirs(os.path.dirname(self._file), exist_ok=True)
-        with open(self._file, 'w') as f:
-            f.write(yaml.safe_dump(self._fields))
+        write_atomically(self._file, yaml.safe_dump(self._fields))
+
+    def try_save(self):
+        """
+        Saves a store which only caches what can be fetched or computed again, so there's nothing
+        to report if the disk is full or read-only.
+        :return: True if the store was saved
+        """
+
+        try:
+            self.save()
+            return True
+        except OSError:
+            return False
 
     def restore(self):
         if os.path.exists(self._file):
@@ -37,3 +49,23 @@ class Store(object):
 
     def clear(self):
         self._fields = {}
+
+
+def write_atomically(path, text: str):
+    """
+    Writes a file through a temporary file in the same directory so readers, including concurrent
+    invocations and threads, never see it partially written.
+    """
+
+    dir = os.path.dirname(path)
+    os.makedirs(dir, exist_ok=True)
+
+    # The temporary file's name is unique so concurrent writers never clobber each other's.
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=dir)
+    try:
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
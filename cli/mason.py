@@ -45,8 +45,22 @@ def _version_callback(ctx, param, value):
               help='Log verbose artifact and command details.')
 @click.option('--verbosity', '-v', expose_value=False, is_eager=True, callback=handle_set_level,
               help='Either CRITICAL, ERROR, WARNING, INFO or DEBUG')
+@click.option('--network-stats', is_flag=True, default=False, hidden=True,
+              help='Print where time went for each endpoint when done.')
+@click.option('--network-stats-file', type=click.Path(dir_okay=False), hidden=True,
+              help='Write where time went for each endpoint to a JSON file when done.')
 @pass_config
-def cli(config, debug, verbose, api_key, id_token, access_token, no_color):
+def cli(
+    config,
+    debug,
+    verbose,
+    api_key,
+    id_token,
+    access_token,
+    no_color,
+    network_stats,
+    network_stats_file
+):
     """
     The Mason CLI provides command line tools to help you manage your configurations in the Mason
     Platform.
@@ -58,7 +72,16 @@ def cli(config, debug, verbose, api_key, id_token, access_token, no_color):
     api_key = api_key or os.environ.get('MASON_API_KEY') or os.environ.get('MASON_TOKEN')
 
     from cli.internal.commands.cli_init import CliInitCommand
-    command = CliInitCommand(config, debug, verbose, no_color, api_key, id_token, access_token)
+    command = CliInitCommand(
+        config,
+        debug,
+        verbose,
+        no_color,
+        api_key,
+        id_token,
+        access_token,
+        network_stats=network_stats,
+        network_stats_file=network_stats_file)
     command.run()
 
 
@@ -24,7 +24,6 @@ setup(
         'pick',
         'requests',
         'requests-toolbelt',
-        'tqdm',
         'pyyaml',
         'six',
         'packaging',
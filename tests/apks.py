@@ -0,0 +1,378 @@
+import io
+import os
+import random
+import struct
+import zipfile
+
+from asn1crypto import cms
+
+from tests import __tests_root__
+
+# Synthetic APKs are built from this signed APK, its signature isn't verified by the CLI so it
+# stays valid as far as parsing is concerned.
+TEMPLATE_APK = os.path.join(__tests_root__, 'res/v1.apk')
+
+NS_ANDROID_URI = 'http://schemas.android.com/apk/res/android'
+
+# Chunk types and value types of binary XML, see ResourceTypes.h in the Android framework
+_RES_XML_TYPE = 0x0003
+_RES_STRING_POOL_TYPE = 0x0001
+_RES_TABLE_TYPE = 0x0002
+_RES_TABLE_PACKAGE_TYPE = 0x0200
+_RES_TABLE_TYPE_TYPE = 0x0201
+_RES_TABLE_TYPE_SPEC_TYPE = 0x0202
+_RES_XML_START_NAMESPACE_TYPE = 0x0100
+_RES_XML_END_NAMESPACE_TYPE = 0x0101
+_RES_XML_START_ELEMENT_TYPE = 0x0102
+_RES_XML_END_ELEMENT_TYPE = 0x0103
+_TYPE_REFERENCE = 0x01
+_TYPE_STRING = 0x03
+_TYPE_INT_DEC = 0x10
+_TYPE_INT_BOOLEAN = 0x12
+_NO_INDEX = 0xFFFFFFFF
+# The package ID of apps and the type ID of the only type in resource tables
+_APP_PACKAGE_ID = 0x7f
+_STRING_TYPE_ID = 0x01
+# The size of ResTable_config up to and including its version
+_CONFIG_SIZE = 28
+
+_APK_SIG_MAGIC = b'APK Sig Block 42'
+_APK_SIG_KEY_V2_SIGNATURE = 0x7109871a
+_APK_SIG_KEY_V3_SIGNATURE = 0xf05368c0
+_SIGNATURE_ALGORITHM = 0x0103
+
+# The v1 signature files are copied from the template, they're never verified by the parser.
+_V1_SIGNATURE_FILES = ('META-INF/MANIFEST.MF', 'META-INF/CERT.SF', 'META-INF/CERT.RSA')
+
+
+class ResourceReference(int):
+    """
+    The ID of a resource, which is compiled as a reference instead of an integer.
+    """
+
+
+def get_string_resource_id(index):
+    """
+    :return: the ID of the index-th string of the resource table made by make_resources
+    """
+
+    return ResourceReference(_APP_PACKAGE_ID << 24 | _STRING_TYPE_ID << 16 | index)
+
+
+def make_manifest(
+    package_name,
+    version_code=1,
+    version_name='1.0',
+    min_sdk=21,
+    permissions=0,
+    activities=0
+):
+    """
+    Compiles an AndroidManifest.xml into binary XML.
+
+    :param permissions: the number of <uses-permission> tags
+    :param activities: the number of <activity> tags, each with a few attributes
+    :return: the manifest's bytes
+    """
+
+    writer = _AxmlWriter()
+    writer.start_namespace('android', NS_ANDROID_URI)
+    writer.start_element('manifest', [
+        (None, 'package', package_name),
+        (NS_ANDROID_URI, 'versionCode', version_code),
+        (NS_ANDROID_URI, 'versionName', version_name)
+    ])
+    writer.start_element('uses-sdk', [
+        (NS_ANDROID_URI, 'minSdkVersion', min_sdk),
+        (NS_ANDROID_URI, 'targetSdkVersion', 28)
+    ])
+    writer.end_element('uses-sdk')
+
+    for i in range(permissions):
+        writer.start_element('uses-permission', [
+            (NS_ANDROID_URI, 'name', '{}.permission.PERMISSION_{}'.format(package_name, i))])
+        writer.end_element('uses-permission')
+
+    writer.start_element('application', [(NS_ANDROID_URI, 'label', 'Benchmark')])
+    for i in range(activities):
+        writer.start_element('activity', [
+            (NS_ANDROID_URI, 'name', '{}.ui.Activity{}'.format(package_name, i)),
+            (NS_ANDROID_URI, 'label', 'Activity {}'.format(i)),
+            (NS_ANDROID_URI, 'exported', i % 2 == 0)
+        ])
+        writer.end_element('activity')
+    writer.end_element('application')
+
+    writer.end_element('manifest')
+    writer.end_namespace('android', NS_ANDROID_URI)
+    return writer.to_bytes()
+
+
+def make_signed_apk(
+    path,
+    manifest: bytes,
+    entries=0,
+    size=0,
+    v1=True,
+    v2=False,
+    v3=False,
+    seed=0,
+    resources: bytes = None
+):
+    """
+    Writes an APK signed with the template APK's certificate. Signatures and digests are
+    structurally valid but don't match the contents, they only exist to be parsed.
+
+    :param entries: the number of small extra files in the APK
+    :param size: pads the APK with incompressible data up to roughly this many bytes
+    :param v1: whether to include JAR signature files
+    :param v2: whether to include an APK Signature Scheme v2 block
+    :param v3: whether to include an APK Signature Scheme v3 block
+    :param resources: the resources.arsc to include, if any
+    """
+
+    contents = io.BytesIO()
+    with zipfile.ZipFile(TEMPLATE_APK) as template, \
+            zipfile.ZipFile(contents, 'w', zipfile.ZIP_DEFLATED) as apk:
+        apk.writestr('AndroidManifest.xml', manifest)
+        if resources is not None:
+            apk.writestr('resources.arsc', resources, zipfile.ZIP_STORED)
+        if v1:
+            for name in _V1_SIGNATURE_FILES:
+                apk.writestr(name, template.read(name))
+        for i in range(entries):
+            apk.writestr('res/raw/entry_{}.txt'.format(i), 'Entry {}\n'.format(i))
+
+        padding = size - contents.tell()
+        if padding > 0:
+            apk.writestr('assets/padding.bin', random_bytes(padding, seed), zipfile.ZIP_STORED)
+
+    data = contents.getvalue()
+    blocks = []
+    if v2:
+        blocks.append((_APK_SIG_KEY_V2_SIGNATURE, _make_signature_scheme_block(False)))
+    if v3:
+        blocks.append((_APK_SIG_KEY_V3_SIGNATURE, _make_signature_scheme_block(True)))
+    if blocks:
+        data = _insert_signing_block(data, blocks)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def make_string_pool(strings):
+    """
+    Compiles a UTF-16 string pool chunk, as found in binary XML and resources.arsc files.
+
+    :return: the chunk's bytes
+    """
+
+    offsets = []
+    data = bytearray()
+    for string in strings:
+        offsets.append(len(data))
+        if len(string) > 0x7FFF:
+            data += struct.pack('<HH', 0x8000 | (len(string) >> 16), len(string) & 0xFFFF)
+        else:
+            data += struct.pack('<H', len(string))
+        data += string.encode('utf-16-le') + b'\x00\x00'
+    data += b'\x00' * (-len(data) % 4)
+
+    header_size = 0x1C
+    strings_start = header_size + 4 * len(offsets)
+    return struct.pack(
+        '<HHIIIIII',
+        _RES_STRING_POOL_TYPE,
+        header_size,
+        strings_start + len(data),
+        len(offsets),
+        0,
+        0,
+        strings_start,
+        0) + struct.pack('<{}I'.format(len(offsets)), *offsets) + bytes(data)
+
+
+def make_resources(package_name, configs: dict):
+    """
+    Compiles a resources.arsc with a single package holding string resources.
+
+    :param configs: a dict of locale, or '' for the default configuration, to the values of the
+                    strings in it. Values are strings or references made by
+                    get_string_resource_id. Type chunks are written in the dict's order.
+    :return: the table's bytes
+    """
+
+    strings = []
+    type_chunks = []
+    entry_count = max(len(values) for values in configs.values())
+    for (locale, values) in configs.items():
+        offsets = []
+        entries = bytearray()
+        for value in values:
+            offsets.append(len(entries))
+            if isinstance(value, ResourceReference):
+                (type_, data) = (_TYPE_REFERENCE, value)
+            else:
+                (type_, data) = (_TYPE_STRING, len(strings))
+                strings.append(value)
+            entries += struct.pack('<HHIHBBI', 8, 0, len(offsets) - 1, 8, 0, type_, data)
+        offsets += [_NO_INDEX] * (entry_count - len(values))
+
+        config = struct.pack('<II4s4xIII', _CONFIG_SIZE, 0, locale.encode('ascii'), 0, 0, 0)
+        header_size = 20 + len(config)
+        entries_start = header_size + 4 * entry_count
+        type_chunks.append(struct.pack(
+            '<HHIBBHII',
+            _RES_TABLE_TYPE_TYPE,
+            header_size,
+            entries_start + len(entries),
+            _STRING_TYPE_ID,
+            0,
+            0,
+            entry_count,
+            entries_start) + config + struct.pack('<{}I'.format(entry_count), *offsets) +
+            bytes(entries))
+
+    type_spec = struct.pack(
+        '<HHIBBHI',
+        _RES_TABLE_TYPE_SPEC_TYPE,
+        16,
+        16 + 4 * entry_count,
+        _STRING_TYPE_ID,
+        0,
+        0,
+        entry_count) + b'\x00' * 4 * entry_count
+    type_strings = make_string_pool(['string'])
+    key_strings = make_string_pool(['string_{}'.format(i) for i in range(entry_count)])
+
+    package_header_size = 8 + 4 + 256 + 4 * 4
+    package_body = type_strings + key_strings + type_spec + b''.join(type_chunks)
+    package = struct.pack(
+        '<HHII256sIIII',
+        _RES_TABLE_PACKAGE_TYPE,
+        package_header_size,
+        package_header_size + len(package_body),
+        _APP_PACKAGE_ID,
+        package_name.encode('utf-16-le'),
+        package_header_size,
+        0,
+        package_header_size + len(type_strings),
+        0) + package_body
+
+    body = make_string_pool(strings) + package
+    return struct.pack('<HHII', _RES_TABLE_TYPE, 12, 12 + len(body), 1) + body
+
+
+def get_template_certificate():
+    """
+    :return: the DER encoded certificate and public key the template APK is signed with
+    """
+
+    with zipfile.ZipFile(TEMPLATE_APK) as template:
+        pkcs7 = cms.ContentInfo.load(template.read('META-INF/CERT.RSA'))
+
+    certificate = pkcs7['content']['certificates'][0].chosen
+    return certificate.dump(), certificate.public_key.dump()
+
+
+class _AxmlWriter(object):
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.chunks = []
+
+    def start_namespace(self, prefix, uri):
+        self._add_namespace_chunk(_RES_XML_START_NAMESPACE_TYPE, prefix, uri)
+
+    def end_namespace(self, prefix, uri):
+        self._add_namespace_chunk(_RES_XML_END_NAMESPACE_TYPE, prefix, uri)
+
+    def start_element(self, name, attributes):
+        body = struct.pack(
+            '<IIHHHHHH', _NO_INDEX, self._id(name), 0x14, 0x14, len(attributes), 0, 0, 0)
+        for (namespace, attribute, value) in attributes:
+            if isinstance(value, bool):
+                (raw, type_, data) = (_NO_INDEX, _TYPE_INT_BOOLEAN, 0xFFFFFFFF if value else 0)
+            elif isinstance(value, ResourceReference):
+                (raw, type_, data) = (_NO_INDEX, _TYPE_REFERENCE, value)
+            elif isinstance(value, int):
+                (raw, type_, data) = (_NO_INDEX, _TYPE_INT_DEC, value)
+            else:
+                (raw, type_, data) = (self._id(value), _TYPE_STRING, self._id(value))
+
+            body += struct.pack(
+                '<IIIHBBI',
+                self._id(namespace) if namespace else _NO_INDEX,
+                self._id(attribute),
+                raw,
+                8,
+                0,
+                type_,
+                data)
+
+        self._add_node_chunk(_RES_XML_START_ELEMENT_TYPE, body)
+
+    def end_element(self, name):
+        self._add_node_chunk(_RES_XML_END_ELEMENT_TYPE, struct.pack('<II', _NO_INDEX, self._id(name)))
+
+    def to_bytes(self):
+        body = make_string_pool(self.strings) + b''.join(self.chunks)
+        return struct.pack('<HHI', _RES_XML_TYPE, 8, 8 + len(body)) + body
+
+    def _add_namespace_chunk(self, type_, prefix, uri):
+        self._add_node_chunk(type_, struct.pack('<II', self._id(prefix), self._id(uri)))
+
+    def _add_node_chunk(self, type_, body):
+        # Every node starts with a line number and a comment
+        body = struct.pack('<II', len(self.chunks) + 1, _NO_INDEX) + body
+        self.chunks.append(struct.pack('<HHI', type_, 0x10, 8 + len(body)) + body)
+
+    def _id(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+
+def _make_signature_scheme_block(v3):
+    (certificate, public_key) = get_template_certificate()
+
+    digests = _length_prefixed(_length_prefixed(
+        struct.pack('<I', _SIGNATURE_ALGORITHM) + _length_prefixed(b'\x00' * 32)))
+    certificates = _length_prefixed(_length_prefixed(certificate))
+    sdk_versions = struct.pack('<II', 24, 0x7FFFFFFF) if v3 else b''
+    attributes = _length_prefixed(b'')
+
+    signed_data = digests + certificates + sdk_versions + attributes
+    signatures = _length_prefixed(_length_prefixed(
+        struct.pack('<I', _SIGNATURE_ALGORITHM) + _length_prefixed(b'\x00' * 256)))
+    signer = _length_prefixed(signed_data) + sdk_versions + signatures + \
+        _length_prefixed(public_key)
+
+    return _length_prefixed(_length_prefixed(signer))
+
+
+def _insert_signing_block(data: bytes, blocks: list):
+    pairs = b''.join(
+        struct.pack('<QI', len(value) + 4, key) + value for (key, value) in blocks)
+    size_of_block = len(pairs) + 8 + len(_APK_SIG_MAGIC)
+    signing_block = struct.pack('<Q', size_of_block) + pairs + \
+        struct.pack('<Q', size_of_block) + _APK_SIG_MAGIC
+
+    # The central directory moves back by the size of the block
+    eocd = data.rindex(b'PK\x05\x06')
+    (cd_size, cd_offset) = struct.unpack('<II', data[eocd + 12:eocd + 20])
+    eocd_record = data[eocd:eocd + 16] + \
+        struct.pack('<I', cd_offset + len(signing_block)) + data[eocd + 20:]
+
+    return data[:cd_offset] + signing_block + data[cd_offset:eocd] + eocd_record
+
+
+def _length_prefixed(data: bytes):
+    return struct.pack('<I', len(data)) + data
+
+
+def random_bytes(size, seed):
+    return random.Random(seed).getrandbits(8 * size).to_bytes(size, 'little') if size else b''
@@ -0,0 +1,313 @@
+"""
+Microbenchmarks of the APK parser over a corpus of generated APKs.
+
+Benchmarks are compared to a stored baseline and the run fails when one of them got slower than
+the baseline by more than the threshold. Timings depend on the machine so baselines aren't
+committed: record one on the machine that checks it, e.g. before a change, then compare to it
+after the change. With --memory, the peak memory and the number of memory blocks allocated by
+every benchmark are reported instead.
+
+    $ python -m tests.benchmarks.bench_apk_parsing --save-baseline
+    $ python -m tests.benchmarks.bench_apk_parsing
+    $ python -m tests.benchmarks.bench_apk_parsing --memory
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cli.internal.models.apkparsing.apk import APK
+from cli.internal.models.apkparsing.axml import ARSCHeader
+from cli.internal.models.apkparsing.axml import BuffHandle
+from cli.internal.models.apkparsing.axml import RES_STRING_POOL_TYPE
+from cli.internal.models.apkparsing.axml import StringBlock
+from cli.internal.utils.metrics import format_columns
+from tests.apks import get_string_resource_id
+from tests.apks import make_manifest
+from tests.apks import make_resources
+from tests.apks import make_signed_apk
+from tests.apks import make_string_pool
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'apk_parsing.json')
+# How much slower than the baseline a benchmark may get before failing, as a fraction
+DEFAULT_THRESHOLD = 0.25
+# Samples are made of enough iterations to take at least this many seconds, unless their setup
+# takes so long that a sample would take more than MAX_SAMPLE_TIME seconds overall
+MIN_SAMPLE_TIME = 0.05
+MAX_SAMPLE_TIME = 0.5
+
+# Name to manifest and APK options of every APK in the corpus. The resources option is the number
+# of strings in the APK's resources.arsc, which makes it about 100 bytes per string.
+CORPUS = {
+    'typical': (
+        {'permissions': 20, 'activities': 30},
+        {'entries': 200, 'size': 4 * 1024 ** 2, 'v2': True}),
+    'huge-manifest': (
+        {'permissions': 5000, 'activities': 5000},
+        {'entries': 200, 'size': 4 * 1024 ** 2, 'v2': True}),
+    'v1-v2-v3': (
+        {'permissions': 20, 'activities': 30},
+        {'entries': 200, 'size': 16 * 1024 ** 2, 'v2': True, 'v3': True}),
+    'many-entries': (
+        {'permissions': 20, 'activities': 30},
+        {'entries': 20000, 'size': 4 * 1024 ** 2, 'v2': True}),
+    'large': (
+        {'permissions': 20, 'activities': 30},
+        {'entries': 200, 'size': 64 * 1024 ** 2, 'v2': True, 'v3': True}),
+    'large-resources': (
+        {'permissions': 20, 'activities': 30, 'version_name': get_string_resource_id(0)},
+        {'entries': 200, 'resources': 200000, 'v2': True})
+}
+# Name to number of strings of every standalone string pool, as large as in resources.arsc files
+STRING_POOLS = {
+    'string-pool-10k': 10000,
+    'string-pool-100k': 100000
+}
+
+
+def make_corpus(dir):
+    """
+    :return: a dict of corpus name to APK path
+    """
+
+    corpus = {}
+    for (seed, (name, (manifest_options, apk_options))) in enumerate(CORPUS.items()):
+        package_name = 'com.bench.{}'.format(name.replace('-', '_'))
+        manifest = make_manifest(package_name, **manifest_options)
+
+        apk_options = dict(apk_options)
+        if 'resources' in apk_options:
+            strings = ['string value {}'.format(i) for i in range(apk_options['resources'])]
+            apk_options['resources'] = make_resources(package_name, {'': strings})
+
+        corpus[name] = make_signed_apk(
+            os.path.join(dir, name + '.apk'), manifest, seed=seed, **apk_options)
+    return corpus
+
+
+def get_benchmarks(corpus: dict):
+    """
+    :return: a dict of benchmark name to (setup, func) tuples where func is timed when called
+             with what setup returned
+    """
+
+    benchmarks = {}
+    for (name, path) in corpus.items():
+        benchmarks.update({
+            name + '/init': (lambda path=path: path, APK),
+            name + '/light_init': (lambda path=path: path, _light_analysis),
+            name + '/parse_v2_v3_signature': (
+                lambda path=path: APK(path, skip_analysis=True),
+                APK.parse_v2_v3_signature),
+            name + '/certificates': (
+                lambda path=path: _parsed_signatures(path),
+                _extract_certificates),
+            name + '/string_pool': (
+                lambda path=path: APK(path, skip_analysis=True).get_file('AndroidManifest.xml'),
+                _decode_string_pool),
+            name + '/version_name': (
+                lambda path=path: APK(path, light_analysis=True),
+                APK.get_androidversion_name)
+        })
+
+    for (name, count) in STRING_POOLS.items():
+        string_pool = make_string_pool(['string_{}'.format(i) for i in range(count)])
+        benchmarks.update({
+            name + '/init': (lambda string_pool=string_pool: string_pool, _read_string_pool),
+            name + '/decode': (
+                lambda string_pool=string_pool: _read_string_pool(string_pool), list)
+        })
+    return benchmarks
+
+
+def measure(setup, func, repeat=5):
+    """
+    :return: the seconds the fastest call to func took, excluding setup. Noise only ever makes
+             calls slower so the fastest one is the most reproducible.
+    """
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        timed = _sample(setup, func, number) * number
+        if timed >= MIN_SAMPLE_TIME or (time.perf_counter() - start) * 2 > MAX_SAMPLE_TIME:
+            break
+        number *= 2
+
+    return min(_sample(setup, func, number) for _ in range(repeat))
+
+
+def measure_memory(setup, func):
+    """
+    :return: a (peak bytes, allocated blocks) tuple for a call to func, excluding setup. Blocks
+             are those still allocated when func returns, including the ones in its result.
+    """
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        func(state)
+        (_, peak) = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+    return peak, blocks
+
+
+def compare(results: dict, baseline: dict, threshold):
+    """
+    :return: a list of (name, baseline seconds, seconds, regressed) tuples, with None baseline
+             seconds for benchmarks missing from the baseline
+    """
+
+    comparison = []
+    for (name, seconds) in results.items():
+        expected = baseline['benchmarks'].get(name)
+        if expected is None:
+            comparison.append((name, None, seconds, False))
+        else:
+            comparison.append((name, expected, seconds, seconds > expected * (1 + threshold)))
+    return comparison
+
+
+def format_table(comparison: list):
+    rows = [('benchmark', 'baseline', 'current', 'change')]
+    for (name, expected, seconds, regressed) in comparison:
+        if expected is None:
+            rows.append((name, '-', _format_time(seconds), 'new'))
+        else:
+            rows.append((
+                name,
+                _format_time(expected),
+                _format_time(seconds),
+                '{:+.0%}{}'.format(seconds / expected - 1, ' REGRESSED' if regressed else '')))
+
+    return format_columns(rows)
+
+
+def format_memory_table(results: dict):
+    rows = [('benchmark', 'peak', 'blocks')]
+    for (name, (peak, blocks)) in results.items():
+        rows.append((name, '{:.1f}KiB'.format(peak / 1024), str(blocks)))
+
+    return format_columns(rows)
+
+
+def _sample(setup, func, number):
+    total = 0
+    for _ in range(number):
+        state = setup()
+        start = time.perf_counter()
+        func(state)
+        total += time.perf_counter() - start
+    return total / number
+
+
+def _light_analysis(path):
+    return APK(path, light_analysis=True)
+
+
+def _parsed_signatures(path):
+    apk = APK(path, skip_analysis=True)
+    apk.parse_v2_v3_signature()
+    return apk
+
+
+def _extract_certificates(apk: APK):
+    certificates = [apk.get_certificate(name) for name in apk.get_signature_names()]
+    certificates.extend(apk.get_certificates_v2())
+    certificates.extend(apk.get_certificates_v3())
+    return certificates
+
+
+def _read_string_pool(string_pool: bytes):
+    buff = BuffHandle(string_pool)
+    return StringBlock(buff, ARSCHeader(buff, expected_type=RES_STRING_POOL_TYPE))
+
+
+def _decode_string_pool(manifest: bytes):
+    buff = BuffHandle(manifest)
+    ARSCHeader(buff)
+    strings = StringBlock(buff, ARSCHeader(buff, expected_type=RES_STRING_POOL_TYPE))
+    return list(strings)
+
+
+def _format_time(seconds):
+    return '{:.3f}ms'.format(seconds * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the APK parser.')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='baseline to compare to or save')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='record this run as the baseline instead of comparing to it')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='fraction by which benchmarks may regress, defaults to the '
+                             "baseline's or {}".format(DEFAULT_THRESHOLD))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of samples, the fastest is reported')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--memory', action='store_true',
+                        help='report peak memory and allocated blocks instead of timings')
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp()
+    try:
+        benchmarks = get_benchmarks(make_corpus(corpus_dir))
+
+        results = {}
+        for (name, (setup, func)) in benchmarks.items():
+            if args.filter in name:
+                if args.memory:
+                    results[name] = measure_memory(setup, func)
+                else:
+                    results[name] = measure(setup, func, args.repeat)
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    if args.memory:
+        print(format_memory_table(results))
+        return
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'threshold': (
+                    DEFAULT_THRESHOLD if args.threshold is None else args.threshold),
+                'benchmarks': results
+            }, f, indent=2, sort_keys=True)
+        print(format_table(compare(results, {'benchmarks': {}}, 0)))
+        print('\nSaved the baseline to {}.'.format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print(format_table(compare(results, {'benchmarks': {}}, 0)))
+        print('\nNo baseline to compare to, record one on this machine with --save-baseline.')
+        sys.exit(2)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    threshold = args.threshold
+    if threshold is None:
+        threshold = baseline.get('threshold', DEFAULT_THRESHOLD)
+
+    comparison = compare(results, baseline, threshold)
+    print(format_table(comparison))
+
+    regressions = [name for (name, _, _, regressed) in comparison if regressed]
+    if regressions:
+        print('\n{} benchmark{} regressed by more than {:.0%}.'.format(
+            len(regressions), '' if len(regressions) == 1 else 's', threshold))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Benchmarks `mason register project` on a generated project against a local fake Mason Platform.
+
+Every run registers the whole project on a fresh server and reports, per phase, the wall time,
+CPU time, bytes read and peak memory of the CLI. Phases are:
+
+- parse: parsing APKs, media and configs
+- hash: digesting files
+- resolve: looking up registered artifacts and their latest versions
+- upload: getting signed URLs and uploading files to them
+- register: registering uploaded artifacts
+- build: starting builds
+
+For example, to see how registration scales with the number of APKs:
+
+    $ python -m tests.benchmarks.bench_register_project --apks 100 --apk-size 8M
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from click.testing import CliRunner
+from mock import patch
+
+from cli.config import Config
+from cli.config import DEFAULT_MAX_WORKERS
+from cli.config import _manual_atexit_callbacks
+from cli.internal.apis.mason import MasonApi
+from cli.internal.models.apk import Apk
+from cli.internal.models.media import Media
+from cli.internal.models.os_config import OSConfig
+from cli.internal.utils import hashing
+from cli.internal.utils.constants import ENDPOINTS
+from cli.internal.utils.constants import SETTINGS
+from cli.internal.utils.hashing import DigestCache
+from cli.internal.utils.http_cache import RESPONSE_CACHE
+from cli.internal.utils.metrics import format_columns
+from cli.internal.utils.progress import format_bytes
+from cli.internal.utils.store import Store
+from cli.mason import cli
+from tests.benchmarks.harness import FIELDS
+from tests.benchmarks.harness import PhaseRecorder
+from tests.benchmarks.harness import fake_server_process
+from tests.benchmarks.harness import get_process_counters
+from tests.benchmarks.projects import make_project
+from tests.fake_server import ACCESS_TOKEN
+from tests.fake_server import ID_TOKEN
+
+PHASES = ('parse', 'hash', 'resolve', 'upload', 'register', 'build')
+
+HOOKS = (
+    ('parse', Apk, 'parse'),
+    ('parse', Media, 'parse'),
+    ('parse', OSConfig, 'parse'),
+    ('hash', hashing, '_compute_digests'),
+    ('resolve', MasonApi, 'get_artifact'),
+    ('resolve', MasonApi, 'get_latest_artifact'),
+    ('resolve', MasonApi, 'get_highest_artifact'),
+    ('upload', MasonApi, '_get_signed_url'),
+    ('upload', MasonApi, '_upload_to_signed_url'),
+    ('register', MasonApi, '_register_signed_url'),
+    ('build', MasonApi, 'start_build'),
+    ('build', MasonApi, 'get_build')
+)
+
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def run(project_dir, workers=None, settings: dict = None, **server_options):
+    """
+    Registers a project once on a fresh fake server.
+
+    :param workers: the number of threads of the CLI's executor, its default when None
+    :param settings: overrides of the settings store
+    :param server_options: passed on to the fake server
+    :return: a dict of phase name, and 'total' for the whole run, to a dict of the fields in
+             :data:`FIELDS`
+    """
+
+    state_dir = tempfile.mkdtemp()
+    workers = workers or DEFAULT_MAX_WORKERS
+    executor = ThreadPoolExecutor(workers)
+    try:
+        with fake_server_process(**server_options) as endpoints, \
+                patch.object(hashing, '_cache', DigestCache(
+                    Store('digest-cache', {'files': {}}, state_dir, False))), \
+                patch.object(RESPONSE_CACHE, 'dir', os.path.join(state_dir, 'response-cache')):
+            config = _make_config(state_dir, endpoints, settings, executor, workers)
+            return _measure(config, project_dir)
+    finally:
+        executor.shutdown()
+        _manual_atexit_callbacks.clear()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def summarize(runs: list):
+    """
+    :return: the median of every field of every phase across runs
+    """
+
+    return {
+        name: {field: statistics.median(run[name][field] for run in runs) for field in FIELDS}
+        for name in runs[0]
+    }
+
+
+def format_table(results: dict):
+    columns = ('phase',) + FIELDS
+    rows = [columns]
+    for name in PHASES + ('total',):
+        stats = results[name]
+        rows.append((
+            name,
+            str(int(stats['calls'])),
+            '{:.3f}s'.format(stats['wall']),
+            '{:.3f}s'.format(stats['cpu']),
+            format_bytes(stats['bytes_read']),
+            format_bytes(stats['peak_rss'])))
+
+    return format_columns(rows)
+
+
+def _make_config(state_dir, endpoints: dict, settings: dict, executor, workers):
+    auth_store = Store('auth', {}, state_dir, False)
+    auth_store['id_token'] = ID_TOKEN
+    auth_store['access_token'] = ACCESS_TOKEN
+
+    endpoints_store = Store('endpoints', dict(ENDPOINTS._defaults), state_dir, False)
+    for (key, value) in endpoints.items():
+        endpoints_store[key] = value
+    # Update checks would touch the real version check cache
+    endpoints_store['latest_version_url'] = None
+
+    settings_store = Store('settings', dict(SETTINGS._defaults, **(settings or {})),
+                           state_dir, False)
+
+    return Config(
+        auth_store=auth_store,
+        endpoints_store=endpoints_store,
+        settings_store=settings_store,
+        customer_store=Store('customer-cache', {'customer': None}, state_dir, False),
+        executor=executor,
+        max_workers=workers)
+
+
+def _measure(config: Config, project_dir):
+    recorder = PhaseRecorder()
+    (start_cpu, start_read) = get_process_counters()
+    start = time.monotonic()
+
+    with recorder.start().instrument(HOOKS):
+        result = CliRunner().invoke(
+            cli, ['register', '--assume-yes', 'project', project_dir], obj=config)
+
+    end = time.monotonic()
+    (end_cpu, end_read) = get_process_counters()
+    recorder.stop()
+
+    if result.exit_code != 0:
+        raise RuntimeError('Registering the project failed:\n{}'.format(result.output))
+
+    results = {name: dict.fromkeys(FIELDS, 0) for name in PHASES}
+    results.update(recorder.get_results())
+    results['total'] = {
+        'calls': 1,
+        'wall': end - start,
+        'cpu': end_cpu - start_cpu,
+        'bytes_read': end_read - start_read,
+        'peak_rss': recorder.peak_rss
+    }
+    return results
+
+
+def _parse_size(size):
+    multiplier = SIZE_SUFFIXES.get(size[-1:].upper())
+    if multiplier:
+        return int(float(size[:-1]) * multiplier)
+    return int(size)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark registering a generated project against a fake Mason Platform.')
+    parser.add_argument('--configs', type=int, default=4)
+    parser.add_argument('--apks', type=int, default=16)
+    parser.add_argument('--apk-size', type=_parse_size, default='4M',
+                        help='size of every APK, e.g. 512K or 8M')
+    parser.add_argument('--animations', type=int, default=2)
+    parser.add_argument('--splashes', type=int, default=2)
+    parser.add_argument('--media-size', type=_parse_size, default='1M',
+                        help='size of every boot animation and splash screen')
+    parser.add_argument('--project', help='benchmark an existing project instead')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="threads of the CLI's executor, its default by default")
+    parser.add_argument('--upload-mode', choices=('single', 'resumable', 'multipart'),
+                        default=SETTINGS._defaults['upload_mode'])
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds every request to the server is delayed by')
+    parser.add_argument('--bandwidth', type=_parse_size, default=None,
+                        help='bytes per second each connection to the server is throttled to')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs, medians are reported')
+    parser.add_argument('--json', help='also write every run and the medians to this file')
+    args = parser.parse_args()
+
+    project_dir = args.project
+    if not project_dir:
+        project_dir = make_project(
+            tempfile.mkdtemp(),
+            args.configs,
+            args.apks,
+            args.apk_size,
+            args.animations,
+            args.splashes,
+            args.media_size)
+
+    try:
+        runs = []
+        for num in range(args.repeat):
+            runs.append(run(
+                project_dir,
+                args.workers,
+                {'upload_mode': args.upload_mode},
+                latency=args.latency,
+                bandwidth=args.bandwidth))
+            print('Run {}/{} took {:.2f}s.'.format(
+                num + 1, args.repeat, runs[-1]['total']['wall']), flush=True)
+    finally:
+        if not args.project:
+            shutil.rmtree(project_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    print()
+    print(format_table(summary))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'parameters': vars(args), 'runs': runs, 'median': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import contextlib
+import functools
+import inspect
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from threading import Lock
+
+from mock import patch
+
+from tests.fake_server import FakeMasonServer
+
+# Fields recorded for every phase:
+# - calls: how many times the phase was entered
+# - wall: seconds during which at least one thread was in the phase
+# - cpu: CPU seconds spent by threads in the phase
+# - bytes_read: bytes read by threads in the phase, from files and sockets alike
+# - peak_rss: the largest resident set size sampled while the phase was running
+FIELDS = ('calls', 'wall', 'cpu', 'bytes_read', 'peak_rss')
+
+# Seconds to wait for a fake server process to start listening.
+SERVER_START_TIMEOUT = 30
+
+
+class PhaseRecorder(object):
+    """
+    Attributes wall time, CPU time, bytes read and peak memory of a run to phases.
+
+    Phases nest per thread and only the innermost one is charged, e.g. hashing done while
+    uploading counts as hashing. Wall time is the time at least one thread spent in a phase so
+    phases running concurrently on an executor overlap instead of adding up. Memory is sampled
+    in the background every `sample_interval` seconds.
+    """
+
+    def __init__(self, sample_interval=0.01):
+        self.sample_interval = sample_interval
+        self.lock = Lock()
+        self.phases = {}
+        self.peak_rss = 0
+
+        self._active = {}
+        self._active_since = {}
+        self._local = threading.local()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._stopped.clear()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+        self._record_rss(get_rss())
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._get_stack()
+        counters = get_thread_counters()
+        with self.lock:
+            if stack:
+                self._charge(stack[-1], counters)
+                self._deactivate(stack[-1][0])
+            stack.append([name, counters])
+            self._get_stats(name)['calls'] += 1
+            self._activate(name)
+
+        try:
+            yield
+        finally:
+            counters = get_thread_counters()
+            with self.lock:
+                self._charge(stack.pop(), counters)
+                self._deactivate(name)
+                if stack:
+                    stack[-1][1] = counters
+                    self._activate(stack[-1][0])
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    @contextlib.contextmanager
+    def instrument(self, hooks):
+        """
+        Records calls to functions as phases while in the context.
+
+        :param hooks: (phase, owner, attribute) tuples where owner is the class or module the
+                      function is looked up on
+        """
+
+        with contextlib.ExitStack() as stack:
+            for (name, owner, attribute) in hooks:
+                original = inspect.getattr_static(owner, attribute)
+                if isinstance(original, staticmethod):
+                    replacement = staticmethod(self.wrap(name, original.__func__))
+                else:
+                    replacement = self.wrap(name, original)
+                stack.enter_context(patch.object(owner, attribute, replacement))
+
+            yield self
+
+    def get_results(self):
+        """
+        :return: a dict of phase name to a dict of the fields in FIELDS
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            results = {}
+            for (name, stats) in self.phases.items():
+                results[name] = dict(stats)
+                if self._active.get(name):
+                    results[name]['wall'] += now - self._active_since[name]
+            return results
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _get_stats(self, name):
+        stats = self.phases.get(name)
+        if not stats:
+            stats = self.phases[name] = dict.fromkeys(FIELDS, 0)
+        return stats
+
+    def _charge(self, frame, counters):
+        (name, since) = frame
+        stats = self._get_stats(name)
+        stats['cpu'] += counters[0] - since[0]
+        stats['bytes_read'] += counters[1] - since[1]
+
+    def _activate(self, name):
+        if not self._active.get(name):
+            self._active_since[name] = time.monotonic()
+        self._active[name] = self._active.get(name, 0) + 1
+
+    def _deactivate(self, name):
+        self._active[name] -= 1
+        if not self._active[name]:
+            self._get_stats(name)['wall'] += time.monotonic() - self._active_since[name]
+
+    def _sample(self):
+        while not self._stopped.wait(self.sample_interval):
+            self._record_rss(get_rss())
+
+    def _record_rss(self, rss):
+        with self.lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            for (name, count) in self._active.items():
+                if count:
+                    stats = self._get_stats(name)
+                    stats['peak_rss'] = max(stats['peak_rss'], rss)
+
+
+def get_thread_counters():
+    """
+    :return: the CPU seconds used and bytes read by the calling thread so far
+    """
+
+    return time.thread_time(), _read_io_counter('/proc/thread-self/io')
+
+
+def get_process_counters():
+    """
+    :return: the CPU seconds used and bytes read by this process so far
+    """
+
+    return time.process_time(), _read_io_counter('/proc/self/io')
+
+
+def get_rss():
+    """
+    :return: the resident set size of this process in bytes
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # Not Linux, fall back to the high water mark which is in KB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == 'Darwin' else rss * 1024
+
+
+def _read_io_counter(path):
+    # rchar counts everything read through syscalls, page cache hits and sockets included, which
+    # is what the CLI actually has to chew through.
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+@contextlib.contextmanager
+def fake_server_process(**options):
+    """
+    Runs a :class:`FakeMasonServer` in a child process so neither its CPU time nor its memory,
+    which holds every uploaded object, count towards the measurements.
+
+    :param options: passed on to the server's constructor
+    :return: the endpoints store entries pointing at the server
+    """
+
+    context = multiprocessing.get_context('spawn')
+    (receiver, sender) = context.Pipe(duplex=False)
+    process = context.Process(target=_serve, args=(options, sender), daemon=True)
+    process.start()
+
+    try:
+        if not receiver.poll(SERVER_START_TIMEOUT):
+            raise RuntimeError('The fake server did not start in time.')
+        yield receiver.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _serve(options, connection):
+    server = FakeMasonServer(**options)
+    connection.send(server.endpoints())
+    server._server.serve_forever()
@@ -0,0 +1,110 @@
+import json
+import os
+import zipfile
+
+import yaml
+
+from tests.apks import TEMPLATE_APK
+from tests.apks import random_bytes
+
+# Synthetic APKs are copies of the template APK with this package name swapped out.
+TEMPLATE_PACKAGE = 'com.supercilex.test'
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def make_apk(path, package_name, size=0, seed=0):
+    """
+    Writes a signed APK.
+
+    :param package_name: must be as long as TEMPLATE_PACKAGE so the manifest's layout is kept
+    :param size: pads the APK with incompressible data up to roughly this many bytes
+    """
+
+    if len(package_name) != len(TEMPLATE_PACKAGE):
+        raise ValueError('Package names must be {} characters long: {}'.format(
+            len(TEMPLATE_PACKAGE), package_name))
+
+    with zipfile.ZipFile(TEMPLATE_APK) as template, zipfile.ZipFile(path, 'w') as apk:
+        for info in template.infolist():
+            data = template.read(info)
+            if info.filename == 'AndroidManifest.xml':
+                data = data.replace(
+                    TEMPLATE_PACKAGE.encode('utf-16-le'), package_name.encode('utf-16-le'))
+            apk.writestr(info, data)
+
+        padding = size - os.path.getsize(TEMPLATE_APK)
+        if padding > 0:
+            apk.writestr('assets/padding.bin', random_bytes(padding, seed))
+
+    return path
+
+
+def make_boot_animation(path, size=0, seed=0):
+    with zipfile.ZipFile(path, 'w') as animation:
+        animation.writestr('desc.txt', '1080 1920 30\np 0 0 part0\n')
+        animation.writestr('part0/00000.png', PNG_HEADER + random_bytes(size, seed))
+
+    return path
+
+
+def make_splash(path, size=0, seed=0):
+    with open(path, 'wb') as f:
+        f.write(PNG_HEADER + random_bytes(size, seed))
+
+    return path
+
+
+def make_project(dir, configs=1, apks=1, apk_size=0, animations=1, splashes=1, media_size=0):
+    """
+    Writes a project with a .masonrc pointing at generated configs, APKs, boot animations and
+    splash screens. Every config uses every APK and one of the boot animations and splashes.
+
+    :return: the project directory
+    """
+
+    for sub_dir in ('configs', 'apps', 'media'):
+        os.makedirs(os.path.join(dir, sub_dir), exist_ok=True)
+
+    package_names = ['com.bench.app{:06d}'.format(i) for i in range(apks)]
+    for (i, package_name) in enumerate(package_names):
+        make_apk(os.path.join(dir, 'apps', '{}.apk'.format(package_name)), package_name,
+                 apk_size, seed=i)
+
+    context = {'configs': ['configs'], 'apps': ['apps'], 'bootanimations': [], 'splashes': []}
+    for i in range(animations):
+        file = 'media/anim-{}.zip'.format(i)
+        make_boot_animation(os.path.join(dir, file), media_size, seed=apks + i)
+        context['bootanimations'].append({'name': 'bench-anim-{}'.format(i), 'file': file})
+    for i in range(splashes):
+        file = 'media/splash-{}.png'.format(i)
+        make_splash(os.path.join(dir, file), media_size, seed=apks + animations + i)
+        context['splashes'].append({'name': 'bench-splash-{}'.format(i), 'file': file})
+
+    for i in range(configs):
+        config = {
+            'os': {
+                'name': 'bench-project-{}'.format(i),
+                'version': 'latest',
+                'configurations': {'mason-management': {'disable_keyguard': True}}
+            },
+            'apps': [{'name': name, 'package_name': name} for name in package_names]
+        }
+
+        media = {}
+        if animations:
+            media['bootanimation'] = {
+                'name': context['bootanimations'][i % animations]['name'], 'version': 'latest'}
+        if splashes:
+            media['splash'] = {
+                'name': context['splashes'][i % splashes]['name'], 'version': 'latest'}
+        if media:
+            config['media'] = media
+
+        with open(os.path.join(dir, 'configs', 'config-{}.yml'.format(i)), 'w') as f:
+            f.write(yaml.safe_dump(config))
+
+    with open(os.path.join(dir, '.masonrc'), 'w') as f:
+        json.dump(context, f, indent=2)
+
+    return dir
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cli.internal.models.apkparsing.apk import APK
+from tests.apks import make_manifest
+from tests.apks import make_signed_apk
+from tests.benchmarks import bench_apk_parsing
+
+
+class SyntheticApkTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test__make_manifest__manifest_is_parsed(self):
+        manifest = make_manifest('com.example.app', 42, '4.2', 23, permissions=3, activities=2)
+        apk_file = make_signed_apk(os.path.join(self.dir, 'app.apk'), manifest)
+
+        apk = APK(apk_file)
+
+        self.assertTrue(apk.is_valid_APK())
+        self.assertEqual(apk.get_package(), 'com.example.app')
+        self.assertEqual(apk.get_androidversion_code(), '42')
+        self.assertEqual(apk.get_androidversion_name(), '4.2')
+        self.assertEqual(apk.get_min_sdk_version(), '23')
+        self.assertEqual(len(apk.permissions), 3)
+        self.assertEqual(len(apk.get_activities()), 2)
+
+    def test__make_signed_apk__signing_blocks_are_parsed(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'), make_manifest('com.example.app'),
+            v1=False, v2=True, v3=True)
+
+        apk = APK(apk_file)
+
+        self.assertFalse(apk.is_signed_v1())
+        self.assertTrue(apk.is_signed_v2())
+        self.assertTrue(apk.is_signed_v3())
+        self.assertEqual(
+            apk.get_certificates_v2()[0].subject.native['common_name'], 'Alexandre Saveau')
+        self.assertEqual(apk.get_certificates_der_v3(), apk.get_certificates_der_v2())
+
+    def test__make_signed_apk__apk_is_padded_with_entries(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'), make_manifest('com.example.app'),
+            entries=100, size=256 * 1024)
+
+        apk = APK(apk_file)
+
+        self.assertEqual(len(apk.get_files()), 1 + 3 + 100 + 1)
+        self.assertGreaterEqual(os.path.getsize(apk_file), 256 * 1024)
+
+
+class ApkParsingBenchmarkTest(unittest.TestCase):
+    def test__compare__slower_benchmarks_regress(self):
+        baseline = {'benchmarks': {'fast': 1.0, 'slow': 1.0}}
+
+        comparison = bench_apk_parsing.compare(
+            {'fast': 1.1, 'slow': 1.5, 'new': 1.0}, baseline, 0.25)
+
+        self.assertEqual(comparison, [
+            ('fast', 1.0, 1.1, False),
+            ('slow', 1.0, 1.5, True),
+            ('new', None, 1.0, False)
+        ])
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import MagicMock
+
+from cli.internal.models.apk import Apk
+from tests.benchmarks import bench_register_project
+from tests.benchmarks.harness import PhaseRecorder
+from tests.benchmarks.projects import make_apk
+from tests.benchmarks.projects import make_project
+
+
+class PhaseRecorderTest(unittest.TestCase):
+    def test__phase__only_innermost_phase_is_charged(self):
+        recorder = PhaseRecorder()
+        file = tempfile.NamedTemporaryFile(delete=False)
+        file.write(b'a' * 1000)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+
+        with recorder.phase('outer'):
+            with recorder.phase('inner'):
+                with open(file.name, 'rb') as f:
+                    f.read()
+
+        results = recorder.get_results()
+        self.assertEqual(results['outer']['calls'], 1)
+        self.assertEqual(results['inner']['calls'], 1)
+        self.assertGreaterEqual(results['inner']['bytes_read'], 1000)
+        self.assertLess(results['outer']['bytes_read'], 1000)
+
+    def test__phase__concurrent_wall_time_overlaps(self):
+        recorder = PhaseRecorder()
+        barrier = threading.Barrier(4)
+        release = threading.Event()
+
+        def work():
+            with recorder.phase('work'):
+                barrier.wait()
+                release.wait(0.1)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results = recorder.get_results()
+        self.assertEqual(results['work']['calls'], 4)
+        self.assertLess(results['work']['wall'], 0.4)
+
+    def test__instrument__static_methods_are_recorded(self):
+        recorder = PhaseRecorder()
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        apk_file = make_apk(os.path.join(dir, 'app.apk'), 'com.bench.app000000', 64 * 1024)
+
+        with recorder.instrument([('parse', Apk, 'parse')]):
+            apk = Apk.parse(MagicMock(), apk_file)
+
+        self.assertEqual(apk.get_name(), 'com.bench.app000000')
+        self.assertEqual(recorder.get_results()['parse']['calls'], 1)
+        self.assertGreaterEqual(os.path.getsize(apk_file), 64 * 1024)
+
+
+class RegisterProjectBenchmarkTest(unittest.TestCase):
+    def test__run__every_phase_is_measured(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        project_dir = make_project(dir, configs=2, apks=3, apk_size=64 * 1024, media_size=1024)
+
+        results = bench_register_project.run(project_dir, workers=4)
+
+        for phase in bench_register_project.PHASES:
+            self.assertGreater(results[phase]['calls'], 0, phase)
+        # A signed URL and an upload for each APK, media file and config
+        self.assertEqual(results['upload']['calls'], 2 * (3 + 1 + 1 + 2))
+        self.assertGreater(results['total']['peak_rss'], 0)
@@ -0,0 +1,31 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cli.internal.utils import hashing
+from cli.internal.utils.hashing import DigestCache
+from cli.internal.utils.http_cache import RESPONSE_CACHE
+from cli.internal.utils.store import Store
+
+
+def isolate_caches(test: unittest.TestCase):
+    """
+    Points the digest and response caches the CLI shares between commands at a temp dir for the
+    duration of a test, so it neither reads nor writes the ones in the user's config dir.
+    :return: the temp dir, removed after the test
+    """
+
+    dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, dir, True)
+
+    for patcher in (
+        patch.object(hashing, '_cache', DigestCache(
+            Store('digest-cache', {'files': {}}, dir, False))),
+        patch.object(RESPONSE_CACHE, 'dir', os.path.join(dir, 'response-cache'))
+    ):
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return dir
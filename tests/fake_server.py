@@ -0,0 +1,650 @@
+import argparse
+import base64
+import datetime
+import hashlib
+import itertools
+import json
+import random
+import re
+import socket
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+CUSTOMER = 'mason-test'
+ID_TOKEN = 'fake-id-token'
+ACCESS_TOKEN = 'fake-access-token'
+
+
+class FakeMasonServer(object):
+    """
+    A local stand-in for the Mason Platform which keeps everything in memory.
+
+    It serves every endpoint in ENDPOINTS: login, user info, projects, signed URLs, the registry,
+    the builder and deployments. Signed URLs handed out by the server point back at it under
+    /upload/ where plain PUT uploads, resumable upload sessions and multipart uploads are
+    supported. Registry version lists honour ETags as well as the sort and limit parameters.
+
+    Latency, bandwidth and errors can be injected to exercise recovery paths or benchmark the CLI
+    under realistic conditions. Use :meth:`configure` to point an endpoints store at the server.
+    """
+
+    def __init__(
+        self,
+        port=0,
+        latency=0,
+        bandwidth=None,
+        error_rate=0,
+        error_status=503,
+        build_time=0,
+        seed=0
+    ):
+        """
+        :param port: the port to listen on, a free one is picked by default
+        :param latency: seconds every request is delayed by before being handled
+        :param bandwidth: bytes per second each connection's bodies are throttled to
+        :param error_rate: the fraction of requests which fail with `error_status`
+        :param error_status: the status injected errors respond with
+        :param build_time: seconds builds take to complete
+        :param seed: seeds injected errors so runs are reproducible
+        """
+
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.build_time = build_time
+        self.latest_cli_version = '0.0.0'
+
+        self.objects = {}
+        self.sessions = {}
+        self.multipart_uploads = {}
+        self.artifacts = {}
+        self.builds = {}
+        self.deployments = []
+        self.projects = []
+        self.requests = []
+
+        # Byte counts after which the next upload requests will have their connection dropped
+        self.upload_drops = []
+        # Statuses the next requests whose path starts with the given prefix will fail with, as
+        # (status, prefix) tuples
+        self.failures = []
+
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(self))
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_port)
+
+    def signed_url(self, path):
+        return '{}/upload/{}?signature=fake'.format(self.url, path.strip('/'))
+
+    def endpoints(self):
+        """
+        :return: the endpoints store entries pointing the CLI at this server
+        """
+
+        return {
+            'auth_url': self.url + '/oauth/ro',
+            'user_info_url': self.url + '/userinfo',
+            'platform_url_base': self.url,
+            'api_url_base': self.url + '/api',
+            'latest_version_url': self.url + '/VERSION',
+            'analytics_url': None,
+            # Overrides of the full URLs would bypass the server
+            'projects_url': None,
+            'registry_signed_url': None,
+            'registry_artifact_url': None,
+            'builder_url': None,
+            'deploy_url': None
+        }
+
+    def configure(self, endpoints_store):
+        for (key, value) in self.endpoints().items():
+            endpoints_store[key] = value
+
+    def fail_next(self, status, count=1, prefix='/'):
+        with self.lock:
+            self.failures.extend([(status, prefix)] * count)
+
+    def add_artifact(self, type, name, version, **fields):
+        """
+        Registers an artifact directly, as if it had been uploaded earlier.
+        """
+
+        entry = dict(fields, type=type, name=name, version=str(version))
+        entry.setdefault('customer', CUSTOMER)
+        entry.setdefault('createdAt', _now())
+        with self.lock:
+            self.artifacts.setdefault((type, name), []).append(entry)
+        return entry
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _make_handler(server: FakeMasonServer):
+    api_routes = [
+        ('GET', r'/api/dashboard/projects/([^/]+)', '_get_projects'),
+        ('GET', r'/api/registry/signedurl/([^/]+)/([^/]+)/([^/]+)', '_get_signed_url'),
+        ('POST', r'/api/registry/artifacts/([^/]+)', '_register_artifact'),
+        ('GET', r'/api/registry/artifacts/([^/]+)/([^/]+)/([^/]+)', '_get_artifact_versions'),
+        ('GET', r'/api/registry/artifacts/([^/]+)/([^/]+)/([^/]+)/([^/]+)', '_get_artifact'),
+        ('POST', r'/api/tracker/builder/([^/]+)/jobs', '_start_build'),
+        ('GET', r'/api/tracker/builder/([^/]+)/jobs/([^/]+)', '_get_build'),
+        ('POST', r'/api/deploy', '_deploy')
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._handle()
+
+        def do_POST(self):
+            self._handle()
+
+        def do_PUT(self):
+            self._handle()
+
+        def do_DELETE(self):
+            self._handle()
+
+        def _handle(self):
+            self._record()
+            if server.latency:
+                time.sleep(server.latency)
+
+            status = self._get_injected_error()
+            if status:
+                self._respond_json(status, {'error': 'Injected', 'details': 'Injected failure'})
+                return
+
+            url = urlparse(self.path)
+            self.query = parse_qs(url.query, keep_blank_values=True)
+            path = url.path
+
+            if path.startswith('/upload/'):
+                self._handle_upload(path[len('/upload/'):])
+            elif path.startswith('/session/') and self.command == 'PUT':
+                self._put_session(path[len('/session/'):])
+            elif path == '/oauth/ro' and self.command == 'POST':
+                self._login()
+            elif path == '/userinfo' and self.command == 'GET':
+                self._get_user_info()
+            elif path == '/VERSION' and self.command == 'GET':
+                self._respond(200, server.latest_cli_version.encode('utf-8'))
+            else:
+                self._handle_api(path)
+
+        def _handle_upload(self, name):
+            if self.command == 'POST' and self.headers.get('x-goog-resumable') == 'start':
+                self._start_session(name)
+            elif self.command == 'POST' and 'uploads' in self.query:
+                self._start_multipart_upload(name)
+            elif self.command == 'POST' and 'uploadId' in self.query:
+                self._complete_multipart_upload(self.query['uploadId'][0])
+            elif self.command == 'PUT' and 'uploadId' in self.query:
+                self._put_part(self.query['uploadId'][0], int(self.query['partNumber'][0]))
+            elif self.command == 'PUT':
+                self._put_object(name)
+            elif self.command == 'DELETE':
+                self._abort_multipart_upload((self.query.get('uploadId') or [''])[0])
+            else:
+                self._respond(404)
+
+        def _handle_api(self, path):
+            for (method, pattern, handler) in api_routes:
+                match = re.fullmatch(pattern, path)
+                if method == self.command and match:
+                    break
+            else:
+                self._respond(404)
+                return
+
+            if self.headers.get('Authorization') != 'Bearer {}'.format(ID_TOKEN):
+                self._respond_json(401, {'error': 'Unauthorized', 'details': 'Bad token'})
+                return
+
+            getattr(self, handler)(*match.groups())
+
+        # Auth
+
+        def _login(self):
+            self._read_body()
+            self._respond_json(200, {'id_token': ID_TOKEN, 'access_token': ACCESS_TOKEN})
+
+        def _get_user_info(self):
+            if self.headers.get('Authorization') != 'Bearer {}'.format(ACCESS_TOKEN):
+                self._respond_json(401, {'error': 'Unauthorized', 'details': 'Bad token'})
+                return
+
+            self._respond_json(200, {'user_metadata': {'clients': [CUSTOMER]}})
+
+        # Platform API
+
+        def _get_projects(self, customer):
+            self._respond_json(200, server.projects)
+
+        def _get_signed_url(self, customer, name, version):
+            path = '{}/{}/{}/{}'.format(customer, (self.query.get('type') or [''])[0], name, version)
+            signed_url = {
+                'signed_request': server.signed_url(path),
+                'url': '{}/upload/{}'.format(server.url, path)
+            }
+            upload_mode = (self.query.get('uploadMode') or [None])[0]
+            if upload_mode in ('resumable', 'multipart'):
+                signed_url['upload_mode'] = upload_mode
+            self._respond_json(200, signed_url)
+
+        def _register_artifact(self, customer):
+            payload = self._read_json()
+            if payload is None:
+                return
+
+            key = (payload.get('type'), payload.get('name'))
+            with server.lock:
+                versions = server.artifacts.setdefault(key, [])
+                if any(v['version'] == payload.get('version') for v in versions):
+                    conflict = True
+                else:
+                    conflict = False
+                    data = server.objects.get(urlparse(payload.get('url', '')).path[8:])
+
+            if conflict:
+                self._respond_json(400, {
+                    'error': 'Conflict',
+                    'details': 'Artifact already exists'
+                })
+                return
+
+            sha1 = (payload.get('checksum') or {}).get('sha1')
+            if data is None or hashlib.sha1(data).hexdigest() != sha1:
+                self._respond_json(400, {
+                    'error': 'Bad Request',
+                    'details': 'Uploaded file is missing or its checksum does not match'
+                })
+                return
+
+            entry = dict(payload, createdAt=_now())
+            with server.lock:
+                versions.append(entry)
+            self._respond_json(200, entry)
+
+        def _get_artifact_versions(self, customer, type, name):
+            with server.lock:
+                versions = list(server.artifacts.get((type, name)) or [])
+
+            sort = (self.query.get('sort') or [None])[0]
+            if sort:
+                field = sort.lstrip('-')
+                key = (lambda v: int(v[field])) if field == 'version' else (lambda v: v[field])
+                versions.sort(key=key, reverse=sort.startswith('-'))
+            limit = (self.query.get('limit') or [None])[0]
+            if limit:
+                versions = versions[:int(limit)]
+
+            self._respond_json(200, versions, conditional=True)
+
+        def _get_artifact(self, customer, type, name, version):
+            with server.lock:
+                versions = server.artifacts.get((type, name)) or []
+                entry = next((v for v in versions if v['version'] == version), None)
+
+            if entry:
+                self._respond_json(200, entry, conditional=True)
+            else:
+                self._respond_json(404, {'error': 'Not Found', 'details': 'No such artifact'})
+
+        def _start_build(self, customer):
+            payload = self._read_json()
+            if payload is None:
+                return
+
+            with server.lock:
+                build_id = str(next(server._ids))
+                server.builds[build_id] = {
+                    'submittedAt': build_id,
+                    'project': payload.get('project'),
+                    'version': payload.get('version'),
+                    'completes_at': time.monotonic() + server.build_time
+                }
+
+            self._respond_json(200, {'data': {'submittedAt': build_id, 'status': 'QUEUED'}})
+
+        def _get_build(self, customer, build_id):
+            build = server.builds.get(build_id)
+            if not build:
+                self._respond_json(404, {'error': 'Not Found', 'details': 'No such build'})
+                return
+
+            done = time.monotonic() >= build['completes_at']
+            self._respond_json(200, {'data': {
+                'submittedAt': build_id,
+                'status': 'COMPLETED' if done else 'STARTED'
+            }})
+
+        def _deploy(self):
+            payload = self._read_json()
+            if payload is None:
+                return
+
+            key = self.headers.get('Idempotency-Key')
+            with server.lock:
+                # Retried requests carry the same key and mustn't deploy twice.
+                if not key or all(d['key'] != key for d in server.deployments):
+                    server.deployments.append({'key': key, 'payload': payload})
+
+            self._respond_json(200, {})
+
+        # Uploads
+
+        def _start_session(self, name):
+            self._read_body()
+
+            with server.lock:
+                session_id = str(next(server._ids))
+                server.sessions[session_id] = {
+                    'name': name,
+                    'md5': self.headers.get('Content-MD5'),
+                    'data': bytearray(),
+                    'done': False
+                }
+
+            self._respond(201, headers={'Location': '{}/session/{}'.format(server.url, session_id)})
+
+        def _put_object(self, name):
+            data = self._read_body()
+            if data is None:
+                return
+            if not _md5_matches(self.headers.get('Content-MD5'), data):
+                self._respond(400, b'BadDigest')
+                return
+
+            with server.lock:
+                server.objects[name] = bytes(data)
+            self._respond(200)
+
+        def _put_session(self, session_id):
+            session = server.sessions.get(session_id)
+            if not session:
+                self._respond(404)
+                return
+
+            match = re.match(r'bytes (\*|(\d+)-(\d+))/(\d+)', self.headers.get('Content-Range', ''))
+            if not match:
+                self._respond(400)
+                return
+
+            total = int(match.group(4))
+            if match.group(1) != '*':
+                start = int(match.group(2))
+                if start != len(session['data']):
+                    self._respond(400, b'Unexpected offset')
+                    return
+
+                data = self._read_body(session['data'])
+                if data is None:
+                    return
+
+            if not session['done'] and len(session['data']) == total:
+                if not _md5_matches(session['md5'], session['data']):
+                    self._respond(400, b'BadDigest')
+                    return
+
+                with server.lock:
+                    session['done'] = True
+                    server.objects[session['name']] = bytes(session['data'])
+
+            if session['done']:
+                self._respond(200)
+            elif session['data']:
+                self._respond(308, headers={'Range': 'bytes=0-{}'.format(len(session['data']) - 1)})
+            else:
+                self._respond(308)
+
+        def _start_multipart_upload(self, name):
+            self._read_body()
+
+            with server.lock:
+                upload_id = str(next(server._ids))
+                server.multipart_uploads[upload_id] = {
+                    'name': name,
+                    'md5': self.headers.get('Content-MD5'),
+                    'parts': {}
+                }
+
+            self._respond(200, _xml('InitiateMultipartUploadResult', UploadId=upload_id))
+
+        def _put_part(self, upload_id, part_number):
+            upload = server.multipart_uploads.get(upload_id)
+            if not upload:
+                self._respond(404)
+                return
+
+            data = self._read_body()
+            if data is None:
+                return
+            if not _md5_matches(self.headers.get('Content-MD5'), data):
+                self._respond(400, b'BadDigest')
+                return
+
+            with server.lock:
+                upload['parts'][part_number] = bytes(data)
+            self._respond(200, headers={'ETag': '"{}"'.format(hashlib.md5(data).hexdigest())})
+
+        def _complete_multipart_upload(self, upload_id):
+            upload = server.multipart_uploads.get(upload_id)
+            body = self._read_body()
+            if not upload or body is None:
+                self._respond(404)
+                return
+
+            numbers = [int(e.text) for e in ElementTree.fromstring(body).iter('PartNumber')]
+            if any(number not in upload['parts'] for number in numbers):
+                self._respond(400, b'InvalidPart')
+                return
+
+            data = b''.join(upload['parts'][number] for number in numbers)
+            if not _md5_matches(upload['md5'], data):
+                self._respond(400, b'BadDigest')
+                return
+
+            part_md5s = b''.join(hashlib.md5(upload['parts'][number]).digest()
+                                 for number in numbers)
+            etag = '"{}-{}"'.format(hashlib.md5(part_md5s).hexdigest(), len(numbers))
+            with server.lock:
+                server.objects[upload['name']] = data
+                server.multipart_uploads.pop(upload_id, None)
+
+            self._respond(200, _xml('CompleteMultipartUploadResult', ETag=etag))
+
+        def _abort_multipart_upload(self, upload_id):
+            with server.lock:
+                upload = server.multipart_uploads.pop(upload_id, None)
+            self._respond(204 if upload else 404)
+
+        # Plumbing
+
+        def _get_injected_error(self):
+            with server.lock:
+                for (i, (status, prefix)) in enumerate(server.failures):
+                    if self.path.startswith(prefix):
+                        del server.failures[i]
+                        return status
+
+                if server.error_rate and server._random.random() < server.error_rate:
+                    return server.error_status
+
+        def _read_json(self):
+            body = self._read_body()
+            try:
+                return json.loads(bytes(body or b'{}').decode('utf-8'))
+            except ValueError:
+                self._respond_json(400, {'error': 'Bad Request', 'details': 'Malformed JSON'})
+                return None
+
+        def _read_body(self, into=None):
+            into = bytearray() if into is None else into
+            remaining = int(self.headers.get('Content-Length') or 0)
+
+            drop_after = None
+            if remaining and self.command == 'PUT':
+                with server.lock:
+                    drop_after = server.upload_drops.pop(0) if server.upload_drops else None
+
+            while remaining:
+                if drop_after is not None and drop_after <= 0:
+                    self._drop_connection()
+                    return None
+
+                size = min(remaining, 64 * 1024)
+                if drop_after is not None:
+                    size = min(size, drop_after)
+                    drop_after -= size
+
+                chunk = self.rfile.read(size)
+                if not chunk:
+                    return None
+                into.extend(chunk)
+                remaining -= len(chunk)
+                self._throttle(len(chunk))
+
+            return into
+
+        def _drop_connection(self):
+            self.close_connection = True
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+        def _throttle(self, num_bytes):
+            if server.bandwidth:
+                time.sleep(num_bytes / server.bandwidth)
+
+        def _record(self):
+            with server.lock:
+                server.requests.append((self.command, self.path, dict(self.headers)))
+
+        def _respond_json(self, status, payload, conditional=False):
+            body = json.dumps(payload).encode('utf-8')
+            if not conditional or status != 200:
+                self._respond(status, body, {'Content-Type': 'application/json'})
+                return
+
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            if self.headers.get('If-None-Match') == etag:
+                self._respond(304, headers={'ETag': etag})
+            else:
+                self._respond(200, body, {'Content-Type': 'application/json', 'ETag': etag})
+
+        def _respond(self, status, body=b'', headers=None):
+            if status >= 400:
+                # The request body might not have been read, so the connection can't be reused.
+                self.close_connection = True
+
+            self.send_response(status)
+            for (key, value) in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+
+            for offset in range(0, len(body), 64 * 1024):
+                chunk = body[offset:offset + 64 * 1024]
+                self.wfile.write(chunk)
+                self._throttle(len(chunk))
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _xml(root_tag, **children):
+    root = ElementTree.Element(root_tag)
+    for (tag, text) in children.items():
+        ElementTree.SubElement(root, tag).text = text
+    return ElementTree.tostring(root)
+
+
+def _md5_matches(content_md5, data):
+    if not content_md5:
+        return True
+    return base64.b64encode(hashlib.md5(data).digest()).decode('utf-8') == content_md5
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local stand-in for the Mason Platform.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds every request is delayed by')
+    parser.add_argument('--bandwidth', type=int, default=None,
+                        help='bytes per second each connection is throttled to')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests failing with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--build-time', type=float, default=0,
+                        help='seconds builds take to complete')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--configure', action='store_true',
+                        help='point the CLI at the server until it stops')
+    args = parser.parse_args()
+
+    from cli.internal.utils.constants import ENDPOINTS
+
+    server = FakeMasonServer(
+        args.port,
+        args.latency,
+        args.bandwidth,
+        args.error_rate,
+        args.error_status,
+        args.build_time,
+        args.seed)
+
+    # Only overrides are kept so the defaults apply again once the server stops.
+    previous = {key: ENDPOINTS._fields.get(key) for key in server.endpoints()}
+    if args.configure:
+        server.configure(ENDPOINTS)
+        ENDPOINTS.save()
+
+    print('Serving a fake Mason Platform at {}'.format(server.url), flush=True)
+    print("Run 'mason login' with any credentials to sign in.", flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.configure:
+            for (key, value) in previous.items():
+                ENDPOINTS[key] = value
+            ENDPOINTS.save()
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
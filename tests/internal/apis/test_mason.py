@@ -1,17 +1,30 @@
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures.thread import ThreadPoolExecutor
 
+from mock import ANY
 from mock import MagicMock
+from mock import patch
 
+from cli.internal.apis.mason import CUSTOMER_CACHE_TTL_SECONDS
 from cli.internal.apis.mason import MasonApi
 from cli.internal.models.apk import Apk
 from cli.internal.models.media import Media
 from cli.internal.models.os_config import OSConfig
+from cli.internal.utils.remote import ApiError
+from cli.internal.utils.store import Store
 from tests import __tests_root__
+from tests.caches import isolate_caches
 
 
 class MasonApiTest(unittest.TestCase):
     def setUp(self):
+        isolate_caches(self)
+
         mock_handler = MagicMock()
         mock_auth_store = MagicMock()
         mock_auth_store.__getitem__ = MagicMock(return_value='Foobar')
@@ -19,7 +32,9 @@ class MasonApiTest(unittest.TestCase):
         mock_endpoints_store.__getitem__ = MagicMock(return_value='url_root')
 
         self.handler = mock_handler
-        self.api = MasonApi(mock_handler, mock_auth_store, mock_endpoints_store)
+        self.settings_store = {'upload_mode': 'single'}
+        self.api = MasonApi(
+            mock_handler, mock_auth_store, mock_endpoints_store, self.settings_store)
         self.api._customer = 'mason-test'
 
     def test__upload_artifact__config_requests_are_correct(self):
@@ -43,6 +58,7 @@ class MasonApiTest(unittest.TestCase):
         self.handler.put.assert_called_with(
             'signed_request',
             config_file,
+            upload_mode='single',
             headers={'Content-MD5': 'BtYkQIi96WeIVrTFcPaYtQ=='}
         )
         self.handler.post.assert_called_with(
@@ -79,6 +95,7 @@ class MasonApiTest(unittest.TestCase):
         self.handler.put.assert_called_with(
             'signed_request',
             apk_file,
+            upload_mode='single',
             headers={
                 'Content-MD5': 'QrDVanEnOLaXIgSL3ut67g=='
             }
@@ -122,6 +139,7 @@ class MasonApiTest(unittest.TestCase):
         self.handler.put.assert_called_with(
             'signed_request',
             media_file,
+            upload_mode='single',
             headers={'Content-MD5': 'HzF5jT1tn8nOtt33IcFWaQ=='}
         )
         self.handler.post.assert_called_with(
@@ -138,12 +156,49 @@ class MasonApiTest(unittest.TestCase):
             }
         )
 
+    def test__upload_artifact__upload_mode_confirmed_by_registry_is_used(self):
+        config_file = os.path.join(__tests_root__, 'res/config.yml')
+        artifact = OSConfig.parse(MagicMock(), config_file)
+        self.settings_store['upload_mode'] = 'resumable'
+        self.handler.get = MagicMock(return_value={
+            'signed_request': 'signed_request',
+            'url': 'signed_url',
+            'upload_mode': 'resumable'
+        })
+
+        self.api.upload_artifact(config_file, artifact)
+
+        self.handler.get.assert_called_with(
+            'url_root/mason-test/project-id/1?type=config&noContentType=true&uploadMode=resumable',
+            headers=ANY
+        )
+        self.handler.put.assert_called_with(
+            'signed_request', config_file, upload_mode='resumable', headers=ANY)
+
+    def test__upload_artifact__upload_mode_unconfirmed_by_registry_falls_back_to_single(self):
+        config_file = os.path.join(__tests_root__, 'res/config.yml')
+        artifact = OSConfig.parse(MagicMock(), config_file)
+        self.settings_store['upload_mode'] = 'multipart'
+        self.handler.get = MagicMock(return_value={
+            'signed_request': 'signed_request',
+            'url': 'signed_url'
+        })
+
+        self.api.upload_artifact(config_file, artifact)
+
+        self.handler.put.assert_called_with(
+            'signed_request', config_file, upload_mode='single', headers=ANY)
+
     def test__deploy_artifact__default_requests_are_correct(self):
         self.api.deploy_artifact('myType', 'myName', 'myVersion', 'myGroup', 'myPush', 'myNoHttps')
 
         self.handler.post.assert_called_with(
             'url_root',
-            headers={'Content-Type': 'application/json', 'Authorization': 'Bearer Foobar'},
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': 'Bearer Foobar',
+                'Idempotency-Key': ANY
+            },
             json={
                 'customer': 'mason-test',
                 'group': 'myGroup',
@@ -189,3 +244,197 @@ class MasonApiTest(unittest.TestCase):
             'url_root/mason-test/jobs/id',
             headers={'Content-Type': 'application/json', 'Authorization': 'Bearer Foobar'}
         )
+
+
+class MasonApiCustomerTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = MagicMock()
+        self.handler.get = MagicMock(return_value={'user_metadata': {'clients': ['mason-test']}})
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir)
+        self.auth_store = Store('auth', {}, self.store_dir)
+        self.auth_store['access_token'] = 'token'
+        self.auth_store['id_token'] = 'id'
+        self.customer_store = self._customer_store()
+        self.endpoints_store = MagicMock()
+        self.endpoints_store.__getitem__ = MagicMock(return_value='url_root')
+
+    def test__customer__is_remembered_across_invocations(self):
+        self._api().get_build('id')
+        self.handler.get.reset_mock()
+
+        self._api(self._customer_store()).get_build('id')
+
+        self.handler.get.assert_called_once_with(
+            'url_root/mason-test/jobs/id',
+            headers={'Content-Type': 'application/json', 'Authorization': 'Bearer id'})
+
+    def test__customer__new_access_token_is_validated(self):
+        self._api().get_build('id')
+        self.handler.get.reset_mock()
+
+        self.auth_store['access_token'] = 'new-token'
+        self._api().get_build('id')
+
+        self.assertEqual(self.handler.get.call_count, 2)
+
+    def test__customer__expired_customer_is_validated(self):
+        self._api().get_build('id')
+        self.handler.get.reset_mock()
+
+        with patch('time.time', return_value=time.time() + CUSTOMER_CACHE_TTL_SECONDS):
+            self._api().get_build('id')
+
+        self.assertEqual(self.handler.get.call_count, 2)
+
+    def test__customer__unauthorized_request_forgets_customer(self):
+        self._api().get_build('id')
+        self.handler.get = MagicMock(side_effect=ApiError('Unauthorized', 401))
+
+        with self.assertRaises(ApiError):
+            self._api().get_build('id')
+
+        self.assertIsNone(self._customer_store()['customer'])
+
+    def test__customer__one_off_credentials_are_not_saved(self):
+        self.auth_store['api_key'] = 'SECRET-API-KEY'
+        self.auth_store['id_token'] = 'SECRET-ID'
+        self.auth_store['access_token'] = 'SECRET-ACCESS'
+
+        self._api().get_build('id')
+
+        self.assertEqual(self._customer_store()['customer']['id'], 'mason-test')
+        self.assertFalse(os.path.exists(os.path.join(self.store_dir, 'auth.yml')))
+        for name in os.listdir(self.store_dir):
+            with open(os.path.join(self.store_dir, name)) as f:
+                self.assertNotIn('SECRET', f.read())
+
+    def _api(self, customer_store=None):
+        return MasonApi(
+            self.handler,
+            self.auth_store,
+            self.endpoints_store,
+            customer_store=customer_store or self.customer_store)
+
+    def _customer_store(self):
+        return Store('customer-cache', {'customer': None}, self.store_dir)
+
+
+class MasonApiFindArtifactTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = MagicMock()
+        self.handler.get = MagicMock(side_effect=self._get)
+        self.versions = [
+            {'name': 'app', 'type': 'apk', 'version': '2', 'createdAt': '2020-01-03T00:00:00Z'},
+            {'name': 'app', 'type': 'apk', 'version': '10', 'createdAt': '2020-01-01T00:00:00Z'},
+            {'name': 'app', 'type': 'apk', 'version': '3', 'createdAt': '2020-01-02T00:00:00Z'},
+            {'name': 'other', 'type': 'apk', 'version': '99', 'createdAt': '2021-01-01T00:00:00Z'}
+        ]
+        auth_store = MagicMock()
+        auth_store.__getitem__ = MagicMock(return_value='Foobar')
+        endpoints_store = MagicMock()
+        endpoints_store.__getitem__ = MagicMock(return_value='url_root')
+        self.settings_store = {'registry_server_side_sorting': False}
+
+        self.api = MasonApi(self.handler, auth_store, endpoints_store, self.settings_store)
+        self.api._customer = 'mason-test'
+
+    def test__get_latest_artifact__most_recent_version_is_found(self):
+        artifact = self.api.get_latest_artifact('app', 'apk')
+
+        self.assertEqual(artifact, {'fetched': '2'})
+
+    def test__get_highest_artifact__highest_version_is_found(self):
+        artifact = self.api.get_highest_artifact('apk', 'app')
+
+        self.assertEqual(artifact, {'fetched': '10'})
+
+    def test__get_latest_artifact__list_entry_is_reused(self):
+        artifact = self.api.get_latest_artifact('app', 'apk', fields=('version',))
+
+        self.assertEqual(artifact['version'], '2')
+        self.handler.get.assert_called_once()
+
+    def test__get_highest_artifact__missing_fields_are_fetched(self):
+        artifact = self.api.get_highest_artifact('apk', 'app', fields=('version', 'checksum'))
+
+        self.assertEqual(artifact, {'fetched': '10'})
+
+    def test__get_highest_artifact__missing_artifact_is_none(self):
+        self.versions = []
+
+        self.assertIsNone(self.api.get_highest_artifact('apk', 'app'))
+
+    def test__get_latest_artifact__server_sorts_when_supported(self):
+        self.settings_store['registry_server_side_sorting'] = True
+
+        self.api.get_latest_artifact('app', 'apk', fields=('version',))
+
+        self.handler.get.assert_called_once_with(
+            'url_root/mason-test/apk/app?sort=-createdAt&limit=1',
+            headers={'Content-Type': 'application/json', 'Authorization': 'Bearer Foobar'})
+
+    def _get(self, url, headers):
+        if url.startswith('url_root/mason-test/apk/app/'):
+            return {'fetched': url.split('/')[-1]}
+        return self.versions
+
+
+class MasonApiCoalescingTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = MagicMock()
+        self.handler.get = MagicMock(return_value={'version': '1', 'config': {}})
+        auth_store = MagicMock()
+        auth_store.__getitem__ = MagicMock(return_value='Foobar')
+        endpoints_store = MagicMock()
+        endpoints_store.__getitem__ = MagicMock(return_value='url_root')
+
+        self.api = MasonApi(self.handler, auth_store, endpoints_store, {})
+        self.api._customer = 'mason-test'
+
+    def test__get_artifact__concurrent_reads_share_a_request(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def get(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return {'version': '1'}
+
+        self.handler.get = MagicMock(side_effect=get)
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(self.api.get_artifact, 'apk', 'app', '1') for _ in range(4)]
+            started.wait(5)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.handler.get.assert_called_once()
+        self.assertEqual(results, [{'version': '1'}] * 4)
+
+    def test__get_artifact__later_reads_reuse_result(self):
+        self.api.get_artifact('apk', 'app', '1')
+        self.api.get_artifact('apk', 'app', '1')
+        self.api.get_artifact('apk', 'app', '2')
+
+        self.assertEqual(self.handler.get.call_count, 2)
+
+    def test__get_artifact__callers_get_their_own_copy(self):
+        first = self.api.get_artifact('apk', 'app', '1')
+        first['config']['os'] = {}
+
+        self.assertEqual(self.api.get_artifact('apk', 'app', '1'), {'version': '1', 'config': {}})
+
+    def test__get_artifact__failures_are_not_remembered(self):
+        self.handler.get = MagicMock(side_effect=[ApiError('Nope'), {'version': '1'}])
+
+        with self.assertRaises(ApiError):
+            self.api.get_artifact('apk', 'app', '1')
+
+        self.assertEqual(self.api.get_artifact('apk', 'app', '1'), {'version': '1'})
+
+    def test__start_build__writes_invalidate_reads(self):
+        self.api.get_artifact('config', 'project', '1')
+        self.api.start_build('project', '1', None)
+        self.api.get_artifact('config', 'project', '1')
+
+        self.assertEqual(self.handler.get.call_count, 2)
@@ -17,11 +17,13 @@ from cli.internal.models.media import Media
 from cli.internal.models.os_config import OSConfig
 from cli.internal.utils.remote import ApiError
 from tests import __tests_root__
+from tests.caches import isolate_caches
 
 
 class RegisterCommandTest(unittest.TestCase):
     def setUp(self):
         self.maxDiff = None
+        isolate_caches(self)
 
         self.config = MagicMock()
         self.config.push = True
@@ -92,7 +94,7 @@ class RegisterCommandTest(unittest.TestCase):
 
     def test_config_registers_new_rewritten_config_successfully(self):
         # noinspection PyUnusedLocal
-        def version_finder(name, type):
+        def version_finder(name, type, fields=None):
             if type == 'apk' or type == 'media':
                 return {'version': '12'}
 
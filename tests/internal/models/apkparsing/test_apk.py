@@ -0,0 +1,220 @@
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+import zipfile
+
+from mock import patch
+
+from cli.internal.models.apkparsing.apk import APK
+from cli.internal.models.apkparsing.apk import FileNotPresent
+from cli.internal.models.apkparsing.apk import ZipLayout
+from tests import __tests_root__
+from tests.apks import get_string_resource_id
+from tests.apks import make_manifest
+from tests.apks import make_resources
+from tests.apks import make_signed_apk
+
+
+class APKTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test__light_analysis__manifest_attributes_match_analysis(self):
+        for name in ('v1.apk', 'v2.apk', 'debug.apk'):
+            apk_file = os.path.join(__tests_root__, 'res', name)
+
+            apk = APK(apk_file)
+            light_apk = APK(apk_file, light_analysis=True)
+
+            self.assertTrue(light_apk.is_valid_APK())
+            self.assertEqual(light_apk.get_package(), apk.get_package())
+            self.assertEqual(light_apk.get_androidversion_code(), apk.get_androidversion_code())
+            self.assertEqual(light_apk.get_androidversion_name(), apk.get_androidversion_name())
+            self.assertEqual(light_apk.get_min_sdk_version(), apk.get_min_sdk_version())
+            self.assertEqual(light_apk.get_target_sdk_version(), apk.get_target_sdk_version())
+
+    def test__light_analysis__manifest_tree_is_not_built(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'),
+            make_manifest('com.example.app', 42, '4.2', 23, permissions=100, activities=100))
+
+        apk = APK(apk_file, light_analysis=True)
+
+        self.assertEqual(apk.get_package(), 'com.example.app')
+        self.assertEqual(apk.get_androidversion_code(), '42')
+        self.assertEqual(apk.get_androidversion_name(), '4.2')
+        self.assertEqual(apk.get_min_sdk_version(), '23')
+        self.assertEqual(apk.xml, {})
+        self.assertEqual(apk.permissions, [])
+
+    def test__light_analysis__non_manifest_root_is_invalid(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'),
+            make_manifest('com.example.app').replace(
+                'manifest'.encode('utf-16-le'), 'manifesx'.encode('utf-16-le')))
+
+        self.assertFalse(APK(apk_file, light_analysis=True).is_valid_APK())
+
+    def test__get_androidversion_name__reference_is_resolved(self):
+        resources = make_resources('com.example.app', {
+            'fr': ['version française'],
+            '': ['4.2-release', get_string_resource_id(0)]
+        })
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'),
+            make_manifest('com.example.app', version_name=get_string_resource_id(1)),
+            resources=resources)
+
+        for apk in (APK(apk_file), APK(apk_file, light_analysis=True)):
+            self.assertEqual(apk.get_androidversion_name(), '4.2-release')
+
+    def test__get_androidversion_name__unresolved_reference_is_kept(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'),
+            make_manifest('com.example.app', version_name=get_string_resource_id(1)))
+
+        apk = APK(apk_file, light_analysis=True)
+
+        self.assertEqual(apk.get_androidversion_name(), '@7F010001')
+        self.assertIsNone(apk.get_resource_index())
+
+    def test__get_androidversion_name__truncated_resources_keep_reference(self):
+        resources = make_resources('com.example.app', {'': ['4.2-release']})
+
+        for length in range(0, len(resources), 4):
+            apk = self._apk_with_resources(resources[:length])
+
+            self.assertIn(apk.get_androidversion_name(), ('4.2-release', '@7F010000'))
+
+        with self.assertLogs('androguard.apk', 'WARNING'):
+            name = self._apk_with_resources(resources[:len(resources) // 2]) \
+                .get_androidversion_name()
+        self.assertEqual(name, '@7F010000')
+
+    def test__get_androidversion_name__corrupted_resources_do_not_raise(self):
+        resources = make_resources('com.example.app', {'': ['4.2-release']})
+
+        for offset in range(0, len(resources), 2):
+            corrupted = bytearray(resources)
+            corrupted[offset:offset + 2] = b'\xff\xff'
+            apk = self._apk_with_resources(bytes(corrupted))
+
+            self.assertIsInstance(apk.get_androidversion_name(), str)
+
+    def test__get_signature_names__signature_files_are_found(self):
+        apk = APK(os.path.join(__tests_root__, 'res/v1.apk'), skip_analysis=True)
+
+        self.assertEqual(apk.get_signature_names(), ['META-INF/CERT.RSA'])
+        self.assertEqual(len(apk.get_signatures()), 1)
+        self.assertTrue(apk.is_signed_v1())
+
+    def test__get_signature_names__many_entries_are_not_rescanned(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'), make_manifest('com.example.app'),
+            entries=50000)
+        apk = APK(apk_file, light_analysis=True)
+
+        with patch.object(apk.zip, 'namelist', wraps=apk.zip.namelist) as namelist:
+            self.assertEqual(apk.get_signature_names(), ['META-INF/CERT.RSA'])
+            self.assertTrue(apk.is_signed_v1())
+            self.assertEqual(len(apk.get_signatures()), 1)
+
+        self.assertEqual(namelist.call_count, 1)
+        self.assertEqual(len(apk.get_files()), 1 + 3 + 50000)
+
+    def test__get_file__missing_file_is_not_present(self):
+        apk = APK(os.path.join(__tests_root__, 'res/v1.apk'), skip_analysis=True)
+
+        self.assertTrue(apk.get_file('AndroidManifest.xml'))
+        self.assertRaises(FileNotPresent, apk.get_file, 'missing.txt')
+        self.assertEqual(list(apk.get_dex_names()), ['classes.dex'])
+
+    def test__parse_v2_v3_signature__signing_block_is_parsed(self):
+        apk = APK(os.path.join(__tests_root__, 'res/v2.apk'))
+
+        self.assertTrue(apk.is_signed_v2())
+        self.assertFalse(apk.is_signed_v3())
+        self.assertEqual(len(apk.get_certificates_der_v2()), 1)
+
+    def test__parse_v2_v3_signature__unsigned_apk_has_no_signing_block(self):
+        apk = APK(os.path.join(__tests_root__, 'res/v1.apk'))
+
+        self.assertFalse(apk.is_signed_v2())
+        self.assertFalse(apk.is_signed_v3())
+
+    def test__parse_v2_v3_signature__raw_apk_is_parsed(self):
+        with open(os.path.join(__tests_root__, 'res/v2.apk'), 'rb') as f:
+            apk = APK(f.read(), raw=True)
+
+        self.assertTrue(apk.is_signed_v2())
+
+    def test__parse_v2_v3_signature__apk_is_not_loaded_into_memory(self):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'), make_manifest('com.example.app'),
+            size=16 * 1024 * 1024, v2=True, v3=True)
+        apk = APK(apk_file)
+
+        tracemalloc.start()
+        try:
+            self.assertTrue(apk.is_signed_v2())
+            self.assertTrue(apk.is_signed_v3())
+            (_, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, 1024 * 1024)
+
+
+    def _apk_with_resources(self, resources):
+        apk_file = make_signed_apk(
+            os.path.join(self.dir, 'app.apk'),
+            make_manifest('com.example.app', version_name=get_string_resource_id(0)),
+            resources=resources)
+        return APK(apk_file, light_analysis=True)
+
+
+class ZipLayoutTest(unittest.TestCase):
+    def test__read__layout_matches_zipfile(self):
+        apk_file = os.path.join(__tests_root__, 'res/v2.apk')
+
+        with open(apk_file, 'rb') as f:
+            layout = ZipLayout.read(f)
+
+        with zipfile.ZipFile(apk_file) as apk:
+            self.assertEqual(layout.entry_count, len(apk.infolist()))
+            self.assertEqual(layout.central_dir_offset, apk.start_dir)
+        self.assertFalse(layout.is_zip64())
+
+    def test__read__long_comment_is_skipped(self):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as apk:
+            apk.writestr('a.txt', 'a')
+            # The comment contains a fake end of central directory
+            apk.comment = b'PK\x05\x06' + b'\x00' * 0xFFF0
+
+        layout = ZipLayout.read(data)
+
+        self.assertEqual(layout.entry_count, 1)
+        self.assertEqual(layout.comment, b'PK\x05\x06' + b'\x00' * 0xFFF0)
+        self.assertEqual(layout.end_of_central_dir_offset,
+                         len(data.getvalue()) - 22 - len(layout.comment))
+
+    def test__read__zip64_end_of_central_dir_is_followed(self):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as apk:
+            for i in range(0x10000):
+                apk.writestr('{}.txt'.format(i), b'')
+
+        layout = ZipLayout.read(data)
+
+        self.assertTrue(layout.is_zip64())
+        self.assertEqual(layout.entry_count, 0x10000)
+        with zipfile.ZipFile(data) as apk:
+            self.assertEqual(layout.central_dir_offset, apk.start_dir)
+
+    def test__read__non_zip_file_has_no_layout(self):
+        self.assertIsNone(ZipLayout.read(io.BytesIO(b'Not a zip file')))
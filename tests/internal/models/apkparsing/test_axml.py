@@ -0,0 +1,111 @@
+import struct
+import unittest
+
+from cli.internal.models.apkparsing.axml import ARSCHeader
+from cli.internal.models.apkparsing.axml import ARSCParser
+from cli.internal.models.apkparsing.axml import ARSCResourceIndex
+from cli.internal.models.apkparsing.axml import BuffHandle
+from cli.internal.models.apkparsing.axml import RES_STRING_POOL_TYPE
+from cli.internal.models.apkparsing.axml import StringBlock
+from tests.apks import get_string_resource_id
+from tests.apks import make_resources
+from tests.apks import make_string_pool
+
+
+class BuffHandleTest(unittest.TestCase):
+    def test__read__views_are_not_copied(self):
+        data = bytearray(b'0123456789')
+        buff = BuffHandle(data)
+
+        read = buff.read(4)
+        rest = buff.readat(6)
+        data[0:1] = b'a'
+        data[9:10] = b'z'
+
+        self.assertEqual(bytes(read), b'a123')
+        self.assertEqual(bytes(rest), b'678z')
+        self.assertEqual(buff.get_idx(), 4)
+
+    def test__read_null_string__bytes_are_returned(self):
+        buff = BuffHandle(b'name\x00')
+
+        self.assertEqual(buff.readNullString(4), b'name')
+        self.assertEqual(buff.read_b(1), b'\x00')
+        self.assertEqual(buff[4], 0)
+
+
+class StringBlockTest(unittest.TestCase):
+    def test__init__offsets_are_read(self):
+        strings = ['string_{}'.format(i) for i in range(1000)]
+        buff = BuffHandle(make_string_pool(strings))
+
+        string_block = StringBlock(buff, ARSCHeader(buff, expected_type=RES_STRING_POOL_TYPE))
+
+        self.assertEqual(len(string_block), 1000)
+        self.assertEqual(string_block[0], 'string_0')
+        self.assertEqual(string_block[999], 'string_999')
+        self.assertEqual(list(string_block), strings)
+        self.assertEqual(buff.get_idx(), buff.size())
+
+    def test__init__styles_are_read(self):
+        string_pool = make_string_pool(['a', 'b'])
+        # Add a style offset after the string offsets and a style span after the strings
+        (type_, header_size, size, string_count, _, flags, strings_start, _) = \
+            struct.unpack('<HHIIIIII', string_pool[:28])
+        strings = string_pool[strings_start:]
+        string_pool = struct.pack(
+            '<HHIIIIII',
+            type_,
+            header_size,
+            size + 4 + 12,
+            string_count,
+            1,
+            flags,
+            strings_start + 4,
+            size + 4) + string_pool[28:strings_start] + struct.pack('<I', 0) + strings + \
+            struct.pack('<III', 1, 0, 0xFFFFFFFF)
+        buff = BuffHandle(string_pool)
+
+        string_block = StringBlock(buff, ARSCHeader(buff, expected_type=RES_STRING_POOL_TYPE))
+
+        self.assertEqual(list(string_block), ['a', 'b'])
+        self.assertEqual(string_block.m_styleOffsets, [0])
+        self.assertEqual(string_block.m_styles, [1, 0, 0xFFFFFFFF])
+
+
+class ARSCResourceIndexTest(unittest.TestCase):
+    def test__get_res_configs__entries_match_parser(self):
+        resources = make_resources('com.example.app', {
+            '': ['one', 'two', 'three'],
+            'fr': ['un', 'deux']
+        })
+        parser = ARSCParser(resources)
+        index = ARSCResourceIndex(resources)
+
+        self.assertEqual(index.get_packages_names(), ['com.example.app'])
+        for i in range(3):
+            rid = get_string_resource_id(i)
+            self.assertEqual(
+                [(config, ate.get_key_data()) for (config, ate) in index.get_res_configs(rid)],
+                [(config, ate.get_key_data()) for (config, ate) in parser.get_res_configs(rid)])
+
+    def test__get_resolved_value__default_config_is_preferred(self):
+        index = ARSCResourceIndex(make_resources('com.example.app', {
+            'fr': ['un', 'deux'],
+            '': ['one']
+        }))
+
+        self.assertEqual(index.get_resolved_value(get_string_resource_id(0)), 'one')
+        self.assertEqual(index.get_resolved_value(get_string_resource_id(1)), 'deux')
+        self.assertIsNone(index.get_resolved_value(get_string_resource_id(2)))
+
+    def test__get_resolved_value__references_are_followed(self):
+        index = ARSCResourceIndex(make_resources('com.example.app', {'': [
+            'one',
+            get_string_resource_id(0),
+            get_string_resource_id(3),
+            get_string_resource_id(2)
+        ]}))
+
+        self.assertEqual(index.get_resolved_value(get_string_resource_id(1)), 'one')
+        self.assertIsNone(index.get_resolved_value(get_string_resource_id(2)))
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from cli.internal.utils import hashing
+from cli.internal.utils.hashing import DigestCache
+from cli.internal.utils.hashing import hash_file
+from cli.internal.utils.hashing import hash_file_digests
+from cli.internal.utils.store import Store
+from tests import __tests_root__
+
+
+class HashingTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.cache = DigestCache(Store('digest-cache', {'files': {}}, self.cache_dir, False))
+
+        patcher = patch('cli.internal.utils.hashing._cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test__hash_file__md5_is_correct(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        self.assertEqual(hash_file(apk_file, 'md5'), '42b0d56a712738b69722048bdeeb7aee')
+
+    def test__hash_file__sha1_is_correct(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        self.assertEqual(hash_file(apk_file, 'sha1'), '891544e59702a6138962a9a2728cb2527fb77554')
+
+    def test__hash_file__raw_digest_is_returned(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        self.assertEqual(hash_file(apk_file, 'md5', False).hex(), hash_file(apk_file, 'md5'))
+
+    def test__hash_file_digests__all_types_are_computed_in_one_read(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        with patch('cli.internal.utils.hashing._compute_digests',
+                   wraps=hashing._compute_digests) as compute:
+            digests = hash_file_digests(apk_file, ('sha256', 'sha1', 'md5'))
+            hash_file(apk_file, 'md5')
+            hash_file(apk_file, 'sha1')
+            hash_file(apk_file, 'sha256')
+
+        compute.assert_called_once()
+        self.assertEqual(set(digests.keys()), {'sha256', 'sha1', 'md5'})
+
+    def test__hash_file_digests__artifact_types_are_computed_alongside(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        with patch('cli.internal.utils.hashing._compute_digests',
+                   wraps=hashing._compute_digests) as compute:
+            hash_file(apk_file, 'md5')
+            hash_file(apk_file, 'sha1')
+
+        compute.assert_called_once()
+
+    def test__hash_file_digests__changed_file_is_rehashed(self):
+        fd, file = tempfile.mkstemp()
+        self.addCleanup(os.remove, file)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'foo')
+        old_md5 = hash_file(file, 'md5')
+
+        with open(file, 'wb') as f:
+            f.write(b'foobar')
+        new_md5 = hash_file(file, 'md5')
+
+        self.assertEqual(old_md5, 'acbd18db4cc2f85cedef654fccc4a4d8')
+        self.assertEqual(new_md5, '3858f62230ac3c915f300c664312c63f')
+
+    def test__hash_file_digests__digests_are_persisted(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+        hash_file(apk_file, 'md5')
+        self.cache.save()
+        restored_cache = DigestCache(Store('digest-cache', {'files': {}}, self.cache_dir, False))
+
+        with patch('cli.internal.utils.hashing._cache', restored_cache), \
+                patch('cli.internal.utils.hashing._compute_digests') as compute:
+            md5 = hash_file(apk_file, 'md5')
+            sha1 = hash_file(apk_file, 'sha1')
+
+        compute.assert_not_called()
+        self.assertEqual(md5, '42b0d56a712738b69722048bdeeb7aee')
+        self.assertEqual(sha1, '891544e59702a6138962a9a2728cb2527fb77554')
+
+    def test__hash_file_digests__digests_are_saved_once(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        with patch.object(self.cache.store, 'save') as save:
+            hash_file(apk_file, 'md5')
+            hash_file(os.path.join(__tests_root__, 'res/v2.apk'), 'md5')
+            save.assert_not_called()
+
+            self.cache.save()
+            self.cache.save()
+
+        save.assert_called_once()
+
+    def test__hash_file_digests__touched_file_is_rehashed(self):
+        fd, file = tempfile.mkstemp()
+        self.addCleanup(os.remove, file)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'foo')
+        hash_file(file, 'md5')
+        stat = os.stat(file)
+        os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+        with patch('cli.internal.utils.hashing._compute_digests',
+                   wraps=hashing._compute_digests) as compute:
+            hash_file(file, 'md5')
+
+        compute.assert_called_once()
+
+    def test__digest_cache__deleted_files_are_forgotten(self):
+        fd, file = tempfile.mkstemp()
+        os.close(fd)
+        hash_file(file, 'md5')
+        self.cache.save()
+        os.remove(file)
+
+        restored_cache = DigestCache(Store('digest-cache', {'files': {}}, self.cache_dir, False))
+        restored_cache.get(os.path.join(__tests_root__, 'res/v1.apk'))
+
+        self.assertNotIn(os.path.realpath(file), restored_cache.store['files'])
+
+    def test__digest_cache__store_is_restored_on_first_use(self):
+        store = Store('digest-cache', {'files': {}}, self.cache_dir, False)
+        cache = DigestCache(store)
+
+        with patch.object(store, 'restore', wraps=store.restore) as restore:
+            restore.assert_not_called()
+            cache.get(os.path.join(__tests_root__, 'res/v1.apk'))
+            cache.get(os.path.join(__tests_root__, 'res/v1.apk'))
+
+        restore.assert_called_once()
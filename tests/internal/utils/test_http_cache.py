@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cli.internal.utils.http_cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'response_cache_max_bytes': 1024 * 1024}
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        self.cache = ResponseCache(dir, self.settings)
+
+    def test__get__entry_is_restored(self):
+        self.cache.put('url', None, '"etag"', 'date', 'body')
+
+        entry = ResponseCache(self.cache.dir, self.settings).get('url')
+
+        self.assertEqual(entry['etag'], '"etag"')
+        self.assertEqual(entry['last_modified'], 'date')
+        self.assertEqual(entry['body'], 'body')
+
+    def test__get__missing_entry_is_none(self):
+        self.assertIsNone(self.cache.get('url'))
+
+    def test__put__least_recently_used_entries_are_evicted(self):
+        self.settings['response_cache_max_bytes'] = 2500
+        self.cache.put('url1', None, '"etag"', None, 'x' * 1000)
+        self.cache.put('url2', None, '"etag"', None, 'x' * 1000)
+        self._age(self.cache._get_path('url1', None), 20)
+        self._age(self.cache._get_path('url2', None), 30)
+        self.cache.get('url2')
+
+        self.cache.put('url3', None, '"etag"', None, 'x' * 1000)
+
+        self.assertIsNone(self.cache.get('url1'))
+        self.assertIsNotNone(self.cache.get('url2'))
+        self.assertIsNotNone(self.cache.get('url3'))
+
+    def _age(self, path, seconds):
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
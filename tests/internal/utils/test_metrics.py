@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from cli.internal.utils.metrics import RequestMetrics
+from cli.internal.utils.metrics import format_columns
+
+
+class RequestMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = RequestMetrics()
+        self.metrics.record('deploy_url', 0.5, {'connect': 0.1, 'ttfb': 0.4}, 100, 20)
+        self.metrics.record('deploy_url', 0.25, {'ttfb': 0.25}, 100, 20, failed=True)
+        self.metrics.record('storage.googleapis.com', 3, {'send': 2.5, 'ttfb': 0.5}, 5000000)
+
+    def test__get_summary__requests_are_aggregated_slowest_first(self):
+        summary = self.metrics.get_summary()
+
+        self.assertEqual([stats['endpoint'] for stats in summary],
+                         ['storage.googleapis.com', 'deploy_url'])
+        self.assertEqual(summary[1]['requests'], 2)
+        self.assertEqual(summary[1]['failures'], 1)
+        self.assertEqual(summary[1]['total'], 0.75)
+        self.assertEqual(summary[1]['ttfb'], 0.65)
+        self.assertEqual(summary[1]['bytes_sent'], 200)
+
+    def test__format_table__row_per_endpoint(self):
+        lines = self.metrics.format_table().splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('endpoint'))
+        self.assertTrue(lines[1].startswith('storage.googleapis.com'))
+        self.assertIn('5.0 MB', lines[1])
+
+    def test__format_columns__columns_are_aligned(self):
+        table = format_columns([('name', 'size'), ('a', '1.0 kB'), ('longer', '10 B')])
+
+        self.assertEqual(table.splitlines(), [
+            'name      size',
+            'a       1.0 kB',
+            'longer    10 B'
+        ])
+
+    def test__write_json__summary_is_written(self):
+        fd, file = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, file)
+
+        self.metrics.write_json(file)
+
+        with open(file) as f:
+            self.assertEqual(json.load(f), {'endpoints': self.metrics.get_summary()})
@@ -0,0 +1,126 @@
+import io
+import sys
+import time
+import unittest
+
+from mock import patch
+
+from cli.internal.utils.progress import TransferProgress
+from cli.internal.utils.progress import format_duration
+
+
+class TtyStream(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class TransferProgressTest(unittest.TestCase):
+    def test__update__transfers_are_aggregated(self):
+        stream = io.StringIO()
+        progress = TransferProgress(stream, interval=0)
+
+        first = progress.track(1000)
+        second = progress.track(3000)
+        first.update(1000)
+        second.update(1000)
+
+        self.assertEqual(
+            stream.getvalue().splitlines()[-1].split(' at ')[0],
+            'Uploading 2 files: 2.0 kB/4.0 kB (50%)')
+
+    def test__update__redraws_are_throttled(self):
+        stream = io.StringIO()
+        progress = TransferProgress(stream, interval=60)
+
+        with progress.track(1000) as transfer:
+            for _ in range(100):
+                transfer.update(10)
+
+        self.assertEqual(len(stream.getvalue().splitlines()), 2)
+        self.assertTrue(stream.getvalue().splitlines()[-1].startswith('Uploaded 1 file: 1.0 kB in'))
+
+    def test__update__stalled_transfers_are_redrawn(self):
+        stream = io.StringIO()
+        progress = TransferProgress(stream, interval=0.05)
+
+        with progress.track(1000) as transfer:
+            transfer.update(500)
+            time.sleep(0.3)
+            lines = stream.getvalue().splitlines()
+            transfer.update(500)
+
+        self.assertGreater(len(lines), 2)
+        self.assertNotEqual(lines[-1].split(' at ')[1], lines[1].split(' at ')[1])
+
+    def test__close__completed_transfers_are_summed_up(self):
+        stream = io.StringIO()
+        progress = TransferProgress(stream, interval=0)
+
+        for _ in range(3):
+            with progress.track(1000) as transfer:
+                transfer.update(1000)
+        with progress.track(1000) as first, progress.track(2000) as second:
+            first.update(1000)
+            second.update(2000)
+
+        self.assertEqual(
+            stream.getvalue().splitlines()[-1].split(' in ')[0], 'Uploaded 2 files: 3.0 kB')
+
+    def test__close__abandoned_transfers_are_forgotten(self):
+        stream = io.StringIO()
+        progress = TransferProgress(stream, interval=0)
+
+        done = progress.track(1000)
+        abandoned = progress.track(1000)
+        abandoned.update(500)
+        abandoned.close()
+        done.update(1000)
+
+        self.assertIn('1.0 kB/1.0 kB (100%)', stream.getvalue().splitlines()[-1])
+
+    def test__draw__tty_line_is_redrawn_in_place(self):
+        stream = TtyStream()
+        progress = TransferProgress(stream, interval=0)
+
+        with progress.track(1000) as transfer:
+            transfer.update(500)
+            transfer.update(500)
+
+        self.assertEqual(stream.getvalue().count('\n'), 1)
+        self.assertTrue(stream.getvalue().endswith('\n'))
+        self.assertEqual(stream.getvalue().count('\r'), 3)
+
+    def test__draw__stdout_is_checked_for_a_tty(self):
+        progress = TransferProgress(interval=0)
+
+        with patch.object(sys, 'stdout', TtyStream()), patch.object(sys, 'stderr', io.StringIO()):
+            with progress.track(1000) as transfer:
+                transfer.update(1000)
+
+            self.assertTrue(sys.stdout.getvalue().startswith('\rUploading 1 file'))
+            self.assertEqual(sys.stderr.getvalue(), '')
+
+    def test__format_line__time_left_is_estimated(self):
+        progress = TransferProgress(io.StringIO(), interval=60)
+        progress.track(3000).update(1000)
+
+        with patch('time.monotonic', return_value=progress._started_at + 10):
+            self.assertTrue(progress._format_line().endswith('at 100 B/s, 20s left'))
+
+    def test__format_duration__units_are_picked(self):
+        self.assertEqual(format_duration(42.5), '42s')
+        self.assertEqual(format_duration(65), '1m05s')
+        self.assertEqual(format_duration(2 * 60 * 60 + 5 * 60), '2h05m')
+
+    def test__external_write_mode__line_is_cleared_and_redrawn(self):
+        stream = TtyStream()
+        progress = TransferProgress(stream, interval=60)
+        transfer = progress.track(1000)
+        transfer.update(500)
+
+        with progress.external_write_mode():
+            stream.write('log line\n')
+
+        (before, after) = stream.getvalue().split('log line\n')
+        self.assertTrue(before.endswith('\r'))
+        self.assertTrue(after.startswith('\rUploading 1 file: 500 B/1.0 kB (50%)'))
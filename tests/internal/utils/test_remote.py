@@ -0,0 +1,519 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures.thread import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import requests
+from mock import MagicMock
+from mock import patch
+
+from cli.internal.utils.http_cache import ResponseCache
+from cli.internal.utils.remote import ApiError
+from cli.internal.utils.remote import FileUploadBody
+from cli.internal.utils.remote import RequestHandler
+from cli.internal.utils.store import Store
+from tests.fake_server import FakeMasonServer
+
+
+class FileUploadBodyTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.file = tempfile.mkstemp()
+        self.addCleanup(os.remove, self.file)
+        self.data = os.urandom(10000)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+
+    def test__read__requested_size_is_honoured(self):
+        with FileUploadBody(self.file, buffer_size=4096) as body:
+            chunks = [bytes(body.read(3000)), bytes(body.read(3000))]
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3000, 3000])
+        self.assertEqual(b''.join(chunks), self.data[:6000])
+
+    def test__read__size_is_capped_to_buffer(self):
+        with FileUploadBody(self.file, buffer_size=4096) as body:
+            chunk = body.read()
+
+        self.assertEqual(bytes(chunk), self.data[:4096])
+
+    def test__read__buffer_is_reused(self):
+        with FileUploadBody(self.file, buffer_size=4096) as body:
+            first = body.read(1000)
+            second = body.read(1000)
+
+        self.assertIs(first.obj, second.obj)
+
+    def test__read__whole_file_is_streamed(self):
+        chunks = []
+        with FileUploadBody(self.file, buffer_size=4096) as body:
+            chunk = body.read(4096)
+            while chunk:
+                chunks.append(bytes(chunk))
+                chunk = body.read(4096)
+
+            self.assertEqual(body.tell(), len(self.data))
+        self.assertEqual(b''.join(chunks), self.data)
+
+    def test__len__file_size_is_reported(self):
+        with FileUploadBody(self.file) as body:
+            self.assertEqual(len(body), len(self.data))
+
+    def test__read__offset_is_skipped(self):
+        with FileUploadBody(self.file, 4000) as body:
+            chunk = bytes(body.read(10000))
+
+            self.assertEqual(len(body), 6000)
+        self.assertEqual(chunk, self.data[4000:])
+
+    def test__seek__body_is_rewound(self):
+        with FileUploadBody(self.file, 4000, buffer_size=4096) as body:
+            body.read(3000)
+            body.seek(0)
+            chunk = bytes(body.read(3000))
+
+            self.assertEqual(body.tell(), 3000)
+        self.assertEqual(chunk, self.data[4000:7000])
+
+
+class RequestHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.received_headers = []
+        # Responses to send before falling back to 200, as (status, headers[, body]) tuples
+        self.responses = []
+        received = self.received
+        received_headers = self.received_headers
+        responses = self.responses
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                self._respond()
+
+            def do_PUT(self):
+                self._respond()
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                received.append((self.command, self.rfile.read(length)))
+                received_headers.append(dict(self.headers))
+
+                (status, headers, body) = (responses.pop(0) + (b'',))[:3] \
+                    if responses else (200, {}, b'')
+                self.send_response(status)
+                for (key, value) in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:{}/upload'.format(self.server.server_port)
+
+        self.config = MagicMock()
+        self.config.settings_store = {
+            'upload_mode': 'single',
+            'request_retry_attempts': 3,
+            'request_retry_backoff': 0.5,
+            'request_retry_max_delay': 30,
+            'request_retry_budget': 20
+        }
+        with patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': ''}):
+            self.handler = RequestHandler(self.config)
+
+        patcher = patch('time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test__put__file_is_uploaded(self):
+        file, data = self._file()
+
+        self.handler.put(self.url, file)
+
+        self.assertEqual(self.received, [('PUT', data)])
+
+    def test__put__transient_failure_is_retried_with_whole_body(self):
+        file, data = self._file()
+        self.responses.append((503, {}))
+
+        self.handler.put(self.url, file)
+
+        self.assertEqual(self.received, [('PUT', data), ('PUT', data)])
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertLessEqual(self.sleep.call_args[0][0], 0.5)
+
+    def test__get__retry_after_is_honoured(self):
+        self.responses.append((429, {'Retry-After': '7'}))
+
+        self.handler.get(self.url)
+
+        self.sleep.assert_called_once_with(7)
+
+    def test__get__backoff_grows_exponentially(self):
+        self.responses.extend([(502, {}), (502, {})])
+
+        with patch('random.uniform', side_effect=lambda a, b: b):
+            self.handler.get(self.url)
+
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list], [0.5, 1.0])
+
+    def test__get__attempts_are_capped(self):
+        self.responses.extend([(503, {}), (503, {}), (503, {})])
+
+        with self.assertRaises(ApiError):
+            self.handler.get(self.url)
+        self.assertEqual(len(self.received), 3)
+
+    def test__get__retry_budget_is_shared_by_requests(self):
+        self.config.settings_store['request_retry_budget'] = 1
+        self.responses.extend([(503, {}), (200, {}), (503, {})])
+
+        self.handler.get(self.url)
+        with self.assertRaises(ApiError):
+            self.handler.get(self.url)
+
+        self.assertEqual(len(self.received), 3)
+
+    def test__post__non_idempotent_request_is_not_retried(self):
+        self.responses.append((503, {}))
+
+        with self.assertRaises(ApiError):
+            self.handler.post(self.url, json={})
+        self.assertEqual(len(self.received), 1)
+
+    def test__post__request_with_idempotency_key_is_retried(self):
+        self.responses.append((503, {}))
+
+        self.handler.post(self.url, json={}, headers={'Idempotency-Key': 'key'})
+
+        self.assertEqual(len(self.received), 2)
+
+    def test__get__client_error_is_not_retried(self):
+        self.responses.append((404, {}))
+
+        with self.assertRaises(ApiError):
+            self.handler.get(self.url)
+        self.assertEqual(len(self.received), 1)
+
+    def test__init__pools_are_sized_to_executor(self):
+        with patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': ''}):
+            handler = RequestHandler(self.config, max_workers=7)
+
+        self.assertEqual(handler.http.get_adapter(self.url)._pool_maxsize, 8)
+
+    def test__init__unknown_executor_gets_default_pools(self):
+        with patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': ''}):
+            handler = RequestHandler(self.config)
+
+        self.assertEqual(
+            handler.http.get_adapter(self.url)._pool_maxsize, requests.adapters.DEFAULT_POOLSIZE)
+
+    def test__get_pool_stats__kept_alive_connections_are_reused(self):
+        self.handler.get(self.url)
+        self.handler.get(self.url)
+        self.handler.get(self.url)
+
+        self.assertEqual(
+            self.handler.get_pool_stats(), {'requests': 3, 'connections': 1, 'reused': 2})
+
+    def test__metrics__requests_are_grouped_by_endpoint(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.config.endpoints_store = Store('endpoints', {
+            'api_url_base': base_url,
+            'registry_artifact_url_path': '/registry/artifacts',
+            'registry_signed_url_path': '/registry/signedurl'
+        }, dir, False)
+        file, data = self._file()
+        self.responses.append((404, {}))
+
+        with self.assertRaises(ApiError):
+            self.handler.get(base_url + '/registry/artifacts/customer/apk')
+        self.handler.get(base_url + '/registry/signedurl/customer')
+        self.handler.put(self.url, file)
+
+        summary = {stats['endpoint']: stats for stats in self.handler.metrics.get_summary()}
+        self.assertEqual(set(summary.keys()), {
+            'registry_artifact_url',
+            'registry_signed_url',
+            '127.0.0.1:{}'.format(self.server.server_port)
+        })
+        self.assertEqual(summary['registry_artifact_url']['failures'], 1)
+        self.assertGreater(summary['registry_artifact_url']['connect'], 0)
+        # The connection is kept alive for later requests
+        self.assertEqual(summary['registry_signed_url']['connect'], 0)
+        upload = summary['127.0.0.1:{}'.format(self.server.server_port)]
+        self.assertEqual(upload['bytes_sent'], len(data))
+        self.assertGreater(upload['send'], 0)
+
+    def test__get__cached_response_is_revalidated(self):
+        url = self._use_cache()
+        self.responses.extend([
+            (200, {'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}, b'[1, 2]'),
+            (304, {})
+        ])
+
+        first = self.handler.get(url, headers={'Authorization': 'Bearer foo'})
+        second = self.handler.get(url, headers={'Authorization': 'Bearer foo'})
+
+        self.assertEqual(first, [1, 2])
+        self.assertEqual(second, [1, 2])
+        self.assertEqual(self.received_headers[1]['If-None-Match'], '"v1"')
+        self.assertEqual(
+            self.received_headers[1]['If-Modified-Since'], 'Wed, 21 Oct 2015 07:28:00 GMT')
+
+    def test__get__changed_response_replaces_cached_one(self):
+        url = self._use_cache()
+        self.responses.extend([
+            (200, {'ETag': '"v1"'}, b'[1]'),
+            (200, {'ETag': '"v2"'}, b'[2]'),
+            (304, {})
+        ])
+
+        results = [self.handler.get(url) for _ in range(3)]
+
+        self.assertEqual(results, [[1], [2], [2]])
+        self.assertEqual(self.received_headers[2]['If-None-Match'], '"v2"')
+
+    def test__get__responses_are_cached_per_credentials(self):
+        url = self._use_cache()
+        self.responses.append((200, {'ETag': '"v1"'}, b'[1]'))
+
+        self.handler.get(url, headers={'Authorization': 'Bearer foo'})
+        self.handler.get(url, headers={'Authorization': 'Bearer bar'})
+
+        self.assertNotIn('If-None-Match', self.received_headers[1])
+
+    def test__get__uncached_endpoints_are_not_revalidated(self):
+        self._use_cache()
+        self.responses.append((200, {'ETag': '"v1"'}, b'[1]'))
+
+        self.handler.get(self.url)
+        self.handler.get(self.url)
+
+        self.assertNotIn('If-None-Match', self.received_headers[1])
+
+    def _use_cache(self):
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+
+        base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.config.endpoints_store = Store('endpoints', {
+            'api_url_base': base_url,
+            'registry_artifact_url_path': '/registry/artifacts'
+        }, dir, False)
+        self.config.settings_store['response_cache_max_bytes'] = 1024 * 1024
+        self.handler.response_cache = ResponseCache(
+            os.path.join(dir, 'response-cache'), self.config.settings_store)
+
+        return base_url + '/registry/artifacts/customer/apk/name'
+
+    def _file(self):
+        fd, file = tempfile.mkstemp()
+        self.addCleanup(os.remove, file)
+        data = os.urandom(3 * 1024 * 1024 + 7)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return file, data
+
+
+class ResumableUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeMasonServer().start()
+        self.addCleanup(self.server.stop)
+
+        fd, self.file = tempfile.mkstemp()
+        self.addCleanup(os.remove, self.file)
+        self.data = os.urandom(3 * 1024 * 1024 + 7)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.md5 = base64.b64encode(hashlib.md5(self.data).digest()).decode('utf-8')
+
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.journal = Store('upload-journal', {'uploads': {}}, journal_dir, False)
+        self.config = MagicMock()
+        self.config.settings_store = {
+            'resumable_upload_attempts': 3,
+            'request_retry_backoff': 0,
+            'request_retry_max_delay': 0
+        }
+
+    def test__put__file_is_uploaded(self):
+        handler = self._handler()
+
+        handler.put(self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                    headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(self.journal['uploads'], {})
+
+    def test__put__dropped_upload_is_resumed_from_committed_offset(self):
+        self.server.upload_drops = [1024 * 1024]
+        handler = self._handler()
+
+        handler.put(self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                    headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(self._upload_ranges(), [
+            'bytes 0-3145734/3145735',
+            'bytes */3145735',
+            'bytes 1048576-3145734/3145735'
+        ])
+
+    def test__put__interrupted_upload_is_resumed_by_next_invocation(self):
+        self.server.upload_drops = [1024 * 1024, 0, 0]
+        with self.assertRaises(ApiError):
+            self._handler().put(
+                self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                headers={'Content-MD5': self.md5})
+
+        self.assertNotEqual(self.journal['uploads'], {})
+        self._handler().put(
+            self.server.signed_url('apk'), self.file, upload_mode='resumable',
+            headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(self._upload_ranges()[-1], 'bytes 1048576-3145734/3145735')
+        self.assertEqual(len(self.server.sessions), 1)
+
+    def test__put__transient_failure_is_resumed(self):
+        handler = self._handler()
+        upload_from = handler._upload_from
+        failures = [MagicMock(status_code=503, headers={})]
+
+        def fail_once(*args):
+            return failures.pop() if failures else upload_from(*args)
+
+        with patch.object(handler, '_upload_from', side_effect=fail_once):
+            handler.put(self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                        headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(self._upload_ranges(), [
+            'bytes */3145735',
+            'bytes 0-3145734/3145735'
+        ])
+        self.assertEqual(len(self.server.sessions), 1)
+        self.assertEqual(self.journal['uploads'], {})
+
+    def test__put__unsaved_journal_does_not_fail_upload(self):
+        handler = self._handler()
+
+        with patch('cli.internal.utils.store.tempfile.mkstemp', side_effect=PermissionError):
+            handler.put(self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                        headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.config.logger.warning.assert_called()
+
+    def test__put__persistent_failure_keeps_session(self):
+        handler = self._handler()
+
+        with patch.object(handler, '_upload_from',
+                          return_value=MagicMock(status_code=429, headers={})):
+            with self.assertRaises(ApiError):
+                handler.put(
+                    self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                headers={'Content-MD5': self.md5})
+
+        self.assertNotEqual(self.journal['uploads'], {})
+
+    def test__put__corrupt_upload_is_rejected(self):
+        handler = self._handler()
+
+        with self.assertRaises(ApiError):
+            handler.put(self.server.signed_url('apk'), self.file, upload_mode='resumable',
+                        headers={'Content-MD5': 'Zm9v'})
+        self.assertNotIn('apk', self.server.objects)
+
+    def _handler(self):
+        with patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': ''}):
+            return RequestHandler(self.config, self.journal)
+
+    def _upload_ranges(self):
+        return [headers['Content-Range'] for (method, path, headers) in self.server.requests
+                if method == 'PUT']
+
+
+class MultipartUploadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeMasonServer().start()
+        self.addCleanup(self.server.stop)
+
+        fd, self.file = tempfile.mkstemp()
+        self.addCleanup(os.remove, self.file)
+        self.data = os.urandom(3 * 1024 * 1024 + 7)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.md5 = base64.b64encode(hashlib.md5(self.data).digest()).decode('utf-8')
+
+        self.config = MagicMock()
+        self.config.executor = ThreadPoolExecutor(4)
+        self.config.settings_store = {
+            'multipart_part_size': 1024 * 1024,
+            'multipart_concurrency': 3
+        }
+        with patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': ''}):
+            self.handler = RequestHandler(self.config)
+
+    def test__put__file_is_uploaded_in_parts(self):
+        self.handler.put(self.server.signed_url('apk'), self.file, upload_mode='multipart',
+                         headers={'Content-MD5': self.md5})
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(len(self._requests('PUT')), 4)
+
+    def test__put__empty_file_is_uploaded(self):
+        fd, file = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, file)
+
+        self.handler.put(self.server.signed_url('empty'), file, upload_mode='multipart')
+
+        self.assertEqual(self.server.objects['empty'], b'')
+
+    def test__put__saturated_executor_does_not_deadlock(self):
+        self.config.executor = ThreadPoolExecutor(1)
+
+        future = self.config.executor.submit(
+            self.handler.put,
+            self.server.signed_url('apk'),
+            self.file,
+            upload_mode='multipart',
+            headers={'Content-MD5': self.md5})
+        future.result(timeout=30)
+
+        self.assertEqual(self.server.objects['apk'], self.data)
+        self.assertEqual(len(self._requests('PUT')), 4)
+
+    def test__put__failed_upload_is_aborted(self):
+        with self.assertRaises(ApiError):
+            self.handler.put(self.server.signed_url('apk'), self.file, upload_mode='multipart',
+                             headers={'Content-MD5': 'Zm9v'})
+
+        self.assertNotIn('apk', self.server.objects)
+        self.assertEqual(len(self._requests('DELETE')), 1)
+        self.assertEqual(self.server.multipart_uploads, {})
+
+    def _requests(self, method):
+        return [path for (m, path, _) in self.server.requests if m == method]
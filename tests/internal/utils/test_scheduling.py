@@ -0,0 +1,116 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from cli.internal.utils.scheduling import UploadScheduler
+from cli.internal.utils.scheduling import get_current_upload
+from cli.internal.utils.scheduling import timed_transfer
+
+
+class UploadSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'upload_priority': 'smallest-first', 'upload_max_bytes_in_flight': 100}
+        self.scheduler = UploadScheduler(self.settings)
+
+        self.small = self._file(10)
+        self.medium = self._file(60)
+        self.large = self._file(150)
+
+    def test__order__smallest_uploads_go_first(self):
+        order = self.scheduler.order([self.large, self.small, self.medium], lambda item: item)
+
+        self.assertEqual(order, [self.small, self.medium, self.large])
+
+    def test__order__largest_uploads_go_first(self):
+        self.settings['upload_priority'] = 'largest-first'
+
+        order = self.scheduler.order([self.small, self.large, self.medium], lambda item: item)
+
+        self.assertEqual(order, [self.large, self.medium, self.small])
+
+    def test__order__fifo_keeps_original_order(self):
+        self.settings['upload_priority'] = 'fifo'
+
+        order = self.scheduler.order([self.large, self.small, self.medium], lambda item: item)
+
+        self.assertEqual(order, [self.large, self.small, self.medium])
+
+    def test__submit__oversized_upload_runs_alone(self):
+        with ThreadPoolExecutor(2) as executor:
+            future = self.scheduler.submit(executor, self.large, get_current_upload)
+            upload = future.result(5)
+
+        self.assertEqual(upload.size, 150)
+        self.assertEqual(self.scheduler.finished, 1)
+
+    def test__submit__bytes_in_flight_are_capped(self):
+        started = []
+        release = threading.Event()
+
+        def upload(binary):
+            started.append(binary)
+            release.wait(5)
+
+        with ThreadPoolExecutor(2) as executor:
+            first = self.scheduler.submit(executor, self.medium, upload, 'first')
+            second = self.scheduler.submit(executor, self.medium, upload, 'second')
+            time.sleep(0.1)
+
+            self.assertEqual(started, ['first'])
+            release.set()
+            first.result(5)
+            second.result(5)
+
+        self.assertEqual(started, ['first', 'second'])
+
+    def test__submit__queued_uploads_dont_occupy_workers(self):
+        release = threading.Event()
+
+        with ThreadPoolExecutor(2) as executor:
+            first = self.scheduler.submit(executor, self.medium, release.wait, 5)
+            second = self.scheduler.submit(executor, self.medium, lambda: None)
+            other = executor.submit(lambda: 'done')
+
+            self.assertEqual(other.result(5), 'done')
+            self.assertFalse(second.done())
+            release.set()
+            first.result(5)
+            second.result(5)
+
+    def test__submit__failures_are_raised_and_release_their_bytes(self):
+        def fail():
+            raise ValueError()
+
+        with ThreadPoolExecutor(2) as executor:
+            failed = self.scheduler.submit(executor, self.medium, fail)
+            next_upload = self.scheduler.submit(executor, self.medium, lambda: 'done')
+
+            self.assertRaises(ValueError, failed.result, 5)
+            self.assertEqual(next_upload.result(5), 'done')
+
+    def test__timed_transfer__only_the_transfer_is_timed(self):
+        def upload():
+            time.sleep(0.1)
+            with timed_transfer():
+                pass
+            return get_current_upload()
+
+        with ThreadPoolExecutor(2) as executor:
+            upload = self.scheduler.submit(executor, self.small, upload).result(5)
+
+        self.assertLess(upload.get_transfer_time(), 0.1)
+        self.assertIsNotNone(upload.finished_at)
+
+    def test__timed_transfer__unscheduled_transfer_is_ignored(self):
+        with timed_transfer():
+            self.assertIsNone(get_current_upload())
+
+    def _file(self, size):
+        fd, file = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'0' * size)
+        self.addCleanup(os.remove, file)
+        return file
@@ -1,17 +1,21 @@
 import os
+import shutil
+import tempfile
 import unittest
+from concurrent.futures.thread import ThreadPoolExecutor
 
 import yaml
-from click.testing import CliRunner
+from mock import patch
 
 from cli.internal.utils.store import Store
+from cli.internal.utils.store import write_atomically
 
 
 class StoreTest(unittest.TestCase):
     def setUp(self):
-        runner = CliRunner()
-        with runner.isolated_filesystem():
-            self.store = Store('test', {'default': True}, os.path.abspath(''), False)
+        dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir)
+        self.store = Store('test', {'default': True}, dir, False)
 
     def test__getset__field_can_be_retrieved(self):
         self.store['key'] = 'value'
@@ -75,6 +79,20 @@ class StoreTest(unittest.TestCase):
 
         self.assertDictEqual(self.store._fields, {'default': False})
 
+    def test__save__no_temporary_files_are_left(self):
+        self.store['key'] = 'value'
+
+        self.store.save()
+        self.store.save()
+
+        self.assertEqual(os.listdir(os.path.dirname(self.store._file)), ['test.yml'])
+
+    def test__try_save__unwritable_dir_is_ignored(self):
+        with patch('cli.internal.utils.store.tempfile.mkstemp', side_effect=PermissionError):
+            self.assertFalse(self.store.try_save())
+
+        self.assertTrue(self.store.try_save())
+
     def test__clear__fields_are_wiped(self):
         self.store['key'] = 'value'
 
@@ -96,3 +114,31 @@ class StoreTest(unittest.TestCase):
                 yaml.safe_dump(data, f)
             else:
                 f.write(data)
+
+
+class WriteAtomicallyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test__write_atomically__concurrent_writers_dont_clobber_each_other(self):
+        path = os.path.join(self.dir, 'file.json')
+        texts = [str(i) * 100000 for i in range(8)]
+
+        with ThreadPoolExecutor(len(texts)) as executor:
+            list(executor.map(lambda text: write_atomically(path, text), texts))
+
+        with open(path) as f:
+            self.assertIn(f.read(), texts)
+        self.assertEqual(os.listdir(self.dir), ['file.json'])
+
+    def test__write_atomically__failed_write_keeps_old_file(self):
+        path = os.path.join(self.dir, 'file.json')
+        write_atomically(path, 'old')
+
+        with patch('cli.internal.utils.store.os.replace', side_effect=OSError):
+            self.assertRaises(OSError, write_atomically, path, 'new')
+
+        with open(path) as f:
+            self.assertEqual(f.read(), 'old')
+        self.assertEqual(os.listdir(self.dir), ['file.json'])
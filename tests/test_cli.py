@@ -2,12 +2,14 @@ import contextlib
 import inspect
 import os
 import shutil
+import tempfile
 import time
 import unittest
 from concurrent.futures.thread import ThreadPoolExecutor
 
 from click.testing import CliRunner
 from mock import MagicMock
+from mock import patch
 
 from cli.config import _manual_atexit_callbacks
 from cli.internal.utils.constants import ENDPOINTS
@@ -18,6 +20,7 @@ from cli.mason import Config
 from cli.mason import cli
 from cli.version import __version__
 from tests import __tests_root__
+from tests.caches import isolate_caches
 
 
 class CliTest(unittest.TestCase):
@@ -33,6 +36,8 @@ class CliTest(unittest.TestCase):
         UPDATE_CHECKER_CACHE['last_update_check_timestamp'] = time.time()
         UPDATE_CHECKER_CACHE.save()
 
+        isolate_caches(self)
+
     def test__version__command_prints_info(self):
         result = self.runner.invoke(cli, ['version'])
 
@@ -509,7 +514,7 @@ class CliTest(unittest.TestCase):
 
     def test__register_config__latest_non_existent_boot_animation_fails(self):
         # noinspection PyUnusedLocal
-        def version_finder(name, type):
+        def version_finder(name, type, fields=None):
             if type == 'apk':
                 return {'version': '12'}
 
@@ -691,8 +696,8 @@ class CliTest(unittest.TestCase):
             -----------------------------------
 
             Continue registration? [Y/n]: 
-            OS Config 'project-id' registered.
             OS Config 'project-id2' registered.
+            OS Config 'project-id' registered.
 
             Build queued for OS Config 'project-id'.
             You can see the status of your build at
@@ -772,8 +777,8 @@ class CliTest(unittest.TestCase):
             -----------------------------------
 
             Continue registration? [Y/n]: 
-            OS Config 'project-id' registered.
             OS Config 'project-id2' registered.
+            OS Config 'project-id' registered.
 
             Build queued for OS Config 'project-id'.
             You can see the status of your build at
@@ -1635,11 +1640,11 @@ class CliTest(unittest.TestCase):
             -----------------------------------
 
             Continue registration? [Y/n]: 
+            Boot animation 'anim-2' registered.
             App 'com.supercilex.test' registered.
             App 'com.supercilex.test' registered.
-            Boot animation 'anim-1' already registered, ignoring.
-            Boot animation 'anim-2' registered.
             Splash screen 'splash-1' registered.
+            Boot animation 'anim-1' already registered, ignoring.
             OS Config 'project-id2' registered.
             OS Config 'project-id3' registered.
 
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures.thread import ThreadPoolExecutor
+
+from click.testing import CliRunner
+from mock import patch
+
+from cli.config import Config
+from cli.config import _manual_atexit_callbacks
+from cli.internal.utils.store import Store
+from cli.mason import cli
+from tests import __tests_root__
+from tests.caches import isolate_caches
+from tests.fake_server import ACCESS_TOKEN
+from tests.fake_server import FakeMasonServer
+from tests.fake_server import ID_TOKEN
+
+
+class EndToEndTest(unittest.TestCase):
+    """
+    Runs the CLI against a local stand-in for the Mason Platform instead of a mocked API.
+    """
+
+    def setUp(self):
+        self.runner = CliRunner()
+        _manual_atexit_callbacks.clear()
+
+        self.server = FakeMasonServer().start()
+        self.addCleanup(self.server.stop)
+
+        self.dir = isolate_caches(self)
+
+        patcher = patch.dict(os.environ, {'_MASON_CLI_TEST_MODE': 'TRUE'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test__register_apk__apk_is_uploaded_and_registered(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+
+        result = self._invoke(['register', 'apk', apk_file])
+
+        self.assertIsNone(result.exception, result.output)
+        with open(apk_file, 'rb') as f:
+            self.assertIn(f.read(), self.server.objects.values())
+        (versions,) = self.server.artifacts.values()
+        self.assertEqual(versions[0]['name'], 'com.supercilex.test')
+
+    def test__register_apk__duplicate_version_is_rejected(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+        self._invoke(['register', 'apk', apk_file])
+
+        result = self._invoke(['register', 'apk', apk_file])
+
+        self.assertIsNotNone(result.exception)
+        self.assertIn('has already been registered', result.output)
+
+    def test__register_apk__transient_failures_are_retried(self):
+        apk_file = os.path.join(__tests_root__, 'res/v1.apk')
+        self.server.fail_next(503, 2, '/upload/')
+
+        with patch('time.sleep'):
+            result = self._invoke(['register', 'apk', apk_file])
+
+        self.assertIsNone(result.exception, result.output)
+        self.assertEqual(len(self.server.artifacts), 1)
+
+    def test__deploy_apk__latest_version_is_deployed(self):
+        self.server.add_artifact('apk', 'com.example.app', 1, createdAt='2020-01-01T00:00:00Z')
+        self.server.add_artifact('apk', 'com.example.app', 2, createdAt='2020-01-02T00:00:00Z')
+
+        result = self._invoke(['deploy', 'apk', 'com.example.app', 'latest', 'group'])
+
+        self.assertIsNone(result.exception, result.output)
+        (deployment,) = self.server.deployments
+        self.assertEqual(deployment['payload']['version'], '2')
+
+    def test__stage__config_is_registered_and_built(self):
+        self.server.add_artifact('apk', 'com.example.app', 1)
+        config_file = os.path.join(__tests_root__, 'res/config.yml')
+
+        result = self._invoke(['stage', '--await', config_file])
+
+        self.assertIsNone(result.exception, result.output)
+        self.assertIn("Build completed for OS Config 'project-id'.", result.output)
+        self.assertEqual(len(self.server.builds), 1)
+
+    def _invoke(self, args):
+        dir = tempfile.mkdtemp(dir=self.dir)
+        auth_store = Store('auth', {}, dir, False)
+        auth_store['id_token'] = ID_TOKEN
+        auth_store['access_token'] = ACCESS_TOKEN
+        endpoints_store = Store('endpoints', {
+            'projects_url_path': '/dashboard/projects',
+            'registry_signed_url_path': '/registry/signedurl',
+            'registry_artifact_url_path': '/registry/artifacts',
+            'builder_url_path': '/tracker/builder',
+            'deploy_url_path': '/deploy',
+            'console_projects_url_path': '/controller/projects'
+        }, dir, False)
+        self.server.configure(endpoints_store)
+
+        config = Config(
+            auth_store=auth_store,
+            endpoints_store=endpoints_store,
+            settings_store=Store('settings', {
+                'upload_mode': 'single',
+                'request_retry_attempts': 4,
+                'request_retry_backoff': 0.5,
+                'request_retry_max_delay': 30,
+                'request_retry_budget': 20,
+                'response_cache_max_bytes': 1024 * 1024,
+                'registry_server_side_sorting': True
+            }, dir, False),
+            customer_store=Store('customer-cache', {'customer': None}, dir, False),
+            executor=ThreadPoolExecutor(4))
+        return self.runner.invoke(cli, args[:1] + ['--assume-yes'] + args[1:], obj=config)